@@ -0,0 +1,169 @@
+import math
+import threading
+import time
+from collections import deque
+from typing import Deque, Iterable, Optional
+
+from metrics import METRICS
+
+
+class Overloaded(Exception):
+    """A request turned away because the server is at capacity, with the seconds the client should wait"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Server busy ({reason}), retry in {retry_after} s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Caps the voice turns a worker runs at once, with a short, bounded queue.
+
+    Each turn holds a request thread for seconds of upstream waiting. Without
+    a cap, a burst takes every thread and the rest wait unseen in the listen
+    backlog until clients time out. Here up to `limit` turns run, up to
+    `queue_size` more wait in arrival order for at most `queue_timeout`
+    seconds, and anything beyond is refused at once with a Retry-After
+    estimated from recent turn durations.
+
+    Queue depth and in-flight turns are exported as gauges and the time
+    spent queued as a histogram, for autoscaling.
+    """
+
+    def __init__(self, limit: int, queue_size: int = 0, queue_timeout: float = 10.0,
+                 initial_turn_seconds: float = 5.0):
+        """
+        Args:
+            limit: Turns run at once; 0 admits everything
+            queue_size: Turns that may wait for a slot
+            queue_timeout: Seconds a turn may wait before being refused
+            initial_turn_seconds: Turn duration assumed for Retry-After until
+                turns have been measured
+        """
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._active = 0
+        self._waiters: Deque[threading.Event] = deque()
+        self._lock = threading.Lock()
+        # Moving average of how long a turn holds its slot
+        self._turn_seconds = initial_turn_seconds
+
+    @property
+    def enabled(self) -> bool:
+        return self.limit > 0
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free for a new arrival"""
+        with self._lock:
+            ahead = len(self._waiters) + 1
+            turn_seconds = self._turn_seconds
+        return max(1, min(60, math.ceil(turn_seconds * ahead / max(self.limit, 1))))
+
+    def _publish(self):
+        METRICS.set_gauge('voice_admission_active', self._active)
+        METRICS.set_gauge('voice_admission_queued', len(self._waiters))
+
+    def _refuse(self, reason: str):
+        METRICS.increment('voice_admission_rejected', reason=reason)
+        raise Overloaded(reason, self.retry_after())
+
+    def acquire(self) -> float:
+        """
+        Take a slot, queueing if none is free.
+
+        Returns:
+            float: Seconds spent waiting
+
+        Raises:
+            Overloaded: If the queue is full or the wait timed out
+        """
+        start = time.perf_counter()
+        with self._lock:
+            if self._active < self.limit and not self._waiters:
+                self._active += 1
+                self._publish()
+                METRICS.observe('voice_admission_wait_seconds', 0.0)
+                return 0.0
+            if len(self._waiters) >= self.queue_size:
+                full = True
+            else:
+                full = False
+                ready = threading.Event()
+                self._waiters.append(ready)
+                self._publish()
+        if full:
+            self._refuse('queue_full')
+
+        admitted = ready.wait(self.queue_timeout)
+        with self._lock:
+            if not admitted and ready.is_set():
+                admitted = True  # Handed a slot as the wait timed out
+            if not admitted:
+                self._waiters.remove(ready)
+                self._publish()
+        waited = time.perf_counter() - start
+        METRICS.observe('voice_admission_wait_seconds', waited)
+        if not admitted:
+            self._refuse('timeout')
+        return waited
+
+    def release(self, held_seconds: Optional[float] = None):
+        """
+        Give back a slot, handing it straight to the longest waiting turn.
+
+        Args:
+            held_seconds: How long the turn held the slot, for Retry-After
+        """
+        with self._lock:
+            if held_seconds is not None:
+                self._turn_seconds += 0.2 * (held_seconds - self._turn_seconds)
+            if self._waiters:
+                # The slot passes to the waiter, so _active is unchanged
+                self._waiters.popleft().set()
+            else:
+                self._active -= 1
+            self._publish()
+
+    def hold(self, iterable: Iterable, started: float) -> 'HeldStream':
+        """Keep the slot taken at `started` until a streamed response body is exhausted or closed"""
+        return HeldStream(self, iterable, started)
+
+
+class HeldStream:
+    """
+    A response body that releases its admission slot when done.
+
+    A class rather than a generator, since the WSGI server's close() on a
+    generator that never started would skip its finally block and leak the slot.
+    """
+
+    def __init__(self, controller: AdmissionController, iterable: Iterable, started: float):
+        self._controller = controller
+        self._iterable = iterable
+        self._iterator = None
+        self._started = started
+        self._released = False
+
+    def __iter__(self):
+        self._iterator = iter(self._iterable)
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._iterator)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        try:
+            close = getattr(self._iterable, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            self._controller.release(time.perf_counter() - self._started)
@@ -1,29 +1,53 @@
-from flask import Flask, request, jsonify, send_file, redirect
+from flask import Flask, Response, g, request, jsonify, make_response, send_file, stream_with_context
 from flask_cors import CORS
-import tempfile
 import os
-import numpy as np
-import wave
+import base64
 import io
-import random
 import json
+import random
+import uuid
+import time
+import functools
+import importlib
+import hmac
+import logging
 from pathlib import Path
-import sys
-import asyncio
 from dotenv import load_dotenv
-import sounddevice as sd
-from magistrado_agentes import MagistrateVoiceAgent
-from openai_voice_handler import OpenAIVoiceHandler
+import magistrado_agentes
+from openai_voice_handler import OpenAIVoiceHandler, TTS_SAMPLE_RATE
+from async_runtime import event_loop
+from audio_store import AudioStore
+from audio_io import decode_wav, encode_wav
+from audio_decode import decode_audio, prewarm_decoders
+from audio_encoding import AUDIO_FORMATS, EXTENSION_FORMATS, available_formats, choose_format, encode_audio
+from resampling import precompute_common_filters
+from vad import detect_speech
+from session_store import SessionStore
+from metrics import METRICS
+from admission import AdmissionController, Overloaded
+from profiling import DEFAULT_INTERVAL, PROFILER
+from log_config import configure_logging
+from tts_cache import TTSCache
+from response_cache import ResponseCache
+from semantic_cache import SemanticCache
+from warmup import Warmup
+from http_cache import PrecompressedPayload
+from image_store import ImageStore, placeholder
+from magistrate_registry import MagistrateRegistry
+from openai_client import get_async_client
 
 BASE_URL = os.getenv('BASE_URL', 'https://rosp-30310-production.up.railway.app')
 # Load environment variables
 load_dotenv()
+configure_logging()
+logger = logging.getLogger('app')
+# Per-request detail, a category of its own so it can be sampled with LOG_SAMPLE_RATES
+request_logger = logging.getLogger('app.request')
 
 # Check for required environment variables
 if not os.getenv('OPENAI_API_KEY'):
-    print("Warning: OPENAI_API_KEY not found in environment variables")
-    print("Please set up your OpenAI API key in a .env file or environment variables")
-    print("Example: OPENAI_API_KEY=your-key-here")
+    logger.warning("OPENAI_API_KEY not found in environment variables. "
+                   "Set it in a .env file or the environment, e.g. OPENAI_API_KEY=your-key-here")
 
 app = Flask(__name__)
 CORS(app, 
@@ -38,14 +62,95 @@ CORS(app,
      max_age=3600  # Cache preflight requests for 1 hour
 )
 
+# Let a fronting nginx/Apache send stored audio files (X-Sendfile/X-Accel-Redirect)
+app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE', '0') == '1'
+
+# Never written to the logs, even at debug level
+REDACTED_HEADERS = {'authorization', 'cookie', 'x-admin-token'}
+
+# Upper bound for a full STT -> LLM -> TTS turn
+VOICE_TURN_TIMEOUT = float(os.getenv('VOICE_TURN_TIMEOUT', '120'))
+
+# Voice turns run at once per worker, and how many more may wait (and for how long)
+# before being refused with 429; keep the sum below GUNICORN_THREADS so other routes
+# still get a thread. VOICE_CONCURRENCY=0 turns admission control off.
+VOICE_ADMISSION = AdmissionController(
+    limit=int(os.getenv('VOICE_CONCURRENCY', '16')),
+    queue_size=int(os.getenv('VOICE_QUEUE_SIZE', '8')),
+    queue_timeout=float(os.getenv('VOICE_QUEUE_TIMEOUT', '10'))
+)
+
+# Samples per audio event on /api/voice-chat/stream (0.5 s at 24 kHz)
+STREAM_FRAME_SAMPLES = 12000
+
 # Create audio directory if it doesn't exist
 AUDIO_DIR = Path(__file__).parent / "audio"
 AUDIO_DIR.mkdir(exist_ok=True)
 
+# Generated audio: UUID names, bounded size and age, recent files kept in memory
+AUDIO_STORE = AudioStore(
+    AUDIO_DIR,
+    max_bytes=int(os.getenv('AUDIO_STORE_MAX_BYTES', str(500 * 1024 * 1024))),
+    max_age=float(os.getenv('AUDIO_STORE_MAX_AGE', '3600')),
+    memory_bytes=int(os.getenv('AUDIO_MEMORY_CACHE_BYTES', str(32 * 1024 * 1024))),
+    sweep_interval=float(os.getenv('AUDIO_STORE_SWEEP_INTERVAL', '60'))
+)
+
+# Encoding of response audio for clients that do not ask for one (wav, opus, webm, mp3)
+AUDIO_RESPONSE_FORMAT = os.getenv('AUDIO_RESPONSE_FORMAT', 'wav')
+
+# Synthesized speech, shared by every handler in this process and, when
+# TTS_CACHE_DIR is set, across workers through the disk tier
+TTS_CACHE = TTSCache(
+    memory_bytes=int(os.getenv('TTS_CACHE_MEMORY_BYTES', str(64 * 1024 * 1024))),
+    directory=os.getenv('TTS_CACHE_DIR') or None,
+    disk_bytes=int(os.getenv('TTS_CACHE_DISK_BYTES', str(512 * 1024 * 1024)))
+)
+
+# Complete answers to repeated questions; RESPONSE_CACHE_MAX_ENTRIES=0 disables it
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '512'))
+RESPONSE_CACHE = ResponseCache(
+    max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+    ttl=float(os.getenv('RESPONSE_CACHE_TTL', '86400')),
+    max_bytes=int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+) if RESPONSE_CACHE_MAX_ENTRIES > 0 else None
+
+# Answers to near-duplicate questions, matched locally on their content words;
+# SEMANTIC_CACHE_CAPACITY=0 disables it
+SEMANTIC_CACHE_CAPACITY = int(os.getenv('SEMANTIC_CACHE_CAPACITY', '512'))
+SEMANTIC_CACHE = SemanticCache(
+    capacity=SEMANTIC_CACHE_CAPACITY,
+    threshold=float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.85'))
+) if SEMANTIC_CACHE_CAPACITY > 0 else None
+
+# Conversation history per client session and magistrate; shared by the workers through
+# SESSION_DIR, which gunicorn.conf.py points at a temporary directory by default
+SESSION_STORE = SessionStore(
+    ttl=float(os.getenv('SESSION_TTL', '1800')),
+    max_bytes=int(os.getenv('SESSION_STORE_MAX_BYTES', str(16 * 1024 * 1024))),
+    max_history_tokens=int(os.getenv('SESSION_MAX_HISTORY_TOKENS', '2000')),
+    directory=os.getenv('SESSION_DIR') or None
+)
+
+# Voice activity detection: trim silence, reject empty turns and cap their length
+VAD_ENABLED = os.getenv('VAD_ENABLED', '1') == '1'
+MAX_UTTERANCE_SECONDS = float(os.getenv('MAX_UTTERANCE_SECONDS', '30'))
+
+# Shared secret for the /api/admin routes, which are disabled without it
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+
+# Fraction of uploads saved to the audio store for debugging (off by default)
+DEBUG_AUDIO_SAMPLE_RATE = float(os.getenv('DEBUG_AUDIO_SAMPLE_RATE', '0'))
+
 # Create images directory for static files
 IMAGES_DIR = Path(__file__).parent / "static" / "images"
 IMAGES_DIR.mkdir(parents=True, exist_ok=True)
 
+# Portraits are held in memory, with resized and WebP variants built during warmup
+IMAGE_STORE = ImageStore(IMAGES_DIR)
+IMAGE_STORE.load()
+IMAGE_MAX_AGE = int(os.getenv('IMAGE_MAX_AGE', str(7 * 24 * 3600)))
+
 # Configuration for different magistrates
 MAGISTRATES = {
     "Gaspar de Espinosa": {
@@ -141,48 +246,80 @@ MAGISTRATES = {
     }
 }
 
+def _create_voice_handler(magistrate_info):
+    """Create a voice handler for a magistrate wired to this process's caches and client"""
+    return OpenAIVoiceHandler(
+        magistrate_info,
+        client=get_async_client(),
+        tts_cache=TTS_CACHE,
+        response_cache=RESPONSE_CACHE,
+        semantic_cache=SEMANTIC_CACHE
+    )
+
+# One shared handler per magistrate, indexed by id
+MAGISTRATE_REGISTRY = MagistrateRegistry(MAGISTRATES, _create_voice_handler)
+
 # Serve static files
 @app.route('/images/<path:filename>')
 def serve_image(filename):
-    """Serve image files"""
-    try:
-        print(f"Requested image: {filename}")
-        
-        # Handle spaces and special characters in filenames
-        image_path = IMAGES_DIR / filename
-        print(f"Looking for image at: {image_path}")
-        
-        if image_path.exists():
-            print(f"Image found, serving: {image_path}")
-            return send_file(str(image_path), mimetype='image/jpeg')
-        else:
-            print(f"Image not found, redirecting to placeholder")
-            # Return a placeholder image or default image
-            placeholder_name = filename.split('.')[0]
-            placeholder_url = f"https://via.placeholder.com/400x500?text={placeholder_name.replace('-', '+').replace(' ', '+')}"
-            print(f"Redirecting to: {placeholder_url}")
-            return redirect(placeholder_url)
-    except Exception as e:
-        print(f"Error serving image: {e}")
-        # Return a generic placeholder in case of errors
-        return redirect("https://via.placeholder.com/400x500?text=Image+Error")
+    """Serve image files, resized with ?w=<width> and as WebP when the client accepts it"""
+    width = request.args.get('w', type=int)
+    accept_webp = request.accept_mimetypes['image/webp'] > 0
+    image = IMAGE_STORE.get(filename, width=width, accept_webp=accept_webp)
+    
+    if image is None:
+        # Generated locally so page loads never depend on an outside service
+        image = placeholder(filename.rsplit('.', 1)[0])
+        max_age = 300
+    else:
+        max_age = IMAGE_MAX_AGE
+    
+    response = Response(image.data, mimetype=image.mimetype)
+    response.set_etag(image.etag)
+    if image.last_modified:
+        response.last_modified = image.last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response.vary.add('Accept')
+    return response.make_conditional(request)
 
-@app.route('/api/magistrates', methods=['GET'])
-def get_magistrates():
-    """Return the list of available magistrates"""
-    return jsonify({
+def _build_magistrates_payload():
+    """Serialize the magistrate list once; MAGISTRATES does not change at runtime"""
+    body = json.dumps({
         "magistrates": [
             {
-                "id": name.lower().replace(" ", "-"),
-                "name": name,
+                "id": slug,
+                "name": info["name"],
                 "title": info["description"],
                 "description": info["description"],
                 "period": info["period"],
                 "imageUrl": f"{BASE_URL}{info['imageUrl']}", # Modified this line
                 "background": info["background"],
                 "talkingPoints": info["talkingPoints"]
-            } for name, info in MAGISTRATES.items()
+            } for slug, info in MAGISTRATE_REGISTRY.items()
         ]
+    }, separators=(',', ':')).encode('utf-8')
+    return PrecompressedPayload(
+        body,
+        mimetype='application/json',
+        max_age=int(os.getenv('MAGISTRATES_MAX_AGE', '300'))
+    )
+
+MAGISTRATES_PAYLOAD = _build_magistrates_payload()
+
+@app.route('/api/magistrates', methods=['GET'])
+def get_magistrates():
+    """Return the list of available magistrates"""
+    return MAGISTRATES_PAYLOAD.response()
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Return hit, miss and eviction counters for this worker's caches"""
+    return jsonify({
+        "tts": TTS_CACHE.stats(),
+        "responses": RESPONSE_CACHE.stats() if RESPONSE_CACHE else None,
+        "semantic": SEMANTIC_CACHE.stats() if SEMANTIC_CACHE else None,
+        "sessions": SESSION_STORE.stats()
     })
 
 @app.route('/api/chat', methods=['POST'])
@@ -193,120 +330,449 @@ def chat():
         "audioUrl": None
     }), 400
 
+def _send_stored_audio(filename, fmt):
+    """Send a file from the audio store with Range, conditional GET and sendfile support"""
+    # Stored files never change, so the unique name doubles as the ETag
+    options = dict(mimetype=fmt.mimetype, download_name=filename, conditional=True,
+                   etag=filename, max_age=int(AUDIO_STORE.max_age))
+    
+    # Recently generated responses are usually still in memory
+    data = AUDIO_STORE.get_cached(filename)
+    if data is not None and not app.config['USE_X_SENDFILE']:
+        response = send_file(io.BytesIO(data), **options)
+    else:
+        file_path = AUDIO_STORE.path(filename)
+        if file_path is None:
+            return jsonify({"error": "Audio file not found"}), 404
+        # A path lets the server use sendfile (or X-Sendfile) instead of copying in Python
+        response = send_file(str(file_path), **options)
+    
+    response.vary.add('Accept')
+    return response
+
 @app.route('/api/audio/<filename>', methods=['GET'])
 def get_audio(filename):
-    """Serve an audio file"""
-    file_path = AUDIO_DIR / filename
-    if not file_path.exists():
-        return jsonify({"error": "Audio file not found"}), 404
+    """
+    Serve an audio file, transcoding it if the client asks for another format.
     
-    # Determine mime type based on file extension
-    if filename.lower().endswith('.mp3'):
-        mimetype = 'audio/mpeg'
-    else:
-        mimetype = 'audio/wav'
+    The format comes from the `format` query parameter (comma-separated, in
+    order of preference) or the Accept header; transcoded copies are kept in
+    the audio store next to the original.
+    """
+    ext = filename.rsplit('.', 1)[-1].lower()
+    source_format = EXTENSION_FORMATS.get(ext, AUDIO_FORMATS['wav'])
+    fmt = choose_format(request.args.get('format'), request.accept_mimetypes, default=source_format.name)
+    if fmt.ext == source_format.ext or source_format.name != 'wav':
+        return _send_stored_audio(filename, source_format)
+    
+    variant = AUDIO_STORE.variant_name(filename, fmt.ext)
+    if AUDIO_STORE.get_cached(variant) is None and AUDIO_STORE.path(variant) is None:
+        source = AUDIO_STORE.read(filename) if AUDIO_STORE.is_valid_name(filename) else None
+        if source is None:
+            return jsonify({"error": "Audio file not found"}), 404
+        try:
+            audio_data, wav_info = decode_wav(source)
+            AUDIO_STORE.save_as(variant, encode_audio(audio_data, wav_info.sample_rate, fmt.name))
+        except Exception as e:
+            logger.error("Error transcoding %s to %s, serving the original: %s", filename, fmt.name, e)
+            return _send_stored_audio(filename, source_format)
     
-    return send_file(str(file_path), mimetype=mimetype)
+    return _send_stored_audio(variant, fmt)
 
-@app.route('/api/voice-chat', methods=['POST'])
-def voice_chat():
-    """Process a voice message and return an audio response"""
-    print("Received voice chat request")
-    print("Request headers:", dict(request.headers))
-    print("Request form data:", dict(request.form))
-    print("Request files:", request.files.keys())
+class VoiceRequestError(Exception):
+    """A voice chat request that cannot be processed, with the HTTP status to return"""
+    def __init__(self, message, status, details=None):
+        super().__init__(message)
+        self.status = status
+        self.details = details or {}
+    
+    def response(self):
+        return jsonify({"error": str(self), **self.details}), self.status
+
+def _upload_buffer(audio_file):
+    """Return the uploaded bytes, without copying them if werkzeug kept the upload in memory"""
+    stream = audio_file.stream
+    if hasattr(stream, 'getbuffer'):
+        return stream.getbuffer()
+    return memoryview(stream.read())
+
+def _read_voice_request():
+    """
+    Validate a voice chat request and decode its audio.
+    
+    The audio is trimmed to the detected speech and capped at
+    MAX_UTTERANCE_SECONDS; uploads without speech are rejected before any
+    API call is made.
+    
+    Returns:
+        tuple: (magistrate_info, audio_data, framerate, speech_ratio)
+        
+    Raises:
+        VoiceRequestError: If the request is invalid
+    """
+    if request_logger.isEnabledFor(logging.DEBUG):
+        request_logger.debug("Voice chat request payload", extra={
+            'headers': {k: v for k, v in request.headers.items() if k.lower() not in REDACTED_HEADERS},
+            'form': dict(request.form),
+            'files': list(request.files.keys())
+        })
     
     if not os.getenv('OPENAI_API_KEY'):
-        return jsonify({"error": "OpenAI API key not configured"}), 503
+        raise VoiceRequestError("OpenAI API key not configured", 503)
     
     if 'audio' not in request.files:
-        return jsonify({"error": "No audio file provided"}), 400
+        raise VoiceRequestError("No audio file provided", 400)
         
     magistrate_name = request.form.get('magistrate')
     if not magistrate_name:
-        return jsonify({"error": "Magistrate name is required"}), 400
+        raise VoiceRequestError("Magistrate name is required", 400)
     
     # Get magistrate info
-    magistrate_info = None
-    for name, info in MAGISTRATES.items():
-        if name.lower().replace(" ", "-") == magistrate_name.lower().replace(" ", "-"):
-            magistrate_info = {**info, 'name': name}
-            break
-    
+    magistrate_info = MAGISTRATE_REGISTRY.info(magistrate_name)
     if not magistrate_info:
-        return jsonify({"error": f"Magistrate '{magistrate_name}' not found"}), 404
+        raise VoiceRequestError(f"Magistrate '{magistrate_name}' not found", 404)
     
+    # Get the audio file from the request
+    audio_file = request.files['audio']
+    content_type = audio_file.content_type
+    
+    # Read the audio data, borrowing the upload's buffer when it is in memory
+    audio_bytes = _upload_buffer(audio_file)
+    
+    # Keep a sample of inputs on disk for debugging
+    if DEBUG_AUDIO_SAMPLE_RATE > 0 and random.random() < DEBUG_AUDIO_SAMPLE_RATE:
+        debug_filename = AUDIO_STORE.save(bytes(audio_bytes), prefix="debug_input", cache=False)
+        request_logger.info("Saved debug input to %s", AUDIO_DIR / debug_filename)
+    
+    # Convert audio bytes to numpy array
+    labels = {'magistrate': magistrate_info['id']}
+    g.magistrate = magistrate_info['id']
     try:
-        # Get the audio file from the request
-        audio_file = request.files['audio']
-        content_type = audio_file.content_type
-        print(f"Received audio file with content type: {content_type}")
-        
-        # Read the audio data
-        audio_bytes = audio_file.read()
-        print(f"Audio data size: {len(audio_bytes)} bytes")
-        
-        # Save the input audio for both debugging and processing
-        debug_audio_path = AUDIO_DIR / f"debug_input_{random.randint(10000, 99999)}.wav"
-        with open(debug_audio_path, 'wb') as f:
-            f.write(audio_bytes)
-        print(f"Saved debug input to {debug_audio_path}")
+        with METRICS.timer('decode', **labels):
+            decoded = decode_audio(audio_bytes)
+        audio_data, framerate = decoded.samples, decoded.sample_rate
+    except Exception as e:
+        request_logger.warning("Error processing audio data: %s", e, extra={'content_type': content_type})
+        raise VoiceRequestError(f"Error processing audio: {str(e)}", 400)
+    
+    if not VAD_ENABLED:
+        request_logger.info("Voice request decoded", extra={
+            'magistrate': magistrate_info['id'], 'content_type': content_type, 'bytes': len(audio_bytes),
+            'codec': decoded.codec, 'sample_rate': framerate, 'channels': decoded.channels, 'frames': len(audio_data)
+        })
+        return magistrate_info, audio_data, framerate, None
+    
+    # Trim silence and cap the length before anything is uploaded
+    with METRICS.timer('vad', **labels):
+        vad = detect_speech(audio_data, framerate, MAX_UTTERANCE_SECONDS)
+    request_logger.info("Voice request decoded", extra={
+        'magistrate': magistrate_info['id'], 'content_type': content_type, 'bytes': len(audio_bytes),
+        'codec': decoded.codec, 'sample_rate': framerate, 'channels': decoded.channels, 'frames': len(audio_data),
+        'speech_ratio': round(vad.speech_ratio, 3), 'kept': [vad.start, vad.end], 'truncated': vad.truncated
+    })
+    if not vad.has_speech:
+        raise VoiceRequestError("No speech detected", 422, {"speechRatio": round(vad.speech_ratio, 3)})
         
-        # Convert audio bytes to numpy array
+    return magistrate_info, vad.audio, framerate, round(vad.speech_ratio, 3)
+
+def _session_id():
+    """The client's session id from the sessionId form field or X-Session-Id header, or a new one"""
+    session_id = request.form.get('sessionId') or request.headers.get('X-Session-Id')
+    return session_id if SESSION_STORE.is_valid_id(session_id) else uuid.uuid4().hex
+
+def _response_format():
+    """Audio format for a voice chat reply, from the `format` form or query parameter"""
+    return choose_format(request.form.get('format') or request.args.get('format'), default=AUDIO_RESPONSE_FORMAT)
+
+def _save_response_audio(audio_data, fmt, magistrate=None):
+    """
+    Write a response to the audio store, encoded as fmt (WAV if encoding fails).
+    
+    Returns:
+        str: Filename of the saved response
+    """
+    data = None
+    if fmt.name != 'wav':
         try:
-            # Use wave module to read the saved WAV file for consistent handling
-            with wave.open(str(debug_audio_path), 'rb') as wf:
-                # Print wave file info for debugging
-                channels = wf.getnchannels()
-                sample_width = wf.getsampwidth()
-                framerate = wf.getframerate()
-                n_frames = wf.getnframes()
-                print(f"WAV info: channels={channels}, sample_width={sample_width}, framerate={framerate}, frames={n_frames}")
-                
-                # Read all frames
-                audio_data = np.frombuffer(wf.readframes(n_frames), dtype=np.int16)
-                
-                # Ensure we have non-zero data
-                if len(audio_data) == 0 or np.max(np.abs(audio_data)) < 10:
-                    print("Warning: Audio data appears to be silent or corrupted")
+            with METRICS.timer('encode', format=fmt.name, magistrate=magistrate):
+                data = encode_audio(audio_data, TTS_SAMPLE_RATE, fmt.name)
         except Exception as e:
-            print(f"Error processing audio data: {e}")
-            return jsonify({"error": f"Error processing audio: {str(e)}"}), 400
-        
-        # Create voice handler for the magistrate
-        print(f"Creating voice handler for magistrate: {magistrate_info['name']}")
-        print(f"Magistrate info: {magistrate_info}")
-        voice_handler = OpenAIVoiceHandler(magistrate_info)
+            logger.error("Error encoding response as %s, saving WAV: %s", fmt.name, e)
+            fmt = AUDIO_FORMATS['wav']
+    if data is None:
+        with METRICS.timer('encode', format='wav', magistrate=magistrate):
+            data = encode_wav(audio_data, TTS_SAMPLE_RATE)
+    with METRICS.timer('write', magistrate=magistrate):
+        return AUDIO_STORE.save(data, prefix="response", ext=fmt.ext)
+
+def _record_voice_request(endpoint, status, start, magistrate=None):
+    """Count a finished voice request and record its total duration"""
+    METRICS.observe('voice_request_seconds', time.perf_counter() - start, endpoint=endpoint, magistrate=magistrate)
+    METRICS.increment('voice_requests', endpoint=endpoint, status=status, magistrate=magistrate)
+
+def _timed_voice_request(view):
+    """
+    Record the duration and status of a voice view; streamed responses record their own.
+    
+    The view only runs once VOICE_ADMISSION grants a slot, which a streamed
+    response holds until its body is finished; requests over capacity get
+    a 429 with Retry-After. Requests picked by an armed profiling run (see
+    profiling.py) are sampled until their response, streamed or not, is complete.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        if VOICE_ADMISSION.enabled:
+            try:
+                VOICE_ADMISSION.acquire()
+            except Overloaded as e:
+                request_logger.warning("Voice request refused: %s", e, extra={'reason': e.reason})
+                _record_voice_request(request.endpoint, 429, start)
+                # Read the unread upload, or the connection cannot be kept alive for the retry
+                while request.stream.read(65536):
+                    pass
+                response = make_response(jsonify({"error": "Server busy, please retry", "retryAfter": e.retry_after}), 429)
+                response.headers['Retry-After'] = str(e.retry_after)
+                return response
+        admitted = time.perf_counter()
+        profiled = None
+        try:
+            profiled = PROFILER.begin_request(request.endpoint)
+            if profiled is None:
+                response = make_response(view(*args, **kwargs))
+            else:
+                response = make_response(profiled.run(view, *args, **kwargs))
+        except BaseException:
+            if profiled is not None:
+                PROFILER.finish_request(profiled, 500)
+            if VOICE_ADMISSION.enabled:
+                VOICE_ADMISSION.release(time.perf_counter() - admitted)
+            raise
+        if response.mimetype != 'text/event-stream':
+            _record_voice_request(request.endpoint, response.status_code, start, g.get('magistrate'))
+            if profiled is not None:
+                PROFILER.finish_request(profiled, response.status_code)
+            if VOICE_ADMISSION.enabled:
+                VOICE_ADMISSION.release(time.perf_counter() - admitted)
+            return response
+        if profiled is not None:
+            response.response = profiled.iterate(response.response, response.status_code)
+        if VOICE_ADMISSION.enabled:
+            response.response = VOICE_ADMISSION.hold(response.response, admitted)
+        return response
+    return wrapper
+
+@app.route('/api/voice-chat', methods=['POST'])
+@_timed_voice_request
+def voice_chat():
+    """Process a voice message and return an audio response"""
+    try:
+        magistrate_info, audio_data, framerate, speech_ratio = _read_voice_request()
+    except VoiceRequestError as e:
+        return e.response()
+    
+    try:
+        # Use the magistrate's shared voice handler
+        request_logger.debug("Magistrate info", extra={'magistrate_info': magistrate_info})
+        voice_handler = MAGISTRATE_REGISTRY.handler(magistrate_info['id'])
+        session_id = _session_id()
+        history = SESSION_STORE.history(session_id, magistrate_info['id'])
         
-        # Process the audio
-        result = asyncio.run(voice_handler.process_audio(audio_data, framerate))
+        # Process the audio on the shared event loop
+        result = event_loop.run(
+            voice_handler.process_audio(audio_data, framerate, history),
+            timeout=VOICE_TURN_TIMEOUT
+        )
         
         if 'error' in result:
             return jsonify({"error": result['error']}), 500
             
+        SESSION_STORE.append(session_id, magistrate_info['id'], result['transcribed_text'], result['response_text'])
+            
         # Save the response audio
-        response_filename = f"response_{random.randint(10000, 99999)}.wav"
-        response_path = AUDIO_DIR / response_filename
-        
-        with wave.open(str(response_path), 'wb') as wf:
-            wf.setnchannels(1)
-            wf.setsampwidth(2)
-            wf.setframerate(24000)
-            wf.writeframes(result['audio_data'].tobytes())
+        response_filename = _save_response_audio(result['audio_data'], _response_format(), magistrate_info['id'])
             
         return jsonify({
             "audioUrl": f"{BASE_URL}/api/audio/{response_filename}",
             "transcribedText": result['transcribed_text'],
             "responseText": result['response_text'],
-            "text": result['response_text']  # For backward compatibility
+            "text": result['response_text'],  # For backward compatibility
+            "speechRatio": speech_ratio,
+            "sessionId": session_id
         })
         
     except Exception as e:
-        print(f"Error processing voice chat: {e}")
+        logger.exception("Error processing voice chat: %s", e)
         return jsonify({"error": str(e)}), 500
 
+def _sse_event(event, data):
+    """Format a server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/api/voice-chat/stream', methods=['POST'])
+@_timed_voice_request
+def voice_chat_stream():
+    """
+    Process a voice message and stream the response as server-sent events.
+    
+    Events, in order:
+        transcript: {"text", "speechRatio", "sessionId"} once the question has been transcribed
+        audio: {"index", "text", "sampleRate", "encoding", "audio"} frames of base64
+            16-bit little-endian mono PCM, sent as each sentence is synthesized
+        done: {"audioUrl", "transcribedText", "responseText"} with the full reply
+        error: {"error"} if the turn failed
+    
+    Invalid uploads and a busy server are refused with a 4xx status before the
+    stream starts. Once it has started the status is 200, so a failed turn is
+    reported only by the error event, unlike /api/voice-chat, which returns 500;
+    clients must watch for it and treat a stream that ends without done as failed.
+    """
+    try:
+        magistrate_info, audio_data, framerate, speech_ratio = _read_voice_request()
+    except VoiceRequestError as e:
+        return e.response()
+    
+    voice_handler = MAGISTRATE_REGISTRY.handler(magistrate_info['id'])
+    response_format = _response_format()
+    session_id = _session_id()
+    history = SESSION_STORE.history(session_id, magistrate_info['id'])
+    
+    start = time.perf_counter()
+    
+    def generate():
+        index = 0
+        status = 500
+        try:
+            for event in event_loop.iterate(
+                voice_handler.stream_audio(audio_data, framerate, history),
+                timeout=VOICE_TURN_TIMEOUT
+            ):
+                if event['type'] == 'transcript':
+                    yield _sse_event('transcript', {
+                        "text": event['text'],
+                        "speechRatio": speech_ratio,
+                        "sessionId": session_id
+                    })
+                elif event['type'] == 'sentence':
+                    pcm = event['audio_data']
+                    # Split long sentences so playback can start on the first frame
+                    for offset in range(0, len(pcm), STREAM_FRAME_SAMPLES):
+                        frame = pcm[offset:offset + STREAM_FRAME_SAMPLES]
+                        yield _sse_event('audio', {
+                            "index": index,
+                            "text": event['text'] if offset == 0 else "",
+                            "sampleRate": TTS_SAMPLE_RATE,
+                            "encoding": "pcm_s16le",
+                            "audio": base64.b64encode(frame.tobytes()).decode('ascii')
+                        })
+                        index += 1
+                elif event['type'] == 'done':
+                    SESSION_STORE.append(session_id, magistrate_info['id'],
+                                         event['transcribed_text'], event['response_text'])
+                    response_filename = _save_response_audio(event['audio_data'], response_format,
+                                                             magistrate_info['id'])
+                    yield _sse_event('done', {
+                        "audioUrl": f"{BASE_URL}/api/audio/{response_filename}",
+                        "transcribedText": event['transcribed_text'],
+                        "responseText": event['response_text']
+                    })
+                    status = 200
+                elif event['type'] == 'error':
+                    yield _sse_event('error', {"error": event['error']})
+        except Exception as e:
+            logger.exception("Error streaming voice chat: %s", e)
+            yield _sse_event('error', {"error": str(e)})
+        finally:
+            _record_voice_request('voice_chat_stream', status, start, magistrate_info['id'])
+            
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Keep proxies from buffering the stream
+        }
+    )
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Per-stage latency histograms and counters of all workers, for Prometheus"""
+    return Response(METRICS.render(), mimetype='text/plain; version=0.0.4')
+
+def _admin_only(view):
+    """Require the X-Admin-Token header to match ADMIN_TOKEN; without ADMIN_TOKEN the route does not exist"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({"error": "Not found"}), 404
+        if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN):
+            return jsonify({"error": "Forbidden"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+@app.route('/api/admin/profile', methods=['POST'])
+@_admin_only
+def start_profile():
+    """
+    Profile the next voice requests of every worker.
+    
+    JSON or form fields:
+        requests: Number of requests each worker samples (default 10)
+        mode: 'cpu', 'memory' or 'both' (default)
+        intervalMs: Milliseconds between stack samples (default 5)
+    """
+    params = request.get_json(silent=True) or request.form
+    try:
+        run = PROFILER.arm(
+            requests=int(params.get('requests', 10)),
+            mode=params.get('mode', 'both'),
+            interval=float(params.get('intervalMs', DEFAULT_INTERVAL * 1000)) / 1000
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(run), 202
+
+@app.route('/api/admin/profile', methods=['GET'])
+@_admin_only
+def profile_status():
+    """Per-stage timings, CPU samples and allocation peaks of a profiling run (?id=, default the latest)"""
+    return jsonify(PROFILER.status(request.args.get('id')))
+
+@app.route('/api/admin/profile/stacks', methods=['GET'])
+@_admin_only
+def profile_stacks():
+    """Collapsed stacks of a profiling run, for flamegraph.pl or speedscope"""
+    return Response(PROFILER.collapsed_stacks(request.args.get('id')), mimetype='text/plain')
+
+@app.route('/api/admin/profile', methods=['DELETE'])
+@_admin_only
+def cancel_profile():
+    """Stop sampling new requests"""
+    PROFILER.cancel()
+    return jsonify(PROFILER.status())
+
+@app.route('/healthz/live', methods=['GET'])
+def liveness():
+    """The process is up and serving requests"""
+    return jsonify({"status": "ok"})
+
+@app.route('/healthz/ready', methods=['GET'])
+def readiness():
+    """Report whether this worker has warmed up; 503 while warming up or if a required step failed"""
+    status = WARMUP.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/api/intro/<magistrate_id>', methods=['GET'])
+def get_intro(magistrate_id):
+    """Serve a magistrate's pre-rendered spoken introduction"""
+    audio_data = WARMUP.clips.get(f"intro:{magistrate_id}")
+    if audio_data is None:
+        return jsonify({"error": "Introduction not available"}), 404
+    return send_file(io.BytesIO(encode_wav(audio_data, TTS_SAMPLE_RATE)), mimetype='audio/wav')
+
 # Also add a specific handler for OPTIONS requests
 @app.route('/api/voice-chat', methods=['OPTIONS'])
+@app.route('/api/voice-chat/stream', methods=['OPTIONS'])
 def handle_options():
     response = app.make_default_options_response()
     response.headers['Access-Control-Allow-Origin'] = 'https://jgranda1999.github.io'
@@ -314,5 +780,60 @@ def handle_options():
     response.headers['Access-Control-Allow-Headers'] = '*'
     return response
 
+def _intro_text(name, info):
+    """The spoken introduction for a magistrate, built from their talking points"""
+    return " ".join(f"Saludos, soy {name}. {info['talkingPoints']}".split())
+
+def _synthesize_clip(text):
+    """Synthesize a fixed clip through the TTS cache, failing loudly"""
+    if not os.getenv('OPENAI_API_KEY'):
+        raise RuntimeError("OPENAI_API_KEY not configured")
+    slug, _ = next(MAGISTRATE_REGISTRY.items())
+    voice_handler = MAGISTRATE_REGISTRY.handler(slug)
+    audio_data = event_loop.run(voice_handler.synthesize_speech(text), timeout=VOICE_TURN_TIMEOUT)
+    if audio_data is None:
+        raise RuntimeError(f"Could not synthesize: {text[:40]}")
+    return audio_data
+
+def _warm_imports():
+    """Import modules that are otherwise loaded lazily on the first request, build the resampling filters, probe the audio encoders and start the ffmpeg decoders"""
+    importlib.import_module('soundfile')
+    precompute_common_filters()
+    available_formats()
+    prewarm_decoders()
+
+def _warm_upstream():
+    """Open a connection to the OpenAI API ahead of the first request"""
+    if not os.getenv('OPENAI_API_KEY'):
+        raise RuntimeError("OPENAI_API_KEY not configured")
+    client = get_async_client()
+    
+    async def list_models():
+        return await client.models.list()
+        
+    event_loop.run(list_models(), timeout=30)
+
+def _warm_fallback():
+    """Pre-render the apology used when the agent pipeline produces no audio"""
+    audio_data = _synthesize_clip(magistrado_agentes.FALLBACK_TEXT)
+    WARMUP.clips['fallback'] = audio_data
+    magistrado_agentes.set_fallback_audio(audio_data)
+
+def _warm_intros():
+    """Pre-render each magistrate's introduction"""
+    for slug, info in MAGISTRATE_REGISTRY.items():
+        WARMUP.clips[f"intro:{slug}"] = _synthesize_clip(_intro_text(info['name'], info))
+
+# Warm caches and connections in the background; /healthz/ready reports 503 until
+# every required step has succeeded (name, step, required)
+WARMUP = Warmup(retries=int(os.getenv('WARMUP_RETRIES', '3')))
+WARMUP.start([
+    ('imports', _warm_imports, True),
+    ('images', IMAGE_STORE.build_variants, False),
+    ('upstream', _warm_upstream, True),
+    ('fallback_audio', _warm_fallback, True),
+    ('intros', _warm_intros, False),
+])
+
 if __name__ == '__main__':
     app.run(debug=True, port=5001)
\ No newline at end of file
@@ -0,0 +1,121 @@
+import asyncio
+import concurrent.futures
+import os
+import queue
+import threading
+from typing import Any, AsyncIterator, Awaitable, Iterator, Optional
+
+# Marks the end of a bridged async iterator
+_DONE = object()
+
+
+class BackgroundEventLoop:
+    """
+    A long-lived asyncio event loop running on a daemon thread.
+
+    Flask request threads hand coroutines to this loop instead of calling
+    asyncio.run() per request, so every in-flight voice turn in a worker
+    process shares one loop and the async OpenAI client's connection pool.
+    """
+
+    def __init__(self, name: str = "voice-event-loop"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """Return the running loop, starting it on first use in this process."""
+        # A loop inherited across fork() has no thread behind it, so each
+        # gunicorn worker starts its own.
+        if self._loop is None or self._pid != os.getpid():
+            with self._lock:
+                if self._loop is None or self._pid != os.getpid():
+                    self._start()
+        return self._loop
+
+    def _start(self):
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.call_soon(started.set)
+            loop.run_forever()
+
+        thread = threading.Thread(target=run, name=self.name, daemon=True)
+        thread.start()
+        started.wait()
+
+        self._loop = loop
+        self._thread = thread
+        self._pid = os.getpid()
+
+    def run(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """
+        Run a coroutine on the background loop and block until it finishes.
+
+        Args:
+            coro: Coroutine to schedule
+            timeout: Seconds to wait before cancelling the coroutine
+
+        Returns:
+            The coroutine's result
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def iterate(self, agen: AsyncIterator[Any], timeout: Optional[float] = None) -> Iterator[Any]:
+        """
+        Consume an async iterator on the background loop from synchronous code.
+
+        Items are handed over as soon as they are produced, which lets a Flask
+        streaming response forward them while the rest is still being computed.
+        Closing the returned generator (e.g. the client disconnected) cancels
+        the async side.
+
+        Args:
+            agen: Async iterator to drain
+            timeout: Seconds to wait for each item
+
+        Yields:
+            Items produced by agen
+        """
+        items: queue.Queue = queue.Queue()
+
+        async def pump():
+            try:
+                async for item in agen:
+                    items.put((item, None))
+            except BaseException as e:
+                items.put((_DONE, e))
+                raise
+            finally:
+                if hasattr(agen, 'aclose'):
+                    await agen.aclose()
+            items.put((_DONE, None))
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while True:
+                try:
+                    item, error = items.get(timeout=timeout)
+                except queue.Empty:
+                    raise concurrent.futures.TimeoutError()
+                if item is _DONE:
+                    if error is not None and not isinstance(error, asyncio.CancelledError):
+                        raise error
+                    return
+                yield item
+        finally:
+            future.cancel()
+
+
+# One loop per worker process
+event_loop = BackgroundEventLoop()
@@ -0,0 +1,253 @@
+import atexit
+import io
+import logging
+import os
+import subprocess
+import threading
+from typing import Dict, List, NamedTuple, Optional, Union
+
+import numpy as np
+
+from audio_encoding import FFMPEG, FFMPEG_TIMEOUT
+from audio_io import decode_wav, is_wav
+from resampling import resample
+from stt_upload import to_mono
+
+try:
+    import soundfile as sf
+except (ImportError, OSError):  # Optional, Ogg, FLAC and MP3 go through ffmpeg without it
+    sf = None
+
+logger = logging.getLogger(__name__)
+
+# Rate ffmpeg decodes to when the caller does not ask for one; the transcription rate
+DEFAULT_DECODE_RATE = 16000
+# Warm ffmpeg processes kept per output rate; 0 starts one per upload
+FFMPEG_POOL_SIZE = int(os.getenv('FFMPEG_POOL_SIZE', '2'))
+
+# Leading bytes of the containers soundfile can decode in-process
+_SOUNDFILE_MAGIC = {b'OggS': 'ogg', b'fLaC': 'flac', b'ID3': 'mp3', b'\xff\xfb': 'mp3', b'\xff\xf3': 'mp3'}
+_EBML_MAGIC = b'\x1a\x45\xdf\xa3'  # WebM / Matroska
+
+
+class AudioDecodeError(ValueError):
+    """An upload that is not audio, or not in a format this server can decode"""
+
+
+class DecodedAudio(NamedTuple):
+    """An upload decoded to mono int16"""
+    samples: np.ndarray
+    sample_rate: int
+    channels: int  # Of the upload, before downmixing
+    codec: str
+
+
+def sniff_format(data: Union[bytes, memoryview]) -> Optional[str]:
+    """Guess the container of an upload from its first bytes: 'wav', 'webm', 'ogg', 'flac', 'mp3' or None"""
+    head = bytes(data[:12])
+    if is_wav(head):
+        return 'wav'
+    if head.startswith(_EBML_MAGIC):
+        return 'webm'
+    for magic, name in _SOUNDFILE_MAGIC.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+class FfmpegDecoderPool:
+    """
+    ffmpeg processes started ahead of time, each decoding one upload.
+
+    An upload is written to a waiting process's stdin and raw mono s16le
+    PCM is read back from its stdout: no temporary files and no container
+    header to parse on the way out. Starting ffmpeg costs tens of
+    milliseconds, so the process used by a request is replaced in the
+    background rather than started on the request path.
+    """
+
+    def __init__(self, sample_rate: int, size: int = FFMPEG_POOL_SIZE, timeout: float = FFMPEG_TIMEOUT):
+        """
+        Args:
+            sample_rate: Rate ffmpeg resamples the decoded audio to
+            size: Number of idle processes to keep
+            timeout: Seconds one decode may take
+        """
+        self.sample_rate = sample_rate
+        self.size = size
+        self.timeout = timeout
+        self._idle: List[subprocess.Popen] = []
+        self._starting = 0
+        self._refilling = False  # A background fill is running
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _command(self) -> List[str]:
+        return [FFMPEG, '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0',
+                '-f', 's16le', '-acodec', 'pcm_s16le', '-ac', '1', '-ar', str(self.sample_rate), 'pipe:1']
+
+    def _spawn(self) -> subprocess.Popen:
+        return subprocess.Popen(self._command(), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+
+    def _check_fork(self):
+        """Processes started before a fork belong to the parent"""
+        if self._pid != os.getpid():
+            self._idle = []
+            self._starting = 0
+            self._refilling = False
+            self._pid = os.getpid()
+
+    def fill(self):
+        """Start idle processes until the pool is full"""
+        while True:
+            with self._lock:
+                self._check_fork()
+                if len(self._idle) + self._starting >= self.size:
+                    self._refilling = False
+                    return
+                self._starting += 1
+            try:
+                process = self._spawn()
+            except OSError as e:
+                logger.warning("Error starting ffmpeg: %s", e)
+                with self._lock:
+                    self._starting -= 1
+                    self._refilling = False
+                return
+            with self._lock:
+                self._starting -= 1
+                self._idle.append(process)
+
+    def _take(self) -> subprocess.Popen:
+        process = None
+        with self._lock:
+            self._check_fork()
+            while self._idle and process is None:
+                candidate = self._idle.pop()
+                if candidate.poll() is None:
+                    process = candidate
+            # One background fill at a time; a running one tops up whatever is taken meanwhile
+            refill = not self._refilling and len(self._idle) + self._starting < self.size
+            if refill:
+                self._refilling = True
+        if refill:
+            threading.Thread(target=self.fill, name="ffmpeg-pool", daemon=True).start()
+        return process or self._spawn()
+
+    def decode(self, data: Union[bytes, memoryview]) -> np.ndarray:
+        """
+        Decode an upload in any format ffmpeg understands.
+
+        Returns:
+            numpy.ndarray: Mono int16 samples at sample_rate
+
+        Raises:
+            AudioDecodeError: If ffmpeg fails or times out
+        """
+        process = self._take()
+        try:
+            stdout, stderr = process.communicate(data, timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            raise AudioDecodeError(f"ffmpeg did not finish decoding within {self.timeout} s")
+        if process.returncode != 0:
+            message = stderr.decode('utf-8', errors='replace').strip().splitlines()
+            raise AudioDecodeError(f"ffmpeg could not decode the audio: {message[-1] if message else process.returncode}")
+        # A truncated upload can end mid-sample
+        return np.frombuffer(stdout, dtype='<i2', count=len(stdout) // 2)
+
+    def close(self):
+        """Stop the idle processes"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            owned = self._pid == os.getpid()
+        for process in idle:
+            if owned:
+                process.kill()
+                process.wait()
+
+
+_pools: Dict[int, FfmpegDecoderPool] = {}
+_pools_lock = threading.Lock()
+
+
+def ffmpeg_pool(sample_rate: int) -> FfmpegDecoderPool:
+    """The shared decoder pool for an output rate"""
+    pool = _pools.get(sample_rate)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(sample_rate)
+            if pool is None:
+                pool = _pools[sample_rate] = FfmpegDecoderPool(sample_rate)
+    return pool
+
+
+@atexit.register
+def _close_pools():
+    for pool in list(_pools.values()):
+        pool.close()
+
+
+def prewarm_decoders(sample_rate: int = DEFAULT_DECODE_RATE):
+    """Start the ffmpeg pool for uploads ahead of the first non-WAV request"""
+    if FFMPEG and FFMPEG_POOL_SIZE > 0:
+        ffmpeg_pool(sample_rate).fill()
+
+
+def _decode_soundfile(data: Union[bytes, memoryview]) -> DecodedAudio:
+    samples, sample_rate = sf.read(io.BytesIO(data), dtype='int16', always_2d=True)
+    return DecodedAudio(to_mono(samples), sample_rate, samples.shape[1], 'soundfile')
+
+
+def decode_audio(data: Union[bytes, memoryview], sample_rate: Optional[int] = None) -> DecodedAudio:
+    """
+    Decode an uploaded recording to mono int16 samples.
+
+    WAV is parsed in-process with no copy (see audio_io). Ogg, FLAC and MP3 are
+    decoded in-process by soundfile when libsndfile supports them, and
+    everything else, including the WebM/Opus browsers record, is piped
+    through a warm ffmpeg process.
+
+    Args:
+        data: The complete upload
+        sample_rate: Rate to return the audio at; by default WAV and
+            soundfile keep the upload's rate and ffmpeg decodes to
+            DEFAULT_DECODE_RATE
+
+    Returns:
+        DecodedAudio: The samples, their rate, the upload's channel count
+            and the decoder used
+
+    Raises:
+        AudioDecodeError: If the upload cannot be decoded
+    """
+    if not len(data):
+        raise AudioDecodeError("Empty audio upload")
+    container = sniff_format(data)
+
+    decoded = None
+    if container == 'wav':
+        try:
+            samples, info = decode_wav(data)
+        except ValueError as e:
+            raise AudioDecodeError(str(e))
+        decoded = DecodedAudio(samples, info.sample_rate, info.channels, 'wav')
+    elif container in ('ogg', 'flac', 'mp3') and sf is not None:
+        try:
+            decoded = _decode_soundfile(data)
+        except Exception as e:  # e.g. a codec this libsndfile was built without
+            logger.debug("soundfile could not decode %s upload, trying ffmpeg: %s", container, e)
+
+    if decoded is None:
+        if not FFMPEG:
+            raise AudioDecodeError(f"Decoding {container or 'this'} audio requires ffmpeg")
+        rate = sample_rate or DEFAULT_DECODE_RATE
+        # ffmpeg downmixes, so the upload's channel count is not known
+        return DecodedAudio(ffmpeg_pool(rate).decode(data), rate, 1, 'ffmpeg')
+
+    if sample_rate and decoded.sample_rate != sample_rate:
+        decoded = decoded._replace(samples=resample(decoded.samples, decoded.sample_rate, sample_rate),
+                                   sample_rate=sample_rate)
+    return decoded
@@ -0,0 +1,153 @@
+import io
+import logging
+import shutil
+import subprocess
+from functools import lru_cache
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+
+from audio_io import encode_wav
+
+try:
+    import soundfile as sf
+except (ImportError, OSError):  # Optional, ffmpeg or WAV are used without it
+    sf = None
+
+logger = logging.getLogger(__name__)
+
+FFMPEG = shutil.which('ffmpeg')
+# Upper bound on one ffmpeg encode, in seconds
+FFMPEG_TIMEOUT = 30
+
+
+class AudioFormat(NamedTuple):
+    """A response audio encoding and the ways it can be produced"""
+    name: str
+    mimetype: str
+    ext: str
+    sf_format: Optional[str]         # soundfile container, if libsndfile can write it
+    sf_subtype: Optional[str]
+    ffmpeg_args: Optional[List[str]]  # ffmpeg output options, if ffmpeg can write it
+
+
+AUDIO_FORMATS = {
+    'wav': AudioFormat('wav', 'audio/wav', 'wav', None, None, None),
+    'opus': AudioFormat('opus', 'audio/ogg', 'ogg', 'OGG', 'OPUS',
+                        ['-c:a', 'libopus', '-b:a', '32k', '-application', 'voip', '-f', 'ogg']),
+    'webm': AudioFormat('webm', 'audio/webm', 'webm', None, None,
+                        ['-c:a', 'libopus', '-b:a', '32k', '-application', 'voip', '-f', 'webm']),
+    'mp3': AudioFormat('mp3', 'audio/mpeg', 'mp3', 'MP3', 'MPEG_LAYER_III',
+                       ['-c:a', 'libmp3lame', '-b:a', '48k', '-f', 'mp3']),
+}
+EXTENSION_FORMATS = {fmt.ext: fmt for fmt in AUDIO_FORMATS.values()}
+# Other names clients use for the same media types
+MIMETYPE_ALIASES = {'audio/wave': 'wav', 'audio/x-wav': 'wav', 'audio/mp3': 'mp3', 'audio/opus': 'opus'}
+
+
+def _encode_soundfile(audio_data: np.ndarray, sample_rate: int, fmt: AudioFormat) -> bytes:
+    buffer = io.BytesIO()
+    sf.write(buffer, audio_data, sample_rate, format=fmt.sf_format, subtype=fmt.sf_subtype)
+    return buffer.getvalue()
+
+
+def _encode_ffmpeg(audio_data: np.ndarray, sample_rate: int, fmt: AudioFormat) -> bytes:
+    # Raw PCM in on stdin, the encoded file out on stdout, no temporary files
+    command = [FFMPEG, '-hide_banner', '-loglevel', 'error',
+               '-f', 's16le', '-ar', str(sample_rate), '-ac', '1', '-i', 'pipe:0',
+               *fmt.ffmpeg_args, 'pipe:1']
+    pcm = np.ascontiguousarray(audio_data, dtype='<i2')
+    result = subprocess.run(command, input=memoryview(pcm).cast('B'), capture_output=True,
+                            timeout=FFMPEG_TIMEOUT, check=True)
+    return result.stdout
+
+
+def _encoder(fmt: AudioFormat):
+    """Return the function that can write fmt here, or None"""
+    if fmt.name == 'wav':
+        return lambda audio_data, sample_rate, _: encode_wav(audio_data, sample_rate)
+    if sf is not None and fmt.sf_format and fmt.sf_subtype in sf.available_subtypes(fmt.sf_format):
+        return _encode_soundfile
+    if FFMPEG and fmt.ffmpeg_args:
+        return _encode_ffmpeg
+    return None
+
+
+@lru_cache(maxsize=None)
+def available_formats() -> List[str]:
+    """
+    Names of the formats this process can encode.
+
+    Each candidate is checked by encoding a short silence, since libsndfile
+    can list a subtype it was built without a working encoder for.
+    """
+    silence = np.zeros(2400, dtype=np.int16)
+    names = []
+    for fmt in AUDIO_FORMATS.values():
+        encoder = _encoder(fmt)
+        if encoder is None:
+            continue
+        try:
+            if encoder(silence, 24000, fmt):
+                names.append(fmt.name)
+        except Exception as e:
+            logger.info("Audio format %s is not available: %s", fmt.name, e)
+    return names
+
+
+def encode_audio(audio_data: np.ndarray, sample_rate: int, name: str) -> bytes:
+    """
+    Encode mono int16 audio in a response format.
+
+    Args:
+        audio_data: int16 samples
+        sample_rate: Sample rate in Hz
+        name: Format name from AUDIO_FORMATS
+
+    Returns:
+        bytes: The encoded file
+
+    Raises:
+        ValueError: If the format cannot be encoded in this process
+    """
+    if name not in available_formats():
+        raise ValueError(f"Audio format not available: {name}")
+    fmt = AUDIO_FORMATS[name]
+    return _encoder(fmt)(audio_data, sample_rate, fmt)
+
+
+def choose_format(requested: Optional[str] = None, accept=None, default: str = 'wav') -> AudioFormat:
+    """
+    Pick the response format for a client.
+
+    Args:
+        requested: Comma-separated format names in order of preference,
+            from a `format` query or form parameter
+        accept: The request's parsed Accept header (request.accept_mimetypes);
+            wildcards are ignored so clients only get a compressed format
+            they named
+        default: Format to use when neither names an available format
+
+    Returns:
+        AudioFormat: The first available format the client asked for, or the default
+    """
+    available = available_formats()
+    if requested:
+        for name in requested.lower().split(','):
+            name = name.strip()
+            if name in available:
+                return AUDIO_FORMATS[name]
+
+    if accept:
+        # werkzeug keeps the values sorted by quality, best first
+        for mimetype, quality in accept:
+            if quality <= 0 or '*' in mimetype:
+                continue
+            mimetype = mimetype.split(';')[0].strip().lower()
+            name = MIMETYPE_ALIASES.get(mimetype) or next(
+                (fmt.name for fmt in AUDIO_FORMATS.values() if fmt.mimetype == mimetype), None
+            )
+            if name in available:
+                return AUDIO_FORMATS[name]
+
+    return AUDIO_FORMATS[default if default in available else 'wav']
@@ -0,0 +1,209 @@
+import struct
+from typing import NamedTuple, Union
+
+import numpy as np
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class WavInfo(NamedTuple):
+    """Format of a parsed WAV file"""
+    sample_rate: int
+    channels: int
+    sample_width: int
+    audio_format: int
+
+
+def is_wav(data: Union[bytes, memoryview]) -> bool:
+    """Check for a RIFF/WAVE header"""
+    return len(data) >= 12 and bytes(data[0:4]) == b'RIFF' and bytes(data[8:12]) == b'WAVE'
+
+
+def parse_wav(data: Union[bytes, memoryview]):
+    """
+    Locate the sample data in a WAV file without copying it.
+
+    Walks the RIFF chunks, so files with LIST, fact or other extra chunks
+    before the data chunk are handled.
+
+    Args:
+        data: The complete WAV file
+
+    Returns:
+        tuple: (WavInfo, memoryview over the raw sample bytes)
+
+    Raises:
+        ValueError: If the data is not a WAV file this parser understands
+    """
+    view = memoryview(data).cast('B')
+    if not is_wav(view):
+        raise ValueError("Not a RIFF/WAVE file")
+
+    info = None
+    pos = 12
+    while pos + 8 <= len(view):
+        chunk_id = bytes(view[pos:pos + 4])
+        chunk_size = struct.unpack_from('<I', view, pos + 4)[0]
+        body = pos + 8
+
+        if chunk_id == b'fmt ':
+            audio_format, channels, sample_rate = struct.unpack_from('<HHI', view, body)
+            bits = struct.unpack_from('<H', view, body + 14)[0]
+            if audio_format == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 40:
+                # The real format code is the first two bytes of the sub-format GUID
+                audio_format = struct.unpack_from('<H', view, body + 24)[0]
+            info = WavInfo(sample_rate, channels, bits // 8, audio_format)
+        elif chunk_id == b'data':
+            if info is None or info.channels == 0 or info.sample_width == 0:
+                raise ValueError("WAV data chunk without a valid fmt chunk")
+            # Streaming writers leave the size unset, so clamp to what we have
+            end = min(body + chunk_size, len(view))
+            frame_size = info.channels * info.sample_width
+            end -= (end - body) % frame_size
+            return info, view[body:end]
+
+        # Chunks are padded to an even number of bytes
+        pos = body + chunk_size + (chunk_size & 1)
+
+    raise ValueError("WAV file has no data chunk")
+
+
+def to_mono_int16(samples: memoryview, info: WavInfo) -> np.ndarray:
+    """
+    Convert raw WAV samples to mono int16.
+
+    16-bit mono input, the common case, is returned as a view over the
+    original bytes with no copy.
+
+    Args:
+        samples: Raw sample bytes from parse_wav
+        info: Format from parse_wav
+
+    Returns:
+        numpy.ndarray: Mono int16 samples
+    """
+    width = info.sample_width
+    if info.audio_format == WAVE_FORMAT_IEEE_FLOAT:
+        dtype = '<f4' if width == 4 else '<f8'
+        floats = np.frombuffer(samples, dtype=dtype)
+        audio = np.clip(floats * 32768.0, -32768, 32767).astype(np.int16)
+    elif info.audio_format != WAVE_FORMAT_PCM:
+        raise ValueError(f"Unsupported WAV format code: {info.audio_format}")
+    elif width == 2:
+        audio = np.frombuffer(samples, dtype='<i2')
+    elif width == 1:
+        # 8-bit WAV is unsigned
+        audio = ((np.frombuffer(samples, dtype=np.uint8).astype(np.int16) - 128) << 8).astype(np.int16)
+    elif width == 3:
+        # Keep the top two bytes of each little-endian 24-bit sample
+        triplets = np.frombuffer(samples, dtype=np.uint8).reshape(-1, 3)
+        audio = np.ascontiguousarray(triplets[:, 1:]).view('<i2').reshape(-1)
+    elif width == 4:
+        audio = (np.frombuffer(samples, dtype='<i4') >> 16).astype(np.int16)
+    else:
+        raise ValueError(f"Unsupported WAV sample width: {width}")
+
+    if info.channels > 1:
+        frames = audio.reshape(-1, info.channels)
+        audio = frames.mean(axis=1, dtype=np.float32).astype(np.int16)
+    return audio
+
+
+def decode_wav(data: Union[bytes, memoryview]):
+    """
+    Parse a WAV file into mono int16 samples.
+
+    Args:
+        data: The complete WAV file
+
+    Returns:
+        tuple: (mono int16 numpy array, WavInfo)
+    """
+    info, samples = parse_wav(data)
+    return to_mono_int16(samples, info), info
+
+
+def normalize_quiet(audio_data: np.ndarray, threshold: int = 500, headroom: float = 0.8,
+                    max_gain: float = 10.0):
+    """
+    Amplify audio whose peak is below threshold so it is loud enough to transcribe.
+
+    Args:
+        audio_data: int16 samples
+        threshold: Peak amplitude below which audio counts as too quiet
+        headroom: Fraction of full scale the peak is raised towards
+        max_gain: Upper bound on the amplification
+
+    Returns:
+        tuple: (int16 samples, gain applied); loud enough or silent audio
+            is returned as is with a gain of 1.0
+    """
+    if not len(audio_data):
+        return audio_data, 1.0
+    # The peak from min/max, without materializing np.abs() of the whole clip
+    peak = max(int(audio_data.max()), -int(audio_data.min()))
+    if peak >= threshold or peak == 0:
+        return audio_data, 1.0
+    gain = min(32767 / peak * headroom, max_gain)
+    return (audio_data.astype(np.float32) * gain).astype(np.int16), gain
+
+
+class PcmDecoder:
+    """
+    Incremental decoder for a raw little-endian 16-bit PCM byte stream.
+
+    Network chunks need not end on a sample boundary, so a trailing odd
+    byte is held back and prepended to the next chunk.
+    """
+
+    def __init__(self):
+        self._carry = b""
+
+    def feed(self, data: bytes) -> np.ndarray:
+        """
+        Decode the next chunk of the stream.
+
+        Args:
+            data: Raw bytes as received
+
+        Returns:
+            numpy.ndarray: The complete int16 samples available so far
+        """
+        if self._carry:
+            data = self._carry + data
+        usable = len(data) & ~1
+        self._carry = data[usable:]
+        return np.frombuffer(data, dtype='<i2', count=usable // 2)
+
+    def flush(self) -> bool:
+        """Reset the decoder, returning whether a dangling byte was dropped"""
+        dropped = bool(self._carry)
+        self._carry = b""
+        return dropped
+
+
+def encode_wav(audio_data: np.ndarray, sample_rate: int, channels: int = 1) -> bytes:
+    """
+    Encode int16 samples as a WAV file in memory.
+
+    Args:
+        audio_data: int16 samples, interleaved if there is more than one channel
+        sample_rate: Sample rate in Hz
+        channels: Number of channels
+
+    Returns:
+        bytes: The complete WAV file
+    """
+    pcm = np.ascontiguousarray(audio_data, dtype='<i2')
+    data_size = pcm.nbytes
+    header = struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', 36 + data_size, b'WAVE',
+        b'fmt ', 16, WAVE_FORMAT_PCM, channels, sample_rate,
+        sample_rate * channels * 2, channels * 2, 16,
+        b'data', data_size
+    )
+    # A single copy of the samples, straight into the output
+    return b''.join((header, memoryview(pcm).cast('B')))
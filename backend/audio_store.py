@@ -0,0 +1,187 @@
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Names the store hands out: <prefix>_<32 hex chars>.<ext>
+VALID_NAME = re.compile(r'^[a-z_]+_[0-9a-f]{32}\.[a-z0-9]+$')
+
+
+class AudioStore:
+    """
+    Disk-backed store for generated audio with a small in-memory LRU tier.
+
+    Files get UUID names so concurrent requests never overwrite each other.
+    A background sweeper deletes files older than max_age and, oldest first,
+    whatever exceeds max_bytes. Recently saved files are also kept in memory
+    so they can usually be served without touching the disk.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = 500 * 1024 * 1024,
+                 max_age: float = 3600, memory_bytes: int = 32 * 1024 * 1024,
+                 sweep_interval: float = 60):
+        """
+        Args:
+            directory: Where audio files are written
+            max_bytes: Upper bound on the total size of files on disk
+            max_age: Seconds after which a file is deleted
+            memory_bytes: Budget for the in-memory tier
+            sweep_interval: Seconds between background sweeps
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.memory_bytes = memory_bytes
+        self.sweep_interval = sweep_interval
+
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+        self._sweeper_pid: Optional[int] = None
+
+    @staticmethod
+    def is_valid_name(filename: str) -> bool:
+        """Check that a filename is one the store could have produced"""
+        return bool(VALID_NAME.match(filename))
+
+    def save(self, data: bytes, prefix: str = "response", ext: str = "wav", cache: bool = True) -> str:
+        """
+        Write audio to the store.
+
+        Args:
+            data: Encoded audio bytes
+            prefix: Filename prefix describing the content
+            ext: File extension
+            cache: Also keep the bytes in the in-memory tier
+
+        Returns:
+            str: The generated filename
+        """
+        filename = f"{prefix}_{uuid.uuid4().hex}.{ext}"
+        self.save_as(filename, data, cache)
+        return filename
+
+    def save_as(self, filename: str, data: bytes, cache: bool = True):
+        """
+        Write audio under a given name, such as another encoding of a stored file.
+
+        Args:
+            filename: A name accepted by is_valid_name
+            data: Encoded audio bytes
+            cache: Also keep the bytes in the in-memory tier
+        """
+        if not self.is_valid_name(filename):
+            raise ValueError(f"Invalid audio filename: {filename}")
+        self.start_sweeper()
+
+        path = self.directory / filename
+        # Write under a temporary name so readers never see a partial file;
+        # the random part keeps concurrent writers of the same name apart
+        tmp_path = path.with_name(f".{filename}.{uuid.uuid4().hex[:8]}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        if cache:
+            self._remember(filename, data)
+
+    @staticmethod
+    def variant_name(filename: str, ext: str) -> str:
+        """Name of the copy of a stored file with a different extension"""
+        return f"{filename.rsplit('.', 1)[0]}.{ext}"
+
+    def read(self, filename: str) -> Optional[bytes]:
+        """Return a stored file's bytes from memory or disk, or None if it does not exist"""
+        data = self.get_cached(filename)
+        if data is not None:
+            return data
+        path = self.path(filename)
+        if path is None:
+            return None
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            return None  # Swept since path() looked
+
+    def get_cached(self, filename: str) -> Optional[bytes]:
+        """Return the bytes for a file if it is in the memory tier"""
+        with self._lock:
+            data = self._memory.get(filename)
+            if data is not None:
+                self._memory.move_to_end(filename)
+            return data
+
+    def path(self, filename: str) -> Optional[Path]:
+        """Return the on-disk path of a stored file, or None if it does not exist"""
+        if not self.is_valid_name(filename):
+            return None
+        path = self.directory / filename
+        return path if path.exists() else None
+
+    def _remember(self, filename: str, data: bytes):
+        if len(data) > self.memory_bytes:
+            return
+        with self._lock:
+            self._memory[filename] = data
+            self._memory_size += len(data)
+            while self._memory_size > self.memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_size -= len(evicted)
+
+    def _forget(self, filename: str):
+        with self._lock:
+            data = self._memory.pop(filename, None)
+            if data is not None:
+                self._memory_size -= len(data)
+
+    def sweep(self):
+        """Delete expired files, then the oldest files until the store fits in max_bytes"""
+        now = time.time()
+        files = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue  # Removed by another worker
+            files.append((stat.st_mtime, stat.st_size, entry.name))
+
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        for mtime, size, name in files:
+            if now - mtime <= self.max_age and total <= self.max_bytes:
+                break
+            try:
+                os.unlink(self.directory / name)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self._forget(name)
+
+    def start_sweeper(self):
+        """Start the background sweeper for this process if it is not running"""
+        if self._sweeper_pid == os.getpid():
+            return
+        with self._lock:
+            if self._sweeper_pid == os.getpid():
+                return
+            self._sweeper_pid = os.getpid()
+
+        def run():
+            while True:
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.warning("Error sweeping audio store: %s", e)
+                time.sleep(self.sweep_interval)
+
+        threading.Thread(target=run, name="audio-store-sweeper", daemon=True).start()
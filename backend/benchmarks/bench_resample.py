@@ -0,0 +1,102 @@
+"""
+Compare the old FFT resampling path in transcribe_audio with the polyphase resampler.
+
+Run from the backend directory:
+
+    python benchmarks/bench_resample.py [--repeat N]
+
+For each rate pair and clip length it reports the median time of
+scipy.signal.resample (as transcribe_audio used it), scipy.signal.resample_poly
+and resampling.resample, plus the largest difference between the new output
+and resample_poly in int16 steps. The prime lengths show the FFT path's worst case.
+"""
+import argparse
+import os
+import sys
+import time
+from fractions import Fraction
+
+import numpy as np
+from scipy import signal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from resampling import StreamingResampler, precompute_common_filters, resample  # noqa: E402
+
+RATE_PAIRS = [(48000, 24000), (44100, 24000), (48000, 16000), (44100, 16000)]
+# Sample counts: round lengths of 1/5/15 s at 48 kHz and primes close to them
+LENGTHS = [48000, 48017, 240000, 240007, 720000, 720007]
+
+
+def fft_resample(audio_data, src_rate, dst_rate):
+    """The path transcribe_audio used before the polyphase resampler"""
+    float_audio = audio_data.astype(np.float32) / 32768.0
+    resampled = signal.resample(float_audio, int(len(float_audio) * dst_rate / src_rate))
+    return (resampled * 32768).astype(np.int16)
+
+
+def poly_reference(audio_data, src_rate, dst_rate):
+    ratio = Fraction(dst_rate, src_rate)
+    return signal.resample_poly(audio_data.astype(np.float64), ratio.numerator, ratio.denominator)
+
+
+def streaming_resample(audio_data, src_rate, dst_rate, chunk=4800):
+    """Feed the clip in 100 ms chunks, as a streaming upload would arrive"""
+    resampler = StreamingResampler(src_rate, dst_rate)
+    parts = [resampler.process(audio_data[i:i + chunk]) for i in range(0, len(audio_data), chunk)]
+    parts.append(resampler.flush())
+    return np.concatenate(parts)
+
+
+def timed(fn, repeat, *args):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)) * 1000, result
+
+
+def test_clip(length, rate):
+    """Speech-band test signal: a 180 Hz voice with harmonics up to 6 kHz"""
+    t = np.arange(length) / rate
+    clip = sum(np.sin(2 * np.pi * 180 * k * t) / k for k in range(1, 34)) * 6000
+    return np.clip(clip, -32768, 32767).astype(np.int16)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement (median is reported)')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    precompute_common_filters()
+    print(f"Filter banks for common rate pairs built in {(time.perf_counter() - start) * 1000:.1f} ms\n")
+
+    header = f"{'rates':>13} {'samples':>8} {'fft ms':>9} {'poly ms':>9} {'new ms':>9} {'stream ms':>10} {'max err':>8}"
+    print(header)
+    print('-' * len(header))
+    for src_rate, dst_rate in RATE_PAIRS:
+        for length in LENGTHS:
+            clip = test_clip(length, src_rate)
+            fft_ms, _ = timed(fft_resample, args.repeat, clip, src_rate, dst_rate)
+            poly_ms, reference = timed(poly_reference, args.repeat, clip, src_rate, dst_rate)
+            new_ms, output = timed(resample, args.repeat, clip, src_rate, dst_rate)
+            stream_ms, streamed = timed(streaming_resample, args.repeat, clip, src_rate, dst_rate)
+
+            drift = np.abs(output.astype(np.int32) - streamed).max()
+            assert drift <= 1, "chunked output differs from one-shot output"
+            # Skip the edges, where the two filters see different zero padding
+            edge = 64
+            n = min(len(output), len(reference))
+            error = np.abs(output[edge:n - edge] - reference[edge:n - edge]).max()
+            print(f"{src_rate // 1000:>5}k->{dst_rate // 1000:>2}k {length:>9} {fft_ms:>9.2f} "
+                  f"{poly_ms:>9.2f} {new_ms:>9.2f} {stream_ms:>10.2f} {error:>8.1f}")
+
+    loud = np.full(48000, 32767, dtype=np.int16)
+    print(f"\nFull-scale input: old path peaks at {fft_resample(loud, 48000, 24000)[100:-100].max()}, "
+          f"new path at {resample(loud, 48000, 24000)[100:-100].max()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+"""
+A local stand-in for the OpenAI endpoints the voice pipeline calls.
+
+Run from the backend directory:
+
+    python benchmarks/fake_openai.py [--port 8765] [--stt-ms 300] [--llm-ms 400] ...
+
+and point the app at it with OPENAI_BASE_URL=http://127.0.0.1:8765/v1 (any
+OPENAI_API_KEY is accepted). It serves model listing, transcriptions, chat
+completions (plain and streamed) and speech (pcm or wav, streamed in chunks)
+after a configurable latency with jitter, and fails a configurable fraction
+of requests with a 500 the way the API does. Questions and answers are drawn
+at random from a word list, so the app's caches do not hide the upstream calls.
+"""
+import argparse
+import io
+import json
+import random
+import re
+import threading
+import time
+import uuid
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+import numpy as np
+
+WORDS = (
+    "audiencia oidor virrey cabildo justicia pleito testigo escribano cédula real "
+    "provisión encomienda tributo corregidor alcalde sentencia apelación consejo "
+    "indias merced licencia probanza residencia visita ordenanza gobernador puerto "
+    "navío flota plata oro hacienda iglesia obispo convento pueblo villa ciudad "
+    "camino río montaña isla costa tierra firme caribe panamá santo domingo lima "
+    "méxico quito charcas chile castilla sevilla rey majestad vasallo señor hidalgo"
+).split()
+
+SPEECH_SAMPLE_RATE = 24000
+
+
+class FakeSettings:
+    """What the fake endpoints do; latencies are in seconds"""
+
+    def __init__(self, stt_latency: float = 0.3, llm_latency: float = 0.4, tts_latency: float = 0.25,
+                 jitter: float = 0.2, error_rate: float = 0.0, answer_words: int = 40,
+                 tokens_per_second: float = 60.0, speech_seconds_per_word: float = 0.35,
+                 chunk_seconds: float = 0.1, seed: Optional[int] = None):
+        """
+        Args:
+            stt_latency: Time to answer a transcription request
+            llm_latency: Time to the first token of a chat completion
+            tts_latency: Time to the first chunk of speech
+            jitter: Relative spread of every latency, drawn from a log-normal distribution
+            error_rate: Fraction of requests answered with a 500
+            answer_words: Mean length of a chat answer (the payload size knob);
+                speech length follows from it
+            tokens_per_second: Rate streamed completions produce words at
+            speech_seconds_per_word: Duration of synthesized speech per word
+            chunk_seconds: Audio per streamed speech chunk
+            seed: Seed for reproducible answers and delays
+        """
+        self.stt_latency = stt_latency
+        self.llm_latency = llm_latency
+        self.tts_latency = tts_latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.answer_words = answer_words
+        self.tokens_per_second = tokens_per_second
+        self.speech_seconds_per_word = speech_seconds_per_word
+        self.chunk_seconds = chunk_seconds
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts = {'requests': 0, 'errors': 0}
+
+    def delay(self, seconds: float) -> float:
+        """A latency with jitter applied"""
+        if seconds <= 0:
+            return 0.0
+        with self._lock:
+            return seconds * self._random.lognormvariate(0, self.jitter) if self.jitter else seconds
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            self.counts['requests'] += 1
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.counts['errors'] += 1
+            return failed
+
+    def sentence(self, words: int) -> str:
+        """Random Spanish-looking words, split into sentences of up to 12 words"""
+        with self._lock:
+            picked = [self._random.choice(WORDS) for _ in range(max(words, 1))]
+        sentences = [' '.join(picked[i:i + 12]) for i in range(0, len(picked), 12)]
+        return ' '.join(s[0].upper() + s[1:] + '.' for s in sentences)
+
+    def question(self) -> str:
+        with self._lock:
+            words = self._random.randint(6, 14)
+        return self.sentence(words).rstrip('.') + '?'
+
+    def answer_length(self) -> int:
+        with self._lock:
+            return max(1, int(self._random.gauss(self.answer_words, self.answer_words * 0.25)))
+
+
+def speech_pcm(text: str, seconds_per_word: float) -> np.ndarray:
+    """A quiet tone as long as the text would take to say, as 24 kHz int16"""
+    samples = int(len(text.split()) * seconds_per_word * SPEECH_SAMPLE_RATE)
+    t = np.arange(samples) / SPEECH_SAMPLE_RATE
+    return (np.sin(2 * np.pi * 220 * t) * 3000).astype(np.int16)
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """Routes /v1/... requests to the fake endpoints"""
+    protocol_version = 'HTTP/1.1'
+    settings: FakeSettings = FakeSettings()
+
+    def log_message(self, format, *args):
+        pass  # One line per request would dominate a load test's output
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send_json(self, status: int, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self):
+        self._send_json(500, {'error': {'message': 'Injected failure', 'type': 'server_error',
+                                        'param': None, 'code': None}})
+
+    def _start_chunked(self, content_type: str):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_chunked(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            self._send_json(200, {'object': 'list', 'data': [
+                {'id': model, 'object': 'model', 'created': 0, 'owned_by': 'fake'}
+                for model in ('gpt-4', 'gpt-4o-transcribe', 'whisper-1', 'tts-1')
+            ]})
+        else:
+            self._send_json(404, {'error': {'message': f'Unknown path {self.path}', 'type': 'invalid_request_error'}})
+
+    def do_POST(self):
+        body = self._read_body()
+        path = self.path.split('?')[0].rstrip('/')
+        if path.endswith('/audio/transcriptions'):
+            self._transcription()
+        elif path.endswith('/chat/completions'):
+            self._chat(json.loads(body or b'{}'))
+        elif path.endswith('/audio/speech'):
+            self._speech(json.loads(body or b'{}'))
+        else:
+            self._send_json(404, {'error': {'message': f'Unknown path {self.path}', 'type': 'invalid_request_error'}})
+
+    def _transcription(self):
+        settings = self.settings
+        time.sleep(settings.delay(settings.stt_latency))
+        if settings.should_fail():
+            return self._send_error()
+        self._send_json(200, {'text': settings.question()})
+
+    def _chat(self, request):
+        settings = self.settings
+        time.sleep(settings.delay(settings.llm_latency))
+        if settings.should_fail():
+            return self._send_error()
+        answer = settings.sentence(settings.answer_length())
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        model = request.get('model', 'gpt-4')
+        if not request.get('stream'):
+            return self._send_json(200, {
+                'id': completion_id, 'object': 'chat.completion', 'created': int(time.time()), 'model': model,
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': answer}}],
+            })
+
+        self._start_chunked('text/event-stream')
+        pause = 1 / settings.tokens_per_second if settings.tokens_per_second > 0 else 0
+        for i, word in enumerate(re.findall(r'\S+\s*', answer)):
+            if i:
+                time.sleep(pause)
+            event = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                     'model': model, 'choices': [{'index': 0, 'delta': {'content': word}, 'finish_reason': None}]}
+            self._write_chunk(f"data: {json.dumps(event)}\n\n".encode('utf-8'))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._end_chunked()
+
+    def _speech(self, request):
+        settings = self.settings
+        response_format = request.get('response_format', 'mp3')
+        if response_format not in ('pcm', 'wav'):
+            return self._send_json(400, {'error': {'message': f'The fake only produces pcm and wav, not {response_format}',
+                                                   'type': 'invalid_request_error'}})
+        time.sleep(settings.delay(settings.tts_latency))
+        if settings.should_fail():
+            return self._send_error()
+
+        audio = speech_pcm(request.get('input', ''), settings.speech_seconds_per_word)
+        if response_format == 'wav':
+            buffer = io.BytesIO()
+            with wave.open(buffer, 'wb') as wav_file:
+                wav_file.setnchannels(1)
+                wav_file.setsampwidth(2)
+                wav_file.setframerate(SPEECH_SAMPLE_RATE)
+                wav_file.writeframes(audio.tobytes())
+            data = buffer.getvalue()
+        else:
+            data = audio.tobytes()
+
+        self._start_chunked('audio/pcm' if response_format == 'pcm' else 'audio/wav')
+        chunk = max(2, int(settings.chunk_seconds * SPEECH_SAMPLE_RATE) * 2)
+        for offset in range(0, len(data), chunk):
+            self._write_chunk(data[offset:offset + chunk])
+        self._end_chunked()
+
+
+def start_server(settings: FakeSettings, host: str = '127.0.0.1', port: int = 0) -> ThreadingHTTPServer:
+    """
+    Serve the fake API on a background thread.
+
+    Args:
+        settings: Behaviour of the endpoints
+        host: Interface to listen on
+        port: Port to listen on, 0 for any free port
+
+    Returns:
+        ThreadingHTTPServer: The running server; its base URL is
+            http://{host}:{server.server_port}/v1
+    """
+    handler = type('Handler', (FakeOpenAIHandler,), {'settings': settings})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-openai", daemon=True).start()
+    return server
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Options shared with loadtest.py, which starts the fake itself"""
+    parser.add_argument('--stt-ms', type=float, default=300, help='Transcription latency')
+    parser.add_argument('--llm-ms', type=float, default=400, help='Chat completion time to first token')
+    parser.add_argument('--tts-ms', type=float, default=250, help='Speech time to first chunk')
+    parser.add_argument('--jitter', type=float, default=0.2, help='Log-normal spread of the latencies')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of upstream requests that fail')
+    parser.add_argument('--answer-words', type=int, default=40, help='Mean words per answer')
+    parser.add_argument('--tokens-per-second', type=float, default=60, help='Streamed completion speed')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for answers and delays')
+
+
+def settings_from_args(args) -> FakeSettings:
+    return FakeSettings(
+        stt_latency=args.stt_ms / 1000,
+        llm_latency=args.llm_ms / 1000,
+        tts_latency=args.tts_ms / 1000,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        answer_words=args.answer_words,
+        tokens_per_second=args.tokens_per_second,
+        seed=args.seed
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_server(settings_from_args(args), args.host, args.port)
+    print(f"Fake OpenAI API on http://{args.host}:{server.server_port}/v1, Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
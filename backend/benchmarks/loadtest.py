@@ -0,0 +1,418 @@
+"""
+Load-test the voice chat endpoints against a local fake of the OpenAI API.
+
+Run from the backend directory:
+
+    python benchmarks/loadtest.py [--concurrency 1,2,4,8] [--duration 20] [--workers 2]
+                                  [--baseline benchmarks/baseline.json] [--save-baseline FILE]
+
+By default it starts the fake API (see fake_openai.py) and the app under
+gunicorn with --workers processes sharing a METRICS_DIR, then uploads a
+corpus of WAV files (--corpus, or synthetic speech-like clips) from a
+growing number of concurrent clients, each sending its next request as soon
+as the last is answered (or, after a 429, once its Retry-After has passed).
+Use --url to load an already running server instead.
+
+For each concurrency level it reports requests per second (total and per
+worker), errors, requests refused with 429, client-side latency percentiles
+of the successful requests and the server's p50/p95/p99 per pipeline stage,
+estimated from the /metrics histograms. With --endpoint stream the event
+stream is read too: a turn that sends an error event or no done event counts
+as an error, and the time to the first audio event is reported as its own
+percentiles.
+With --baseline it compares the results with a stored run and exits with
+status 1 if throughput dropped or a p95 grew by more than --tolerance.
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_openai import add_arguments, settings_from_args, start_server  # noqa: E402
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = {'voice-chat': '/api/voice-chat', 'stream': '/api/voice-chat/stream'}
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Differences smaller than this are within the histogram buckets' resolution
+ABSOLUTE_SLACK = 0.005
+
+_SAMPLE = re.compile(r'^(\w+)\{(.*)\} (\S+)$')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def _wav_bytes(audio: np.ndarray, rate: int) -> bytes:
+    channels = 1 if audio.ndim == 1 else audio.shape[1]
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav_file:
+        wav_file.setnchannels(channels)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(rate)
+        wav_file.writeframes(audio.astype('<i2').tobytes())
+    return buffer.getvalue()
+
+
+def synthetic_clip(seconds: float, rate: int, channels: int = 1) -> bytes:
+    """A voiced, syllable-modulated signal with pauses, which the VAD accepts as speech"""
+    t = np.arange(int(seconds * rate)) / rate
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / rate
+    voice = sum(np.sin(k * phase) / k for k in range(1, 12))
+    syllables = np.clip(np.sin(2 * np.pi * 4 * t), 0, None)
+    words = (np.sin(2 * np.pi * 0.7 * t) > -0.6).astype(float)
+    audio = voice * syllables * words * 5000
+    audio = np.clip(audio, -32768, 32767).astype(np.int16)
+    if channels > 1:
+        audio = np.repeat(audio[:, None], channels, axis=1)
+    return _wav_bytes(audio, rate)
+
+
+def load_corpus(directory: Optional[str]) -> List[Tuple[str, bytes]]:
+    """WAV uploads to cycle through: every *.wav in directory, or synthetic questions"""
+    if directory:
+        paths = sorted(glob.glob(os.path.join(directory, '*.wav')))
+        if not paths:
+            raise SystemExit(f"No .wav files in {directory}")
+        corpus = []
+        for path in paths:
+            with open(path, 'rb') as f:
+                corpus.append((os.path.basename(path), f.read()))
+        return corpus
+    return [
+        ('short_16k.wav', synthetic_clip(2, 16000)),
+        ('medium_16k.wav', synthetic_clip(5, 16000)),
+        ('medium_48k.wav', synthetic_clip(5, 48000)),
+        ('long_48k.wav', synthetic_clip(12, 48000)),
+        ('stereo_44k.wav', synthetic_clip(6, 44100, channels=2)),
+    ]
+
+
+def parse_histograms(text: str) -> Dict[str, Dict[str, Dict[float, float]]]:
+    """
+    Cumulative bucket counts from a Prometheus text exposition.
+
+    Returns:
+        dict: {metric: {group: {upper bound: count}}}, grouped by the stage
+            label of voice_stage_seconds and the endpoint of
+            voice_request_seconds, summed over every other label
+    """
+    histograms: Dict[str, Dict[str, Dict[float, float]]] = {}
+    for line in text.splitlines():
+        match = _SAMPLE.match(line)
+        if not match or not match.group(1).endswith('_bucket'):
+            continue
+        name = match.group(1)[:-len('_bucket')]
+        labels = dict(_LABEL.findall(match.group(2)))
+        group = labels.get('stage') or labels.get('endpoint') or ''
+        bound = float(labels['le'])
+        buckets = histograms.setdefault(name, {}).setdefault(group, {})
+        buckets[bound] = buckets.get(bound, 0) + float(match.group(3))
+    return histograms
+
+
+def histogram_delta(after, before):
+    """Bucket counts recorded between two parse_histograms() results"""
+    delta = {}
+    for name, groups in after.items():
+        for group, buckets in groups.items():
+            previous = before.get(name, {}).get(group, {})
+            counts = {bound: count - previous.get(bound, 0) for bound, count in buckets.items()}
+            if counts.get(float('inf'), 0) > 0:
+                delta.setdefault(name, {})[group] = counts
+    return delta
+
+
+def histogram_quantile(q: float, buckets: Dict[float, float]) -> Optional[float]:
+    """Estimate a quantile from cumulative buckets, interpolating linearly like Prometheus"""
+    bounds = sorted(buckets)
+    total = buckets[bounds[-1]]
+    if total <= 0:
+        return None
+    rank = q * total
+    lower, lower_count = 0.0, 0.0
+    for bound in bounds:
+        count = buckets[bound]
+        if count >= rank:
+            if bound == float('inf'):
+                return lower
+            if count == lower_count:
+                return bound
+            return lower + (bound - lower) * (rank - lower_count) / (count - lower_count)
+        lower, lower_count = bound, count
+    return lower
+
+
+def percentiles(values) -> Dict[str, Optional[float]]:
+    if not len(values):
+        return {f"p{int(q * 100)}": None for q in QUANTILES}
+    return {f"p{int(q * 100)}": float(np.quantile(values, q)) for q in QUANTILES}
+
+
+def read_events(response: httpx.Response, start: float) -> Tuple[bool, Optional[float]]:
+    """
+    Read a server-sent event stream to its end.
+
+    The stream endpoint reports a failed turn as an error event inside an
+    HTTP 200 response, so the status code alone does not tell success.
+
+    Returns:
+        tuple: Whether the stream ended with a done event and no error
+            event, and the seconds from start to the first audio event
+    """
+    done = failed = False
+    first_audio = None
+    for line in response.iter_lines():
+        if not line.startswith('event:'):
+            continue
+        event = line[len('event:'):].strip()
+        if event == 'audio' and first_audio is None:
+            first_audio = time.perf_counter() - start
+        elif event == 'done':
+            done = True
+        elif event == 'error':
+            failed = True
+    return done and not failed, first_audio
+
+
+def run_level(client: httpx.Client, url: str, corpus, concurrency: int, duration: float,
+              magistrate: str, response_format: str, stream: bool = False) -> Dict:
+    """
+    Keep concurrency clients busy for duration seconds and collect their results.
+
+    A request succeeds if it is answered with a 200 and, when stream is set,
+    its event stream ends with done and carries no error event. Latency
+    percentiles cover successful requests only; for streams, the time to
+    the first audio event is reported as first_audio.
+    """
+    deadline = time.perf_counter() + duration
+    # (latency, status, succeeded, seconds to the first audio event)
+    results: List[Tuple[float, int, bool, Optional[float]]] = []
+    lock = threading.Lock()
+    counter = iter(range(10 ** 9))
+
+    def client_loop():
+        while time.perf_counter() < deadline:
+            with lock:
+                name, data = corpus[next(counter) % len(corpus)]
+            start = time.perf_counter()
+            first_audio = None
+            try:
+                with client.stream('POST', url, data={'magistrate': magistrate, 'format': response_format},
+                                   files={'audio': (name, data, 'audio/wav')}) as response:
+                    status = response.status_code
+                    if stream and status == 200:
+                        succeeded, first_audio = read_events(response, start)
+                    else:
+                        response.read()
+                        succeeded = status == 200
+            except httpx.HTTPError:
+                status, succeeded = 0, False
+            with lock:
+                results.append((time.perf_counter() - start, status, succeeded, first_audio))
+            if status == 429:
+                # Back off as a well-behaved client would, rather than adding load
+                try:
+                    retry_after = float(response.headers.get('Retry-After', 1))
+                except ValueError:
+                    retry_after = 1.0
+                time.sleep(max(0.0, min(retry_after, deadline - time.perf_counter())))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(client_loop)
+    elapsed = time.perf_counter() - started
+
+    succeeded = [result for result in results if result[2]]
+    result = {
+        'requests': len(results),
+        'errors': sum(1 for _, status, ok, _ in results if not ok and status != 429),
+        'rejected': sum(1 for _, status, _, _ in results if status == 429),
+        'elapsed': elapsed,
+        'rps': len(succeeded) / elapsed if elapsed else 0.0,
+        'latency': percentiles(np.array([latency for latency, _, _, _ in succeeded])),
+    }
+    if stream:
+        result['first_audio'] = percentiles(np.array([first for _, _, _, first in succeeded if first is not None]))
+    return result
+
+
+def start_app(port: int, workers: int, fake_url: str, metrics_dir: str) -> subprocess.Popen:
+    """Start the app under gunicorn against the fake API and wait until every worker is ready"""
+    env = {
+        **os.environ,
+        'PORT': str(port),
+        'WEB_CONCURRENCY': str(workers),
+        'OPENAI_BASE_URL': fake_url,
+        'OPENAI_API_KEY': 'fake-key',
+        'METRICS_DIR': metrics_dir,
+        'METRICS_FLUSH_INTERVAL': '1',
+        'LOG_LEVEL': os.getenv('LOG_LEVEL', 'WARNING'),
+    }
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', 'app:app'], cwd=BACKEND_DIR, env=env)
+    base = f"http://127.0.0.1:{port}"
+    ready = 0
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"gunicorn exited with status {process.returncode}")
+        try:
+            # Each probe reaches one worker; require a run of successes so all have warmed up
+            ready = ready + 1 if httpx.get(f"{base}/healthz/ready", timeout=2).status_code == 200 else 0
+        except httpx.HTTPError:
+            ready = 0
+        if ready >= workers * 3:
+            return process
+        time.sleep(0.2)
+    process.terminate()
+    raise SystemExit("The app did not become ready within 120 s")
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Regressions of results against a baseline run, as readable lines"""
+    regressions = []
+    for level, current in results['levels'].items():
+        reference = baseline.get('levels', {}).get(level)
+        if reference is None:
+            continue
+        if current['rps_per_worker'] < reference['rps_per_worker'] * (1 - tolerance):
+            regressions.append(f"c={level}: {current['rps_per_worker']:.2f} req/s per worker, "
+                               f"baseline {reference['rps_per_worker']:.2f}")
+        pairs = [('client', current['latency'], reference['latency']),
+                 ('first audio', current.get('first_audio'), reference.get('first_audio'))]
+        pairs += [(stage, values, reference['stages'].get(stage)) for stage, values in current['stages'].items()]
+        for name, values, reference_values in pairs:
+            if not values or not reference_values or values['p95'] is None or reference_values['p95'] is None:
+                continue
+            limit = reference_values['p95'] * (1 + tolerance) + ABSOLUTE_SLACK
+            if values['p95'] > limit:
+                regressions.append(f"c={level} {name}: p95 {values['p95'] * 1000:.1f} ms, "
+                                   f"baseline {reference_values['p95'] * 1000:.1f} ms")
+    return regressions
+
+
+def print_level(level: int, result: Dict):
+    print(f"\nconcurrency {level}: {result['requests']} requests, {result['errors']} errors, "
+          f"{result.get('rejected', 0)} rejected (429), "
+          f"{result['rps']:.2f} req/s ({result['rps_per_worker']:.2f} per worker)")
+    for name, key in (('client', 'latency'), ('first audio', 'first_audio')):
+        latency = result.get(key)
+        if latency and latency['p50'] is not None:
+            print(f"  {name:<16} p50 {latency['p50'] * 1000:>9.1f} ms  p95 {latency['p95'] * 1000:>9.1f} ms  "
+                  f"p99 {latency['p99'] * 1000:>9.1f} ms")
+    for stage, values in sorted(result['stages'].items()):
+        print(f"  {stage:<16} p50 {values['p50'] * 1000:>9.1f} ms  p95 {values['p95'] * 1000:>9.1f} ms  "
+              f"p99 {values['p99'] * 1000:>9.1f} ms  (n={values['count']:.0f})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help='Base URL of a running server; by default one is started')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers (or the workers behind --url)')
+    parser.add_argument('--port', type=int, default=8181, help='Port for the started server')
+    parser.add_argument('--concurrency', default='1,2,4,8,16', help='Comma-separated client counts')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds per concurrency level')
+    parser.add_argument('--endpoint', choices=sorted(ENDPOINTS), default='voice-chat')
+    parser.add_argument('--corpus', help='Directory of .wav uploads (default: synthetic clips)')
+    parser.add_argument('--magistrate', default='Gaspar de Espinosa')
+    parser.add_argument('--format', default='wav', help='Reply audio format to request')
+    parser.add_argument('--output', help='Write the results as JSON')
+    parser.add_argument('--baseline', help='Results JSON to compare with')
+    parser.add_argument('--save-baseline', help='Write the results as a new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='Allowed relative regression')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    app_process = None
+    metrics_dir = None
+    if args.url:
+        base = args.url.rstrip('/')
+    else:
+        metrics_dir = tempfile.mkdtemp(prefix='loadtest_metrics_')
+        fake = start_server(settings_from_args(args))
+        fake_url = f"http://127.0.0.1:{fake.server_port}/v1"
+        print(f"Fake OpenAI API on {fake_url}")
+        app_process = start_app(args.port, args.workers, fake_url, metrics_dir)
+        base = f"http://127.0.0.1:{args.port}"
+    url = base + ENDPOINTS[args.endpoint]
+
+    results = {
+        'config': {
+            'endpoint': args.endpoint, 'workers': args.workers, 'duration': args.duration,
+            'corpus': [name for name, _ in corpus], 'url': args.url,
+            'fake': None if args.url else {
+                'stt_ms': args.stt_ms, 'llm_ms': args.llm_ms, 'tts_ms': args.tts_ms, 'jitter': args.jitter,
+                'error_rate': args.error_rate, 'answer_words': args.answer_words,
+            },
+        },
+        'levels': {},
+    }
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    try:
+        with httpx.Client(timeout=180, limits=limits) as client:
+            for level in levels:
+                # Snapshots are flushed every METRICS_FLUSH_INTERVAL; let the last level's settle
+                time.sleep(1.5)
+                before = parse_histograms(client.get(f"{base}/metrics").text)
+                result = run_level(client, url, corpus, level, args.duration, args.magistrate, args.format,
+                                   stream=args.endpoint == 'stream')
+                time.sleep(1.5)
+                delta = histogram_delta(parse_histograms(client.get(f"{base}/metrics").text), before)
+
+                result['rps_per_worker'] = result['rps'] / args.workers
+                result['stages'] = {
+                    stage: {**{f"p{int(q * 100)}": histogram_quantile(q, buckets) for q in QUANTILES},
+                            'count': buckets[float('inf')]}
+                    for stage, buckets in delta.get('voice_stage_seconds', {}).items()
+                }
+                for endpoint, buckets in delta.get('voice_request_seconds', {}).items():
+                    result['stages'][f"total:{endpoint}"] = {
+                        **{f"p{int(q * 100)}": histogram_quantile(q, buckets) for q in QUANTILES},
+                        'count': buckets[float('inf')]
+                    }
+                results['levels'][str(level)] = result
+                print_level(level, result)
+    finally:
+        if app_process is not None:
+            app_process.terminate()
+            app_process.wait(30)
+        if metrics_dir is not None:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\nRegressions against {args.baseline} (tolerance {args.tolerance:.0%}):")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
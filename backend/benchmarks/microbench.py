@@ -0,0 +1,225 @@
+"""
+Time and peak memory of the CPU-bound audio paths of a voice turn.
+
+Run from the backend directory:
+
+    python benchmarks/microbench.py [--durations 1,5,15,30,60] [--rates 16000,24000,44100,48000]
+                                    [--channels 1,2] [--cases decode_wav,resample] [--repeat 5]
+                                    [--output results.json]
+
+Every case runs on the same deterministic synthetic clips, one per duration,
+sample rate and channel count:
+
+    webm_to_wav    magistrado_agentes.webm_to_wav on a WAV upload (and on WebM when ffmpeg is installed)
+    decode_wav     audio_io.decode_wav, the upload parsing in voice_chat()
+    vad            vad.detect_speech on the decoded upload
+    normalize      audio_io.normalize_quiet on a quiet clip, as in MagistrateVoiceAgent.process_audio
+    resample       stt_upload.downsample_for_stt, the downmix and resampling before transcription
+    stt_encode     stt_upload.encode_upload as FLAC
+    tts_decode     audio_io.PcmDecoder over 100 ms network chunks, as in stream_speech
+    mp3_decode     soundfile decoding an MP3 reply, the path synthesize_speech used before PCM
+    wav_write      audio_io.encode_wav plus the audio store write in _save_response_audio
+
+The time is the median of --repeat runs; the peak is the most memory traced
+by tracemalloc during one extra run, above what was allocated before it.
+"""
+import argparse
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_io import PcmDecoder, decode_wav, encode_wav, normalize_quiet  # noqa: E402
+from audio_store import AudioStore  # noqa: E402
+from resampling import precompute_common_filters  # noqa: E402
+from stt_upload import downsample_for_stt, encode_upload  # noqa: E402
+from vad import detect_speech  # noqa: E402
+
+try:
+    import soundfile as sf
+except (ImportError, OSError):  # Optional, the mp3_decode case is skipped without it
+    sf = None
+
+DURATIONS = (1, 5, 15, 30, 60)
+RATES = (16000, 24000, 44100, 48000)
+CHANNELS = (1, 2)
+# Bytes per network chunk of streamed TTS audio: 100 ms at 24 kHz
+TTS_CHUNK_BYTES = 4800
+
+
+def synthetic_clip(seconds: float, rate: int, channels: int, level: float = 6000) -> np.ndarray:
+    """Speech-band audio: a gliding 150 Hz voice with harmonics, syllable envelope and light noise"""
+    rng = np.random.default_rng(1234)
+    t = np.arange(int(seconds * rate)) / rate
+    phase = 2 * np.pi * np.cumsum(150 + 25 * np.sin(2 * np.pi * 0.3 * t)) / rate
+    voice = sum(np.sin(k * phase) / k for k in range(1, 16))
+    envelope = np.clip(np.sin(2 * np.pi * 3.5 * t), 0.05, None)
+    audio = voice * envelope * level + rng.normal(0, level * 0.01, len(t))
+    audio = np.clip(audio, -32768, 32767).astype(np.int16)
+    if channels > 1:
+        audio = np.repeat(audio[:, None], channels, axis=1)
+    return audio
+
+
+class Clip:
+    """One test clip in every representation the cases start from"""
+
+    def __init__(self, seconds: float, rate: int, channels: int):
+        self.seconds = seconds
+        self.rate = rate
+        self.channels = channels
+        self.samples = synthetic_clip(seconds, rate, channels)
+        self.mono = self.samples if channels == 1 else self.samples.mean(axis=1).astype(np.int16)
+        self.wav = encode_wav(self.samples.reshape(-1), rate, channels)
+        self.quiet = (self.mono // 40).astype(np.int16)
+        self._webm: Optional[bytes] = None
+        self._mp3: Optional[bytes] = None
+
+    def webm(self) -> Optional[bytes]:
+        """The clip as Opus in WebM, as browsers upload it, or None without ffmpeg"""
+        if self._webm is None and shutil.which('ffmpeg'):
+            result = subprocess.run(
+                ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-f', 'wav', '-i', 'pipe:0',
+                 '-c:a', 'libopus', '-f', 'webm', 'pipe:1'],
+                input=self.wav, stdout=subprocess.PIPE, check=True
+            )
+            self._webm = result.stdout
+        return self._webm
+
+    def mp3(self) -> Optional[bytes]:
+        """The mono clip as MP3, or None if libsndfile cannot write it"""
+        if self._mp3 is None and sf is not None:
+            try:
+                buffer = io.BytesIO()
+                sf.write(buffer, self.mono, self.rate, format='MP3')
+                self._mp3 = buffer.getvalue()
+            except Exception:
+                return None
+        return self._mp3
+
+
+def _webm_to_wav():
+    try:
+        from magistrado_agentes import webm_to_wav
+    except Exception as e:  # The agents SDK and its audio dependencies are heavy
+        print(f"Skipping webm_to_wav: {e}")
+        return None
+    return webm_to_wav
+
+
+def _tts_decode(pcm: bytes):
+    decoder = PcmDecoder()
+    chunks = [decoder.feed(pcm[i:i + TTS_CHUNK_BYTES]) for i in range(0, len(pcm), TTS_CHUNK_BYTES)]
+    decoder.flush()
+    return np.concatenate(chunks)
+
+
+def build_cases(store: AudioStore) -> Dict[str, Callable[[Clip], Optional[Callable[[], object]]]]:
+    """
+    Case name -> function returning the work to time for a clip, or None to skip it.
+
+    Inputs are prepared outside the returned closure so only the hot path is measured.
+    """
+    webm_to_wav = _webm_to_wav()
+
+    def mp3_case(clip):
+        data = clip.mp3()
+        return (lambda: sf.read(io.BytesIO(data), dtype='int16')) if data else None
+
+    def wav_write_case(clip):
+        return lambda: store.save(encode_wav(clip.mono, clip.rate), prefix="bench", cache=False)
+
+    cases = {
+        'decode_wav': lambda clip: lambda: decode_wav(clip.wav),
+        'vad': lambda clip: lambda: detect_speech(clip.mono, clip.rate, max_seconds=clip.seconds + 1),
+        'normalize': lambda clip: lambda: normalize_quiet(clip.quiet, max_gain=10),
+        'resample': lambda clip: lambda: downsample_for_stt(clip.samples, clip.rate),
+        'stt_encode': lambda clip: lambda: encode_upload(clip.samples, clip.rate, 'flac'),
+        'tts_decode': lambda clip: (lambda pcm: lambda: _tts_decode(pcm))(clip.mono.tobytes()),
+        'mp3_decode': mp3_case,
+        'wav_write': wav_write_case,
+    }
+    if webm_to_wav is not None:
+        cases['webm_to_wav'] = lambda clip: lambda: webm_to_wav(clip.wav)
+        cases['webm_to_wav:webm'] = lambda clip: (lambda data: (lambda: webm_to_wav(data)) if data else None)(clip.webm())
+    return cases
+
+
+def measure(work: Callable[[], object], repeat: int):
+    """Median seconds over repeat runs, and the peak traced bytes of one more run"""
+    work()  # Warm caches (filter banks, imports) outside the measurement
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        work()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        work()
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    return float(np.median(times)), peak
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--durations', type=_int_list, default=list(DURATIONS), help='Clip lengths in seconds')
+    parser.add_argument('--rates', type=_int_list, default=list(RATES), help='Sample rates in Hz')
+    parser.add_argument('--channels', type=_int_list, default=list(CHANNELS), help='Channel counts')
+    parser.add_argument('--cases', help='Comma-separated cases to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per measurement')
+    parser.add_argument('--output', help='Write the results as JSON')
+    args = parser.parse_args()
+
+    precompute_common_filters()
+    with tempfile.TemporaryDirectory(prefix='microbench_') as directory:
+        store = AudioStore(directory, memory_bytes=0, sweep_interval=3600)
+        cases = build_cases(store)
+        selected = args.cases.split(',') if args.cases else list(cases)
+        unknown = [name for name in selected if name not in cases]
+        if unknown:
+            raise SystemExit(f"Unknown cases: {', '.join(unknown)}; available: {', '.join(cases)}")
+
+        header = f"{'case':<18} {'rate':>6} {'ch':>3} {'sec':>4} {'median ms':>10} {'x realtime':>11} {'peak MiB':>9}"
+        print(header)
+        print('-' * len(header))
+        results = []
+        for seconds in args.durations:
+            for rate in args.rates:
+                for channels in args.channels:
+                    clip = Clip(seconds, rate, channels)
+                    for name in selected:
+                        work = cases[name](clip)
+                        if work is None:
+                            continue
+                        median, peak = measure(work, args.repeat)
+                        results.append({'case': name, 'rate': rate, 'channels': channels, 'seconds': seconds,
+                                        'median_ms': median * 1000, 'peak_bytes': peak})
+                        print(f"{name:<18} {rate:>6} {channels:>3} {seconds:>4} {median * 1000:>10.2f} "
+                              f"{seconds / median if median else float('inf'):>11.0f} {peak / 2 ** 20:>9.2f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+# Gunicorn settings, picked up automatically from the working directory.
+#
+# Voice turns spend most of their time waiting on OpenAI. Request threads
+# only block on a future while the upstream calls for every in-flight turn
+# run on the worker's shared event loop (see async_runtime.py), so a small
+# number of processes with many threads each keeps dozens of turns going.
+import json
+import os
+import shutil
+import tempfile
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '32'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '180'))
+keepalive = 5
+
+
+# Temporary directories created by _default_shared_dir, removed when the master exits
+_created_dirs = []
+
+
+def _default_shared_dir(variable, prefix):
+    """Point an unset directory variable at a new temporary directory, which the workers inherit"""
+    if not os.getenv(variable):
+        os.environ[variable] = tempfile.mkdtemp(prefix=prefix)
+        _created_dirs.append(os.environ[variable])
+
+
+def on_starting(server):
+    """
+    Share state between the workers and clear the previous run's per-worker
+    metrics snapshots and profiles (see metrics.py, profiling.py).
+
+    Without SESSION_DIR every worker would keep its own conversation
+    history, and a follow-up question answered by another worker would
+    start a new conversation. Without METRICS_DIR /metrics would report
+    only the worker that answered the scrape, so counters would jump
+    between scrapes.
+    """
+    _default_shared_dir('SESSION_DIR', 'magistrados_sessions_')
+    _default_shared_dir('METRICS_DIR', 'magistrados_metrics_')
+    for directory, prefix in ((os.getenv('METRICS_DIR'), 'metrics_'),
+                              (os.getenv('PROFILE_DIR') or os.getenv('METRICS_DIR'), 'profile_')):
+        if not directory or not os.path.isdir(directory):
+            continue
+        for name in os.listdir(directory):
+            if name.startswith(prefix) and name.endswith('.json'):
+                os.unlink(os.path.join(directory, name))
+
+
+def child_exit(server, worker):
+    """
+    Drop an exited worker's gauges from its metrics snapshot (see metrics.py).
+
+    Its counters and histograms stay in the totals so they never go down,
+    but its in-flight and queued requests no longer exist.
+    """
+    directory = os.getenv('METRICS_DIR')
+    if not directory:
+        return
+    path = os.path.join(directory, f"metrics_{worker.pid}.json")
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+        if snapshot.pop('gauges', None) is None:
+            return
+        tmp_path = f"{path}.exit.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, path)
+    except (OSError, ValueError) as e:
+        server.log.warning("Could not clear gauges of worker %s: %s", worker.pid, e)
+
+
+def on_exit(server):
+    """Remove the temporary directories on_starting created"""
+    for directory in _created_dirs:
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,77 @@
+import gzip
+import hashlib
+from typing import Dict, Optional
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # Optional, gzip is always available
+    brotli = None
+
+
+def etag_matches(if_none_match: Optional[str], etags) -> bool:
+    """
+    Check an If-None-Match header against the ETags of a resource.
+
+    Uses the weak comparison RFC 9110 prescribes for If-None-Match.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+    return any(etag in candidates for etag in etags)
+
+
+def preferred_encoding(available) -> str:
+    """Pick the best content coding the client accepts, preferring br, then gzip"""
+    accepted = request.accept_encodings
+    for encoding in ('br', 'gzip'):
+        if encoding in available and accepted[encoding] > 0:
+            return encoding
+    return 'identity'
+
+
+class PrecompressedPayload:
+    """
+    A response body that never changes at runtime, serialized and compressed once.
+
+    Each content coding gets its own strong ETag, so conditional requests are
+    answered with a 304 and no body, and caches keep the variants apart.
+    """
+
+    def __init__(self, body: bytes, mimetype: str, max_age: int = 300):
+        """
+        Args:
+            body: Uncompressed response body
+            mimetype: Content type of the body
+            max_age: Seconds clients and shared caches may reuse the response
+        """
+        self.mimetype = mimetype
+        self.cache_control = f"public, max-age={max_age}"
+        self.variants: Dict[str, bytes] = {'identity': body, 'gzip': gzip.compress(body, 9, mtime=0)}
+        if brotli is not None:
+            self.variants['br'] = brotli.compress(body, quality=11)
+
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.etags = {
+            encoding: f'"{digest}"' if encoding == 'identity' else f'"{digest}-{encoding}"'
+            for encoding in self.variants
+        }
+
+    def response(self) -> Response:
+        """Build the response for the current request"""
+        encoding = preferred_encoding(self.variants)
+        headers = {
+            'ETag': self.etags[encoding],
+            'Cache-Control': self.cache_control,
+            'Vary': 'Accept-Encoding',
+        }
+
+        if etag_matches(request.headers.get('If-None-Match'), self.etags.values()):
+            return Response(status=304, headers=headers)
+
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return Response(self.variants[encoding], mimetype=self.mimetype, headers=headers)
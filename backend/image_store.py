@@ -0,0 +1,175 @@
+import hashlib
+import io
+import logging
+import mimetypes
+import threading
+import unicodedata
+from functools import lru_cache
+from html import escape
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional, Tuple
+
+try:
+    from PIL import Image
+except ImportError:  # Optional, without it only the original files are served
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Formats Pillow can re-encode for resized variants
+RESIZABLE_FORMATS = {'image/jpeg': 'JPEG', 'image/png': 'PNG'}
+
+
+class ImageVariant(NamedTuple):
+    """One encoded rendition of an image, ready to send"""
+    data: bytes
+    mimetype: str
+    etag: str
+    last_modified: float
+    width: Optional[int]
+
+
+def _variant(data: bytes, mimetype: str, last_modified: float, width: Optional[int]) -> ImageVariant:
+    return ImageVariant(data, mimetype, hashlib.sha256(data).hexdigest()[:32], last_modified, width)
+
+
+def _key(filename: str) -> str:
+    # URLs and filesystems may disagree on composed vs decomposed accents
+    return unicodedata.normalize('NFC', filename)
+
+
+class ImageStore:
+    """
+    In-memory image catalogue for the magistrate portraits.
+
+    Originals are loaded at startup. build_variants() then adds resized
+    copies at a few standard widths, plus WebP encodings of each, so
+    get() can hand the client the smallest rendition that fits.
+    """
+
+    def __init__(self, directory: Path, widths=(200, 400, 800)):
+        """
+        Args:
+            directory: Directory holding the source images
+            widths: Widths in pixels of the resized variants
+        """
+        self.directory = Path(directory)
+        self.widths = tuple(sorted(widths))
+        # filename -> {(width or None, mimetype): variant}
+        self._images: Dict[str, Dict[Tuple[Optional[int], str], ImageVariant]] = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Read the original images into memory"""
+        images = {}
+        for path in sorted(self.directory.iterdir()):
+            mimetype, _ = mimetypes.guess_type(path.name)
+            if not path.is_file() or not mimetype or not mimetype.startswith('image/'):
+                continue
+            original = _variant(path.read_bytes(), mimetype, path.stat().st_mtime, None)
+            images[_key(path.name)] = {(None, mimetype): original}
+        with self._lock:
+            self._images = images
+        logger.info("Loaded %d images from %s", len(images), self.directory)
+
+    def build_variants(self):
+        """Encode resized and WebP variants of every image (needs Pillow)"""
+        if Image is None:
+            raise RuntimeError("Pillow is not installed, serving original images only")
+
+        with self._lock:
+            originals = {name: variants[next(iter(variants))] for name, variants in self._images.items()}
+
+        for name, original in originals.items():
+            variants = {(None, original.mimetype): original}
+            with Image.open(io.BytesIO(original.data)) as image:
+                image.load()
+                fmt = RESIZABLE_FORMATS.get(original.mimetype)
+                if image.mode not in ('RGB', 'RGBA'):
+                    image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+                self._add_smaller(variants, self._encode(image, 'WEBP', original), original)
+                for width in self.widths:
+                    if width >= image.width:
+                        break
+                    height = round(image.height * width / image.width)
+                    resized = image.resize((width, height), Image.LANCZOS)
+                    best = original
+                    if fmt:
+                        best = self._add_smaller(variants, self._encode(resized, fmt, original, width), best)
+                    self._add_smaller(variants, self._encode(resized, 'WEBP', original, width), best)
+
+            with self._lock:
+                self._images[name] = variants
+        logger.info("Built image variants for %d images", len(originals))
+
+    @staticmethod
+    def _add_smaller(variants, variant: ImageVariant, baseline: ImageVariant) -> ImageVariant:
+        """Keep a variant only if it is smaller than what would be served without it"""
+        if len(variant.data) >= len(baseline.data):
+            return baseline
+        variants[(variant.width, variant.mimetype)] = variant
+        return variant
+
+    @staticmethod
+    def _encode(image, fmt: str, original: ImageVariant, width: Optional[int] = None) -> ImageVariant:
+        buffer = io.BytesIO()
+        if fmt == 'JPEG':
+            image.convert('RGB').save(buffer, 'JPEG', quality=82, optimize=True, progressive=True)
+        elif fmt == 'WEBP':
+            image.save(buffer, 'WEBP', quality=80, method=6)
+        else:
+            image.save(buffer, fmt, optimize=True)
+        mimetype = 'image/webp' if fmt == 'WEBP' else original.mimetype
+        return _variant(buffer.getvalue(), mimetype, original.last_modified, width)
+
+    def get(self, filename: str, width: Optional[int] = None, accept_webp: bool = False) -> Optional[ImageVariant]:
+        """
+        Pick the best rendition of an image.
+
+        Args:
+            filename: Image filename
+            width: Width the client will display the image at, if known
+            accept_webp: Whether the client accepts WebP
+
+        Returns:
+            ImageVariant: The smallest rendition at least width pixels wide
+                (or the original), or None if there is no such image
+        """
+        with self._lock:
+            variants = self._images.get(_key(filename))
+        if not variants:
+            return None
+
+        original = variants[next(iter(variants))]
+        target = None
+        if width:
+            target = next((w for w in self.widths if w >= width), None)
+        for candidate_width in ((target, None) if target else (None,)):
+            if accept_webp and (candidate_width, 'image/webp') in variants:
+                return variants[(candidate_width, 'image/webp')]
+            if (candidate_width, original.mimetype) in variants:
+                return variants[(candidate_width, original.mimetype)]
+        return original
+
+
+@lru_cache(maxsize=128)
+def placeholder(name: str) -> ImageVariant:
+    """
+    Generate a portrait-shaped SVG placeholder showing a name.
+
+    Args:
+        name: Text to show, usually the requested filename without extension
+
+    Returns:
+        ImageVariant: The SVG placeholder
+    """
+    label = escape(name.replace('-', ' ').replace('_', ' ').strip() or 'Imagen')
+    svg = (
+        '<svg xmlns="http://www.w3.org/2000/svg" width="400" height="500" viewBox="0 0 400 500">'
+        '<rect width="400" height="500" fill="#d8d2c4"/>'
+        '<text x="200" y="250" font-family="Georgia, serif" font-size="24" fill="#5a4e3c" '
+        f'text-anchor="middle" dominant-baseline="middle">{label}</text>'
+        '</svg>'
+    ).encode('utf-8')
+    return _variant(svg, 'image/svg+xml', 0, None)
@@ -0,0 +1,184 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from typing import Dict, Optional
+
+# Attributes every LogRecord has; anything else was passed with extra= and is a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """Parse 'category=rate,...', e.g. 'app.request=0.1,magistrado_agentes.events=0.01'"""
+    rates = {}
+    for item in spec.split(','):
+        if '=' in item:
+            category, rate = item.split('=', 1)
+            rates[category.strip()] = float(rate)
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of the records below WARNING for chosen categories.
+
+    A category is a logger name and covers its children, so 'magistrado_agentes' also
+    samples 'magistrado_agentes.events'; the most specific configured name wins.
+    Warnings and errors are never dropped.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._cache: Dict[str, Optional[float]] = {}
+
+    def _rate(self, name: str) -> Optional[float]:
+        if name not in self._cache:
+            rate, candidate = None, name
+            while candidate:
+                if candidate in self.rates:
+                    rate = self.rates[candidate]
+                    break
+                candidate = candidate.rpartition('.')[0]
+            self._cache[name] = rate
+        return self._cache[name]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        return rate is None or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with extra= fields as top-level keys"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text  # Formatted before queueing
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines for local development, with fields as key=value"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = ' '.join(f"{key}={value}" for key, value in vars(record).items()
+                          if key not in _RECORD_ATTRIBUTES and not key.startswith('_'))
+        return f"{line} {fields}" if fields else line
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hand records to a background writer thread, dropping them if it falls behind.
+
+    Request threads never wait on stdout. The writer thread is (re)started
+    lazily in each process, so the handler also works after a fork.
+    """
+
+    def __init__(self, target: logging.Handler, max_queue: int = 10000):
+        super().__init__(queue.Queue(max_queue))
+        self.target = target
+        self.dropped = 0
+        self._listener: Optional[logging.handlers.QueueListener] = None
+        self._listener_pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _ensure_listener(self):
+        if self._listener_pid == os.getpid():
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            # A queue inherited through fork may hold the parent's records and locks
+            self.queue = queue.Queue(self.queue.maxsize)
+            self._listener = logging.handlers.QueueListener(self.queue, self.target, respect_handler_level=True)
+            self._listener.start()
+            self._listener_pid = os.getpid()
+            atexit.register(self._stop_listener, self._listener)
+
+    @staticmethod
+    def _stop_listener(listener: logging.handlers.QueueListener):
+        """Flush what is queued at exit"""
+        try:
+            listener.stop()
+        except queue.Full:
+            pass
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Format the message now, so arguments are not shared across threads,
+        # but keep extra= fields for the structured formatter
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def emit(self, record: logging.LogRecord):
+        self._ensure_listener()
+        super().emit(record)
+
+
+_configured_handler: Optional[NonBlockingQueueHandler] = None
+
+
+def configure_logging():
+    """
+    Set up root logging from the environment; safe to call more than once.
+
+    LOG_LEVEL: minimum level (default INFO); payload dumps are logged at DEBUG
+    LOG_FORMAT: 'json' (default) or 'text'
+    LOG_SAMPLE_RATES: per-category sampling, e.g. 'app.request=0.1,magistrado_agentes.events=0.01'
+    LOG_QUEUE_SIZE: records buffered for the writer thread before new ones are dropped
+    """
+    global _configured_handler
+    if _configured_handler is not None:
+        return _configured_handler
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if os.getenv('LOG_FORMAT', 'json') == 'text':
+        stream_handler.setFormatter(TextFormatter())
+    else:
+        stream_handler.setFormatter(JsonFormatter())
+
+    handler = NonBlockingQueueHandler(stream_handler, int(os.getenv('LOG_QUEUE_SIZE', '10000')))
+    rates = parse_sample_rates(os.getenv('LOG_SAMPLE_RATES', ''))
+    if rates:
+        handler.addFilter(SamplingFilter(rates))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    # Client libraries log every HTTP request at INFO, Pillow every plugin import at DEBUG
+    for noisy in ('httpx', 'httpcore', 'openai', 'PIL'):
+        logging.getLogger(noisy).setLevel(logging.WARNING)
+
+    _configured_handler = handler
+    return handler
@@ -1,4 +1,5 @@
 import asyncio
+import logging
 import random
 import select
 import os
@@ -13,6 +14,10 @@ import openai
 from openai import OpenAI
 from typing import Dict, Any, AsyncIterator
 
+logger = logging.getLogger(__name__)
+# Per-event detail of the agent's voice stream, sampled separately with LOG_SAMPLE_RATES
+event_logger = logging.getLogger(__name__ + '.events')
+
 #Configuramos el dispositivo de audio
 sd.default.device = (None, 1)   # (input_device, output_device)
 sd.default.samplerate = 24000
@@ -39,6 +44,8 @@ from agents.voice import (
     TTSModelSettings,
 )
 from agents.extensions.handoff_prompt import prompt_with_handoff_instructions
+from audio_decode import AudioDecodeError, decode_audio
+from audio_io import normalize_quiet
 
 # Mock implementation of sounddevice
 class MockSoundDevice:
@@ -55,24 +62,24 @@ class MockSoundDevice:
             self.callback = None
         
         def start(self):
-            print("[Mock] Audio player started")
+            logger.debug("[Mock] Audio player started")
         
         def stop(self):
-            print("[Mock] Audio player stopped")
+            logger.debug("[Mock] Audio player stopped")
         
         def write(self, data):
-            print(f"[Mock] Audio data written: {len(data)} samples")
+            logger.debug("[Mock] Audio data written: %d samples", len(data))
     
     @staticmethod
     def rec(frames, samplerate=None, channels=None, dtype=None):
         """Record audio (mock)"""
-        print(f"[Mock] Recording {frames} frames of audio")
+        logger.debug("[Mock] Recording %d frames of audio", frames)
         return np.zeros((frames, 1), dtype=np.int16)
     
     @staticmethod
     def stop():
         """Stop recording (mock)"""
-        print("[Mock] Recording stopped")
+        logger.debug("[Mock] Recording stopped")
 
 # Use our mock implementation
 sd = MockSoundDevice()
@@ -84,6 +91,18 @@ sd.default.channels = 1
 sd.default.dtype = 'int16'
 SAMPLE_RATE = 24000
 
+# Spoken when the pipeline produces no answer
+FALLBACK_TEXT = "Perdonad, no he podido entender vuestra consulta. ¿Podríais repetirla nuevamente?"
+
+# Pre-rendered FALLBACK_TEXT, set by the server's warmup so the failure path
+# does not have to call TTS and ffmpeg
+_fallback_audio = None
+
+def set_fallback_audio(audio_data: np.ndarray):
+    """Provide pre-rendered 24 kHz mono int16 audio for FALLBACK_TEXT."""
+    global _fallback_audio
+    _fallback_audio = audio_data
+
 @function_tool
 def get_historical_context(period: str) -> str:
     """Get historical context for a given period."""
@@ -108,29 +127,29 @@ def create_voice_pipeline(magistrate_info: Dict[str, Any]) -> VoicePipeline:
     else:
         agent = agent
 
-    print(f"Selected agent: {agent.name}")
+    logger.debug("Selected agent: %s", agent.name)
 
     # Create a custom workflow that monitors and logs transcriptions
     class LoggingVoiceWorkflow(SingleAgentVoiceWorkflow):
         async def run(self, transcription: str) -> AsyncIterator[str]:
-            print(f"Transcription received: '{transcription}'")
+            event_logger.debug("Transcription received: '%s'", transcription)
             if not transcription or transcription.isspace():
-                print("Empty transcription detected, using fallback prompt")
+                logger.info("Empty transcription detected, using fallback prompt")
                 transcription = "Saludos, ¿podéis ayudarme con una consulta?"
             
             # Call the agent using the correct method
-            print(f"Getting response from agent...")
+            event_logger.debug("Getting response from agent")
             try:
                 # The agents SDK expects us to yield from the parent class implementation
                 # which already knows how to handle the agent correctly
                 async for response_text in super().run(transcription):
-                    print(f"Agent response: {response_text}")
+                    event_logger.debug("Agent response: %s", response_text)
                     yield response_text
             except Exception as e:
-                print(f"Error processing single turn: {e}")
+                logger.warning("Error processing single turn: %s", e)
                 # Provide a fallback response if the agent fails
-                fallback = "Perdonad, no he podido entender vuestra consulta. ¿Podríais repetirla nuevamente?"
-                print(f"Using fallback response: {fallback}")
+                fallback = FALLBACK_TEXT
+                logger.info("Using fallback response")
                 yield fallback
 
     # Create workflow with the selected agent and custom monitoring
@@ -165,6 +184,16 @@ def create_voice_pipeline(magistrate_info: Dict[str, Any]) -> VoicePipeline:
         config=config
     )
 
+# One pipeline per magistrate, shared by every MagistrateVoiceAgent in the process
+_pipelines: Dict[str, VoicePipeline] = {}
+
+def get_voice_pipeline(magistrate_info: Dict[str, Any]) -> VoicePipeline:
+    """Return the shared voice pipeline for a magistrate, creating it on first use."""
+    name = magistrate_info['name']
+    if name not in _pipelines:
+        _pipelines[name] = create_voice_pipeline(magistrate_info)
+    return _pipelines[name]
+
 # Create agents for each magistrate
 gaspar_agent = Agent(
     name="Gaspar de Espinosa",
@@ -230,138 +259,39 @@ agent = Agent(
 
 def webm_to_wav(webm_data: bytes) -> np.ndarray:
     """
-    Convert WebM audio data to WAV format and return as NumPy array
-    This function first saves the WebM data to a temporary file,
-    then uses ffmpeg to convert it to WAV, and finally reads it into a NumPy array
+    Decode an uploaded recording (WebM, Ogg, WAV, ...) to mono int16 at SAMPLE_RATE.
+
+    See audio_decode.decode_audio; undecodable input gives one second of silence.
     """
     try:
-        # Check if input is already a WAV file
-        if webm_data[:4] == b'RIFF' and webm_data[8:12] == b'WAVE':
-            print("Detected WAV format, extracting PCM data directly")
-            # Find the data chunk
-            import struct
-            pos = 12
-            while pos < len(webm_data):
-                chunk_id = webm_data[pos:pos+4]
-                chunk_size = struct.unpack('<I', webm_data[pos+4:pos+8])[0]
-                if chunk_id == b'data':
-                    # Found the data chunk
-                    audio_data = np.frombuffer(webm_data[pos+8:pos+8+chunk_size], dtype=np.int16)
-                    print(f"Extracted {len(audio_data)} PCM samples directly from WAV")
-                    return audio_data
-                pos += 8 + chunk_size
-            print("WAV format detected but couldn't find data chunk, using ffmpeg")
-        
-        # Create temporary files for input and output
-        with tempfile.NamedTemporaryFile(suffix='.webm', delete=False) as webm_file:
-            webm_path = webm_file.name
-            webm_file.write(webm_data)
-        
-        wav_path = webm_path + '.wav'
-        
-        # Use ffmpeg to convert WebM to WAV if available
-        try:
-            # Try using ffmpeg if it's installed
-            cmd = [
-                'ffmpeg',
-                '-i', webm_path,
-                '-f', 'wav',
-                '-ar', '24000',  # Set sample rate to match our config
-                '-ac', '1',      # Mono audio
-                '-y',            # Overwrite output file
-                wav_path
-            ]
-            
-            print(f"Running ffmpeg command: {' '.join(cmd)}")
-            process = subprocess.Popen(
-                cmd, 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE
-            )
-            stdout, stderr = process.communicate()
-            
-            if process.returncode != 0:
-                print(f"FFmpeg error: {stderr.decode()}")
-                raise Exception("FFmpeg conversion failed")
-                
-            # Read the WAV file into a NumPy array
-            with open(wav_path, 'rb') as wav_file:
-                # Skip the header (44 bytes) to get to the PCM data
-                wav_file.seek(44)  # Standard WAV header size
-                audio_data = np.frombuffer(wav_file.read(), dtype=np.int16)
-                
-            print(f"Successfully converted audio: {len(audio_data)} samples")
-            
-            # Clean up temporary files
-            os.unlink(webm_path)
-            os.unlink(wav_path)
-            
-            return audio_data
-            
-        except (subprocess.SubprocessError, FileNotFoundError) as e:
-            print(f"FFmpeg error: {e}")
-            print("Using fallback conversion method")
-            
-            # Try to determine the content type to handle different audio formats
-            import struct
-            
-            # Check if this might be a WAV file already
-            if webm_data[:4] == b'RIFF' and webm_data[8:12] == b'WAVE':
-                print("Detected WAV format, extracting PCM data directly")
-                # Find the data chunk
-                pos = 12
-                while pos < len(webm_data):
-                    chunk_id = webm_data[pos:pos+4]
-                    chunk_size = struct.unpack('<I', webm_data[pos+4:pos+8])[0]
-                    if chunk_id == b'data':
-                        # Found the data chunk
-                        audio_data = np.frombuffer(webm_data[pos+8:pos+8+chunk_size], dtype=np.int16)
-                        return audio_data
-                    pos += 8 + chunk_size
-            
-            # Fallback: just return a simple sine wave
-            print("Could not parse audio data, generating fallback audio")
-            duration = 1  # second
-            sample_rate = 24000
-            t = np.linspace(0, duration, sample_rate)
-            audio_data = np.sin(2 * np.pi * 440 * t) * 32767 * 0.1
-            return audio_data.astype(np.int16)
-            
-    except Exception as e:
-        print(f"Error converting WebM to WAV: {e}")
-        # Fallback to an empty array
-        return np.zeros(24000, dtype=np.int16)
+        decoded = decode_audio(webm_data, SAMPLE_RATE)
+    except AudioDecodeError as e:
+        logger.warning("Could not decode audio, using silence: %s", e)
+        return np.zeros(SAMPLE_RATE, dtype=np.int16)
+    logger.debug("Decoded %s audio: %d samples", decoded.codec, len(decoded.samples))
+    return decoded.samples
+
 
 class MagistrateVoiceAgent:
     def __init__(self, magistrate_info: Dict[str, Any]):
-        print(f"Initializing MagistrateVoiceAgent for {magistrate_info['name']}")
+        logger.info("Initializing MagistrateVoiceAgent for %s", magistrate_info['name'])
         self.name = magistrate_info['name']
         self.agent_type = magistrate_info['name'].lower().replace(" ", "_")
-        self.pipeline = create_voice_pipeline(magistrate_info)
-        print(f"VoicePipeline initialized with Spanish language configuration")
+        self.pipeline = get_voice_pipeline(magistrate_info)
 
     async def process_audio(self, audio_data: bytes) -> Dict[str, Any]:
         """Process audio input and return audio response."""
         try:
-            print(f"Processing audio: {len(audio_data)} bytes")
+            logger.debug("Processing audio: %d bytes", len(audio_data))
             
             # Convert WebM to WAV format (raw PCM)
             pcm_data = webm_to_wav(audio_data)
-            print(f"Converted to PCM data: {len(pcm_data)} samples")
-            
-            # Check audio quality
-            abs_max = np.abs(pcm_data).max()
-            rms = np.sqrt(np.mean(pcm_data.astype(np.float32)**2))
-            print(f"Audio statistics - max amplitude: {abs_max}, RMS: {rms:.2f}")
+            logger.debug("Converted to PCM data: %d samples", len(pcm_data))
             
-            if abs_max < 500:
-                print("WARNING: Input audio has very low amplitude, might not be detected properly")
-                # Normalize the audio if it's too quiet
-                if abs_max > 0:  # Only normalize if there's some signal
-                    print("Normalizing audio to improve detection")
-                    scale_factor = min(32767 / abs_max * 0.8, 10)  # Scale up, but not too much
-                    pcm_data = (pcm_data.astype(np.float32) * scale_factor).astype(np.int16)
-                    print(f"Audio normalized - new max amplitude: {np.abs(pcm_data).max()}")
+            # Normalize the audio if it's too quiet to be detected properly
+            pcm_data, gain = normalize_quiet(pcm_data, max_gain=10)
+            if gain != 1.0:
+                logger.info("Input audio has very low amplitude, normalized with gain %.1f", gain)
             
             # Use OpenAI Whisper to directly transcribe the audio for debugging
             transcript_text = ""
@@ -382,7 +312,7 @@ class MagistrateVoiceAgent:
                         wf.writeframes(pcm_data.tobytes())
                 
                 # Use OpenAI client to transcribe for debugging
-                print(f"DEBUG: Transcribing audio with OpenAI Whisper directly")
+                logger.debug("Transcribing audio with OpenAI Whisper directly")
                 with open(wav_path, 'rb') as audio_file:
                     transcription = client.audio.transcriptions.create(
                         file=audio_file,
@@ -390,15 +320,14 @@ class MagistrateVoiceAgent:
                         language="es"
                     )
                     transcript_text = transcription.text
-                    print(f"DEBUG: Direct Whisper transcription: '{transcript_text}'")
+                    logger.debug("Direct Whisper transcription: '%s'", transcript_text)
                 
                 # Clean up
                 os.unlink(wav_path)
             except Exception as e:
-                print(f"Error in direct transcription: {e}")
+                logger.warning("Error in direct transcription: %s", e)
             
             # Create audio input with the PCM data
-            print("Creating AudioInput with PCM data")
             audio_input = AudioInput(
                 buffer=pcm_data,
                 frame_rate=24000,
@@ -407,11 +336,11 @@ class MagistrateVoiceAgent:
             )
             
             # Process the audio through the pipeline
-            print("Running voice pipeline...")
+            logger.debug("Running voice pipeline")
             try:
                 result = await self.pipeline.run(audio_input)
             except Exception as pipeline_error:
-                print(f"Error running voice pipeline: {pipeline_error}")
+                logger.exception("Error running voice pipeline: %s", pipeline_error)
                 # Return a minimal result with the error information
                 return {
                     'audio_data': np.zeros(24000, dtype=np.int16),  # 1 second of silence
@@ -420,24 +349,23 @@ class MagistrateVoiceAgent:
                 }
             
             # Collect audio chunks from the result stream
-            print("Collecting audio response...")
             audio_chunks = []
             
             try:
                 async for event in result.stream():
-                    print(f"Received event type: {event.type}")
+                    event_logger.debug("Received event type: %s", event.type)
                     
                     if event.type == "voice_stream_event_audio" and event.data is not None:
                         audio_chunks.append(event.data)
-                        print(f"Added audio chunk: {len(event.data)} samples")
+                        event_logger.debug("Added audio chunk: %d samples", len(event.data))
                     elif event.type == "voice_stream_event_error":
-                        print(f"Error in voice pipeline: {event.error}")
+                        logger.warning("Error in voice pipeline: %s", event.error)
                         raise event.error
             except Exception as stream_error:
-                print(f"Error processing output: {stream_error}")
+                logger.warning("Error processing output: %s", stream_error)
                 # If we have any audio chunks, use them
                 if audio_chunks:
-                    print(f"Using {len(audio_chunks)} collected chunks despite error")
+                    logger.info("Using %d collected chunks despite error", len(audio_chunks))
                 else:
                     # Return error but with captured transcript
                     return {
@@ -448,13 +376,12 @@ class MagistrateVoiceAgent:
             
             # Concatenate all audio chunks
             if audio_chunks:
-                print(f"Collected {len(audio_chunks)} audio chunks")
                 audio_data = np.concatenate(audio_chunks)
-                print(f"Final audio response: {len(audio_data)} samples")
+                logger.debug("Final audio response: %d samples from %d chunks", len(audio_data), len(audio_chunks))
                 
                 # Validate audio quality
                 if np.abs(audio_data).max() < 500:
-                    print("WARNING: Audio response appears to be very quiet")
+                    logger.info("Audio response appears to be very quiet")
                 
                 return {
                     'audio_data': audio_data,
@@ -462,12 +389,19 @@ class MagistrateVoiceAgent:
                 }
             else:
                 # Generate a fallback response using text-to-speech
-                print("No audio response generated, using fallback")
-                fallback_text = "Perdonad, no he podido entender vuestra consulta. ¿Podríais repetirla nuevamente?"
+                logger.warning("No audio response generated, using fallback")
+                fallback_text = FALLBACK_TEXT
+                
+                if _fallback_audio is not None:
+                    return {
+                        'audio_data': _fallback_audio,
+                        'transcript': transcript_text,
+                        'response_text': fallback_text
+                    }
                 
                 try:
                     # Generate speech using OpenAI TTS directly
-                    print("Generating fallback response using OpenAI TTS")
+                    logger.info("Generating fallback response using OpenAI TTS")
                     speech_file_path = "fallback_speech.mp3"
                     response = client.audio.speech.create(
                         model="tts-1",
@@ -508,9 +442,9 @@ class MagistrateVoiceAgent:
                             'response_text': fallback_text
                         }
                     except Exception as e:
-                        print(f"Error converting fallback speech: {e}")
+                        logger.warning("Error converting fallback speech: %s", e)
                 except Exception as tts_error:
-                    print(f"Error generating fallback speech: {tts_error}")
+                    logger.warning("Error generating fallback speech: %s", tts_error)
                 
                 # Simplest fallback: generate a tone
                 duration = 2.0  # seconds
@@ -526,7 +460,7 @@ class MagistrateVoiceAgent:
                 }
             
         except Exception as e:
-            print(f"Error processing audio: {e}")
+            logger.exception("Error processing audio: %s", e)
             # Return empty audio
             return {
                 'audio_data': np.zeros(24000, dtype=np.int16),
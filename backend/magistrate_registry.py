@@ -0,0 +1,41 @@
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+
+def slugify(name: str) -> str:
+    """Turn a magistrate name into the id used by the API"""
+    return name.lower().replace(" ", "-")
+
+
+class MagistrateRegistry:
+    """
+    Per-process index of magistrates and their ready-made voice handlers.
+
+    Handlers are built once at startup and shared by every request, so
+    looking a magistrate up is a dictionary access instead of a scan of
+    MAGISTRATES, and no per-request client or pipeline setup is needed.
+    """
+
+    def __init__(self, magistrates: Dict[str, Dict[str, Any]], handler_factory: Callable[[Dict[str, Any]], Any]):
+        """
+        Args:
+            magistrates: Magistrate configuration keyed by display name
+            handler_factory: Builds the voice handler for a magistrate's info
+        """
+        self._infos: Dict[str, Dict[str, Any]] = {}
+        self._handlers: Dict[str, Any] = {}
+        for name, info in magistrates.items():
+            slug = slugify(name)
+            self._infos[slug] = {**info, 'name': name, 'id': slug}
+            self._handlers[slug] = handler_factory(self._infos[slug])
+
+    def info(self, name_or_id: str) -> Optional[Dict[str, Any]]:
+        """Return a magistrate's info by display name or id, or None"""
+        return self._infos.get(slugify(name_or_id))
+
+    def handler(self, name_or_id: str) -> Optional[Any]:
+        """Return a magistrate's shared voice handler by display name or id, or None"""
+        return self._handlers.get(slugify(name_or_id))
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Iterate over (id, info) pairs"""
+        return iter(self._infos.items())
@@ -0,0 +1,225 @@
+import bisect
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from profiling import PROFILER
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds, from fast CPU stages to full voice turns
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRIC_HELP = {
+    'voice_stage_seconds': 'Time spent in each stage of the voice pipeline',
+    'voice_request_seconds': 'Total time to answer a voice chat request',
+    'voice_stt_fallbacks': 'Transcriptions retried with the fallback model',
+    'voice_requests': 'Voice chat requests by outcome',
+    'voice_admission_wait_seconds': 'Time voice requests waited for an admission slot',
+    'voice_admission_rejected': 'Voice requests refused with 429 because the server was at capacity',
+    'voice_admission_active': 'Voice requests holding an admission slot',
+    'voice_admission_queued': 'Voice requests waiting for an admission slot',
+}
+
+# A snapshot not rewritten for this many flush intervals is from a worker that
+# has exited, and its gauges are left out of the totals
+GAUGE_STALE_FLUSHES = 3
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items() if value is not None))
+
+
+def _format_labels(labels, extra: str = '') -> str:
+    parts = [f'{key}="{_escape(value)}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    """
+    Process-local histograms, counters and gauges, exported in the Prometheus text format.
+
+    Each gunicorn worker records into its own instance. When a directory is
+    configured, workers write a snapshot there every flush_interval seconds
+    and render() sums the snapshots of all workers, gauges included, so
+    whichever worker answers /metrics reports the whole server.
+    """
+
+    def __init__(self, directory: Optional[str] = None, flush_interval: float = 5.0):
+        """
+        Args:
+            directory: Directory shared by the workers for snapshots, or None
+                to report only this process
+            flush_interval: Seconds between snapshot writes
+        """
+        self.directory = Path(directory) if directory else None
+        if self.directory:
+            self.directory.mkdir(parents=True, exist_ok=True)
+        self.flush_interval = flush_interval
+        # (name, labels) -> [bucket counts..., +Inf count], sum
+        self._histograms: Dict[Tuple[str, Labels], Tuple[List[int], List[float]]] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauges: Dict[Tuple[str, Labels], float] = {}
+        self._lock = threading.Lock()
+        self._flusher_pid: Optional[int] = None
+
+    def observe(self, name: str, seconds: float, **labels):
+        """Record one duration in a histogram"""
+        key = (name, _labels(labels))
+        index = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        with self._lock:
+            entry = self._histograms.get(key)
+            if entry is None:
+                entry = self._histograms[key] = ([0] * (len(LATENCY_BUCKETS) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += seconds
+        self._start_flusher()
+
+    def increment(self, name: str, value: float = 1, **labels):
+        """Add to a counter"""
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        self._start_flusher()
+
+    def set_gauge(self, name: str, value: float, **labels):
+        """Set a gauge to this process's current value"""
+        key = (name, _labels(labels))
+        with self._lock:
+            self._gauges[key] = value
+        self._start_flusher()
+
+    @contextmanager
+    def timer(self, stage: str, **labels):
+        """Time a block as a stage of the voice pipeline, including when it raises"""
+        start = time.perf_counter()
+        try:
+            # The caller's frame, below contextlib's __enter__, anchors the stage's stack samples
+            with PROFILER.stage(stage, sys._getframe(2)):
+                yield
+        finally:
+            self.observe('voice_stage_seconds', time.perf_counter() - start, stage=stage, **labels)
+
+    def snapshot(self) -> Dict[str, list]:
+        """This process's metrics as JSON-serializable data"""
+        with self._lock:
+            return {
+                'histograms': [[name, list(labels), list(counts), total[0]]
+                               for (name, labels), (counts, total) in self._histograms.items()],
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                'gauges': [[name, list(labels), value] for (name, labels), value in self._gauges.items()],
+            }
+
+    def flush(self):
+        """Write this process's snapshot to the shared directory"""
+        if not self.directory:
+            return
+        path = self.directory / f"metrics_{os.getpid()}.json"
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        tmp_path.write_text(json.dumps(self.snapshot()))
+        os.replace(tmp_path, path)
+
+    def _start_flusher(self):
+        if not self.directory or self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+
+        def run():
+            while True:
+                time.sleep(self.flush_interval)
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.warning("Error writing metrics snapshot: %s", e)
+
+        threading.Thread(target=run, name="metrics-flusher", daemon=True).start()
+
+    def _snapshots(self) -> List[Dict[str, list]]:
+        """Snapshots of every worker, with this process's taken live"""
+        snapshots = [self.snapshot()]
+        if self.directory:
+            own = f"metrics_{os.getpid()}.json"
+            for path in self.directory.glob('metrics_*.json'):
+                if path.name == own:
+                    continue
+                try:
+                    stale = path.stat().st_mtime < time.time() - GAUGE_STALE_FLUSHES * self.flush_interval
+                    snapshot = json.loads(path.read_text())
+                except (OSError, ValueError):
+                    continue  # Being replaced, or from a crashed writer
+                if stale:
+                    # The worker is gone; its counts still add up, its current values do not
+                    snapshot.pop('gauges', None)
+                snapshots.append(snapshot)
+        return snapshots
+
+    def render(self) -> str:
+        """All workers' metrics in the Prometheus text exposition format"""
+        histograms: Dict[Tuple[str, Labels], List[float]] = {}
+        counters: Dict[Tuple[str, Labels], float] = {}
+        gauges: Dict[Tuple[str, Labels], float] = {}
+        for snapshot in self._snapshots():
+            for name, labels, counts, total in snapshot['histograms']:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                merged = histograms.setdefault(key, [0] * (len(counts) + 1))
+                for i, count in enumerate(counts):
+                    merged[i] += count
+                merged[-1] += total
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, value in snapshot.get('gauges', ()):
+                key = (name, tuple(tuple(pair) for pair in labels))
+                gauges[key] = gauges.get(key, 0) + value
+
+        lines = []
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for (metric, labels), values in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                counts, total = values[:-1], values[-1]
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + (float('inf'),), counts):
+                    cumulative += count
+                    le = 'le="+Inf"' if bound == float('inf') else f'le="{bound!r}"'
+                    lines.append(f"{name}_bucket{_format_labels(labels, le)} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+                lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# HELP {name}_total {METRIC_HELP.get(name, name)}")
+            lines.append(f"# TYPE {name}_total counter")
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}_total{_format_labels(labels)} {value:g}")
+        for name in sorted({name for name, _ in gauges}):
+            lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} gauge")
+            for (metric, labels), value in sorted(gauges.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        return '\n'.join(lines) + '\n'
+
+
+# Shared by every module in the process; METRICS_DIR (set by gunicorn.conf.py by default)
+# enables cross-worker aggregation
+METRICS = Metrics(os.getenv('METRICS_DIR') or None, float(os.getenv('METRICS_FLUSH_INTERVAL', '5')))
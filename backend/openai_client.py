@@ -0,0 +1,42 @@
+import os
+import threading
+from typing import Optional
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+_client: Optional[AsyncOpenAI] = None
+_client_pid: Optional[int] = None
+_lock = threading.Lock()
+
+
+def get_async_client() -> AsyncOpenAI:
+    """
+    Return the AsyncOpenAI client shared by every handler in this process.
+
+    The client keeps one HTTP/2 (when h2 is installed) keep-alive connection
+    pool for the transcription, chat and speech endpoints, so TLS handshakes
+    are paid once per worker rather than once per request. It must only be
+    used from the worker's shared event loop (async_runtime.event_loop).
+    """
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _lock:
+            if _client is None or _client_pid != os.getpid():
+                http_client = DefaultAsyncHttpxClient(
+                    http2=HTTP2_AVAILABLE,
+                    limits=httpx.Limits(
+                        max_connections=int(os.getenv('OPENAI_MAX_CONNECTIONS', '100')),
+                        max_keepalive_connections=int(os.getenv('OPENAI_MAX_KEEPALIVE', '20')),
+                        keepalive_expiry=float(os.getenv('OPENAI_KEEPALIVE_EXPIRY', '120'))
+                    )
+                )
+                _client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'), http_client=http_client)
+                _client_pid = os.getpid()
+    return _client
@@ -1,25 +1,111 @@
+import asyncio
+import logging
 import os
-import tempfile
-import wave
+import re
+import time
 import numpy as np
-import sounddevice as sd
-from openai import OpenAI
-from typing import Optional, Dict, Any
+from openai import AsyncOpenAI
+from typing import Optional, Dict, Any, AsyncIterator, List, Sequence, Tuple
+from audio_io import PcmDecoder
+from stt_upload import SttUpload, downsample_for_stt, encode_upload
+from metrics import METRICS
+from tts_cache import TTSCache
+from response_cache import ResponseCache, CachedResponse
+from semantic_cache import SemanticCache
+from session_store import Turn, history_messages
+from openai_client import get_async_client
+
+logger = logging.getLogger(__name__)
+
+# Sentence end: terminal punctuation, optional closing quotes/brackets, then whitespace
+SENTENCE_BOUNDARY = re.compile(r'[.!?…]+["”»)\]]*\s+|\n+')
+
+# The TTS endpoint's raw PCM output is always 24 kHz, 16-bit, mono
+TTS_SAMPLE_RATE = 24000
+
+class SentenceSplitter:
+    """
+    Incrementally split streamed text into sentences.
+    
+    Fragments shorter than min_chars are held back and merged with the next
+    sentence so TTS is not asked to voice isolated words.
+    """
+    
+    def __init__(self, min_chars: int = 20):
+        self.min_chars = min_chars
+        self._buffer = ""
+        
+    def feed(self, text: str) -> List[str]:
+        """
+        Add streamed text and return any sentences it completes.
+        
+        Args:
+            text: Next chunk of streamed text
+            
+        Returns:
+            list: Completed sentences, in order
+        """
+        self._buffer += text
+        sentences = []
+        start = 0
+        for match in SENTENCE_BOUNDARY.finditer(self._buffer):
+            candidate = self._buffer[start:match.end()].strip()
+            if len(candidate) >= self.min_chars:
+                sentences.append(candidate)
+                start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+        
+    def flush(self) -> Optional[str]:
+        """Return whatever text remains once the stream has ended."""
+        remainder = self._buffer.strip()
+        self._buffer = ""
+        return remainder or None
 
 class OpenAIVoiceHandler:
-    def __init__(self, magistrate_info: Dict[str, Any]):
+    def __init__(self, magistrate_info: Dict[str, Any], pipelined: Optional[bool] = None,
+                 tts_cache: Optional[TTSCache] = None, response_cache: Optional[ResponseCache] = None,
+                 semantic_cache: Optional[SemanticCache] = None, client: Optional[AsyncOpenAI] = None):
         """
         Initialize the OpenAI voice handler.
         
         Args:
             magistrate_info: Dictionary containing magistrate information
+            pipelined: Stream the LLM response and synthesize it sentence by sentence.
+                Defaults to the PIPELINE_TTS environment variable (on).
+            tts_cache: Cache of synthesized speech shared between handlers
+            response_cache: Cache of complete answers to previously asked questions
+            semantic_cache: Cache of answers looked up by question similarity
+            client: OpenAI client to use, defaults to the process-wide shared client
         """
-        self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        self.client = client or get_async_client()
         self.magistrate_info = magistrate_info
-        self.sample_rate = 24000  # Default sample rate
+        self.sample_rate = TTS_SAMPLE_RATE  # Default sample rate
         self.channels = 1
+        if pipelined is None:
+            pipelined = os.getenv('PIPELINE_TTS', '1') == '1'
+        self.pipelined = pipelined
+        # Maximum number of sentences synthesized at the same time
+        self.tts_concurrency = int(os.getenv('TTS_CONCURRENCY', '4'))
+        # Encoding of the audio uploaded for transcription: flac, opus or wav
+        self.stt_upload_format = os.getenv('STT_UPLOAD_FORMAT', 'flac')
+        self.metric_labels = {'magistrate': magistrate_info.get('id') or magistrate_info.get('name')}
+        # Speech synthesis settings, which are also part of the TTS cache key
+        self.tts_model = "tts-1"
+        self.tts_voice = "onyx"
+        self.tts_speed = 1.0
+        self.tts_cache = tts_cache
+        self.response_cache = response_cache
+        self.semantic_cache = semantic_cache
+        
+    def _prepare_upload(self, audio_data: np.ndarray, sample_rate: int) -> SttUpload:
+        """Downsample and encode a question for transcription, timing each step"""
+        with METRICS.timer('resample', **self.metric_labels):
+            audio_data, sample_rate = downsample_for_stt(audio_data, sample_rate)
+        with METRICS.timer('stt_encode', format=self.stt_upload_format, **self.metric_labels):
+            return encode_upload(audio_data, sample_rate, self.stt_upload_format)
         
-    def transcribe_audio(self, audio_data: np.ndarray, input_sample_rate: int = None) -> Optional[str]:
+    async def transcribe_audio(self, audio_data: np.ndarray, input_sample_rate: int = None) -> Optional[str]:
         """
         Transcribe audio data using OpenAI's Whisper model.
         
@@ -31,114 +117,272 @@ class OpenAIVoiceHandler:
             str: Transcribed text or None if transcription failed
         """
         try:
-            # Use the provided sample rate if available, otherwise use default
-            sample_rate = input_sample_rate if input_sample_rate else self.sample_rate
-            
-            # Resample audio if the input sample rate is different from what OpenAI expects
-            if input_sample_rate and input_sample_rate != self.sample_rate:
-                # Try librosa first
-                try:
-                    from scipy import signal
-                    
-                    # Calculate the resampling ratio
-                    ratio = self.sample_rate / input_sample_rate
-                    
-                    # Convert to float for processing
-                    float_audio = audio_data.astype(np.float32) / 32768.0
-                    
-                    # Resample using scipy's resample function
-                    resampled_length = int(len(float_audio) * ratio)
-                    resampled_audio = signal.resample(float_audio, resampled_length)
-                    
-                    # Convert back to int16
-                    audio_data = (resampled_audio * 32768).astype(np.int16)
-                    sample_rate = self.sample_rate
-                    print(f"Resampling with scipy complete. New audio length: {len(audio_data)}")
-                
-                # If all resampling fails, use original audio
-                except Exception as e2:
-                    print(f"Error during scipy resampling: {e2}. Using original audio.")
+            # Resampling and encoding are CPU-bound, keep them off the event loop.
+            # The same in-memory upload is reused if we have to fall back.
+            upload = await asyncio.to_thread(
+                self._prepare_upload, audio_data, input_sample_rate or self.sample_rate
+            )
             
-            # Save audio data to a temporary WAV file
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_wav:
-                wav_path = temp_wav.name
-                
-                with wave.open(wav_path, 'wb') as wf:
-                    wf.setnchannels(self.channels)
-                    wf.setsampwidth(2)  # 16-bit
-                    wf.setframerate(sample_rate)
-                    wf.writeframes(audio_data.tobytes())
-                
-                # Transcribe using OpenAI's API
-                with open(wav_path, 'rb') as audio_file:
-                    try:
-                        print("Transcribing with gpt-4o-transcribe")
-                        print(f"Audio file: {wav_path}, Sample rate: {sample_rate}Hz")
-                        
-                        # Try with gpt-4o-transcribe for better quality
-                        transcription = self.client.audio.transcriptions.create(
-                            file=audio_file,
-                            model="gpt-4o-transcribe",
-                            language="es",
-                            temperature=0.0
-                        )
-                    except Exception as e:
-                        print(f"Error with gpt-4o-transcribe, falling back to whisper-1: {e}")
-                        # If the gpt-4o-transcribe model isn't available, fall back to whisper-1
-                        # Reopen the file since it was consumed in the previous attempt
-                        audio_file.seek(0)
-                        transcription = self.client.audio.transcriptions.create(
-                            file=audio_file,
-                            model="whisper-1",
-                            language="es",
-                            temperature=0.0  # Use 0 temperature for more deterministic results
-                        )
-                    
-                # Clean up temporary file
-                os.unlink(wav_path)
+            try:
+                logger.debug("Transcribing with gpt-4o-transcribe", extra={
+                    'upload_bytes': len(upload.data), 'upload_format': upload.format,
+                    'sample_rate': upload.sample_rate
+                })
                 
-                # Print the transcription for debugging
-                print(f"Raw transcription: {transcription.text}")
+                # Try with gpt-4o-transcribe for better quality
+                with METRICS.timer('stt', model="gpt-4o-transcribe", **self.metric_labels):
+                    transcription = await self.client.audio.transcriptions.create(
+                        file=upload.as_file(),
+                        model="gpt-4o-transcribe",
+                        language="es",
+                        temperature=0.0
+                    )
+            except Exception as e:
+                logger.warning("Error with gpt-4o-transcribe, falling back to whisper-1: %s", e)
+                METRICS.increment('voice_stt_fallbacks', model="whisper-1", **self.metric_labels)
+                # If the gpt-4o-transcribe model isn't available, fall back to whisper-1
+                with METRICS.timer('stt', model="whisper-1", **self.metric_labels):
+                    transcription = await self.client.audio.transcriptions.create(
+                        file=upload.as_file(),
+                        model="whisper-1",
+                        language="es",
+                        temperature=0.0  # Use 0 temperature for more deterministic results
+                    )
                 
-                return transcription.text
+            logger.debug("Raw transcription: %s", transcription.text)
+            
+            return transcription.text
                 
         except Exception as e:
-            print(f"Error during transcription: {e}")
+            logger.exception("Error during transcription: %s", e)
             return None
             
-    def generate_response(self, transcribed_text: str) -> Optional[str]:
+    def _build_messages(self, transcribed_text: str, history: Sequence[Turn] = ()) -> List[Dict[str, str]]:
+        """
+        Build the chat messages for a turn using the magistrate's persona.
+        
+        The system prompt comes first and earlier turns follow unchanged, so
+        consecutive turns of a conversation share a prefix the API can cache.
+        
+        Args:
+            transcribed_text: The transcribed user input
+            history: Earlier turns of the conversation, oldest first
+            
+        Returns:
+            list: Chat completion messages
+        """
+        # Prepare the system message with the magistrate's persona
+        system_message = self.magistrate_info.get('persona', '')
+        if 'context_instructions' in self.magistrate_info:
+            system_message += "\n" + self.magistrate_info['context_instructions']
+        logger.debug("System message: %s", system_message)
+            
+        return [
+            {"role": "system", "content": system_message},
+            *history_messages(history),
+            {"role": "user", "content": transcribed_text}
+        ]
+        
+    def _similar_answer(self, transcribed_text: str) -> Optional[str]:
+        """Return the answer to a near-identical earlier question, if there is one"""
+        if self.semantic_cache is None:
+            return None
+        match = self.semantic_cache.lookup(self.magistrate_info['name'], transcribed_text)
+        if match is None:
+            return None
+        logger.info("Semantic cache hit (%.2f)", match.score, extra=self.metric_labels)
+        logger.debug("Semantic cache match: '%s' ~ '%s'", transcribed_text, match.question)
+        return match.answer
+        
+    def _remember_answer(self, transcribed_text: str, response_text: str):
+        """Add a generated answer to the semantic cache"""
+        if self.semantic_cache is not None and response_text:
+            self.semantic_cache.add(self.magistrate_info['name'], transcribed_text, response_text)
+            
+    async def generate_response(self, transcribed_text: str, history: Sequence[Turn] = ()) -> Optional[str]:
         """
         Generate a text response using the magistrate's persona.
         
         Args:
             transcribed_text: The transcribed user input
+            history: Earlier turns of the conversation, oldest first
             
         Returns:
             str: Generated response text or None if generation failed
         """
         try:
-            # Prepare the system message with the magistrate's persona
-            system_message = self.magistrate_info.get('persona', '')
-            if 'context_instructions' in self.magistrate_info:
-                system_message += "\n" + self.magistrate_info['context_instructions']
-                print(f"System message: {system_message}")
-            
+            # Answers depend on the conversation, only first turns are cacheable
+            if not history:
+                cached_answer = self._similar_answer(transcribed_text)
+                if cached_answer is not None:
+                    return cached_answer
+                
             # Generate response using chat completion
-            response = self.client.chat.completions.create(
-                model="gpt-4",  # or another appropriate model
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": transcribed_text}
-                ]
-            )
+            with METRICS.timer('llm', **self.metric_labels):
+                response = await self.client.chat.completions.create(
+                    model="gpt-4",  # or another appropriate model
+                    messages=self._build_messages(transcribed_text, history)
+                )
             
-            return response.choices[0].message.content
+            response_text = response.choices[0].message.content
+            if not history:
+                self._remember_answer(transcribed_text, response_text)
+            return response_text
             
         except Exception as e:
-            print(f"Error during response generation: {e}")
+            logger.exception("Error during response generation: %s", e)
             return None
             
-    def synthesize_speech(self, text: str) -> Optional[np.ndarray]:
+    async def stream_response(self, transcribed_text: str, history: Sequence[Turn] = ()) -> AsyncIterator[str]:
+        """
+        Stream the magistrate's response as it is generated.
+        
+        Args:
+            transcribed_text: The transcribed user input
+            history: Earlier turns of the conversation, oldest first
+            
+        Yields:
+            str: Text deltas of the response
+        """
+        if not history:
+            cached_answer = self._similar_answer(transcribed_text)
+            if cached_answer is not None:
+                yield cached_answer
+                return
+            
+        start = time.perf_counter()
+        stream = await self.client.chat.completions.create(
+            model="gpt-4",
+            messages=self._build_messages(transcribed_text, history),
+            stream=True
+        )
+        parts = []
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                if not parts:
+                    METRICS.observe('voice_stage_seconds', time.perf_counter() - start,
+                                    stage='llm_first_token', **self.metric_labels)
+                parts.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+        METRICS.observe('voice_stage_seconds', time.perf_counter() - start, stage='llm', **self.metric_labels)
+        if not history:
+            self._remember_answer(transcribed_text, "".join(parts))
+                
+    async def pipeline_sentences(self, transcribed_text: str,
+                                 history: Sequence[Turn] = ()) -> AsyncIterator[Tuple[str, np.ndarray]]:
+        """
+        Generate the response and synthesize it sentence by sentence.
+        
+        Each sentence is sent to TTS as soon as the LLM finishes it, so
+        synthesis of early sentences overlaps generation of later ones.
+        
+        Args:
+            transcribed_text: The transcribed user input
+            history: Earlier turns of the conversation, oldest first
+            
+        Yields:
+            tuple: (sentence, audio) pairs in response order
+        """
+        semaphore = asyncio.Semaphore(self.tts_concurrency)
+        queue: asyncio.Queue = asyncio.Queue()
+        tasks = []
+        
+        async def synthesize(sentence: str) -> Optional[np.ndarray]:
+            async with semaphore:
+                return await self.synthesize_speech(sentence)
+                
+        def schedule(sentence: str):
+            task = asyncio.create_task(synthesize(sentence))
+            tasks.append(task)
+            queue.put_nowait((sentence, task))
+            
+        async def produce():
+            splitter = SentenceSplitter()
+            try:
+                async for delta in self.stream_response(transcribed_text, history):
+                    for sentence in splitter.feed(delta):
+                        schedule(sentence)
+                remainder = splitter.flush()
+                if remainder:
+                    schedule(remainder)
+            finally:
+                queue.put_nowait(None)
+                
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                sentence, task = item
+                audio = await task
+                if audio is None:
+                    raise RuntimeError(f"Failed to synthesize sentence: {sentence}")
+                yield sentence, audio
+            # Surface any error raised while streaming the response
+            await producer
+        finally:
+            producer.cancel()
+            for task in tasks:
+                task.cancel()
+            # Wait for the cancellations so no task outlives the turn or logs an unretrieved error
+            await asyncio.gather(producer, *tasks, return_exceptions=True)
+
+    async def generate_and_synthesize(self, transcribed_text: str,
+                                      history: Sequence[Turn] = ()) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        Run the pipelined LLM and TTS stages and stitch the audio back together.
+        
+        Args:
+            transcribed_text: The transcribed user input
+            history: Earlier turns of the conversation, oldest first
+            
+        Returns:
+            tuple: (response text, audio) or (None, None) if either stage failed
+        """
+        sentences = []
+        chunks = []
+        try:
+            async for sentence, audio in self.pipeline_sentences(transcribed_text, history):
+                sentences.append(sentence)
+                chunks.append(audio)
+        except Exception as e:
+            logger.exception("Error in pipelined response: %s", e)
+            return None, None
+            
+        if not chunks:
+            return None, None
+        return " ".join(sentences), np.concatenate(chunks)
+        
+    async def stream_speech(self, text: str) -> AsyncIterator[np.ndarray]:
+        """
+        Synthesize speech, yielding int16 samples as the TTS response arrives.
+        
+        Raw PCM (24 kHz, 16-bit, mono) is requested, so the response bytes are
+        the samples and no container or codec has to be decoded.
+        
+        Args:
+            text: Text to convert to speech
+            
+        Yields:
+            numpy.ndarray: Consecutive chunks of int16 audio at self.sample_rate
+        """
+        decoder = PcmDecoder()
+        async with self.client.audio.speech.with_streaming_response.create(
+            model=self.tts_model,
+            voice=self.tts_voice,
+            speed=self.tts_speed,
+            input=text,
+            response_format="pcm"
+        ) as response:
+            async for chunk in response.iter_bytes():
+                samples = decoder.feed(chunk)
+                if len(samples):
+                    yield samples
+        if decoder.flush():
+            logger.warning("TTS response ended mid-sample, dropped the last byte")
+            
+    async def synthesize_speech(self, text: str) -> Optional[np.ndarray]:
         """
         Convert text to speech using OpenAI's TTS model.
         
@@ -149,65 +393,157 @@ class OpenAIVoiceHandler:
             numpy.ndarray: Audio data as a numpy array or None if synthesis failed
         """
         try:
-            # Generate speech using OpenAI's API
-            response = self.client.audio.speech.create(
-                model="tts-1",
-                voice="onyx",
-                input=text
-            )
+            cache_key = None
+            if self.tts_cache is not None:
+                cache_key = self.tts_cache.key(self.tts_model, self.tts_voice, self.tts_speed, text)
+                cached = self.tts_cache.get(cache_key)
+                if cached is not None:
+                    return cached
+                    
+            with METRICS.timer('tts', **self.metric_labels):
+                chunks = [chunk async for chunk in self.stream_speech(text)]
+            if not chunks:
+                logger.warning("TTS returned no audio for %d characters of text", len(text))
+                return None
+            audio_data = chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
             
-            # Save to temporary file and read as numpy array
-            with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as temp_mp3:
-                temp_mp3.write(response.content)
-                temp_mp3.flush()
-                
-                # Read the audio file
-                import soundfile as sf
-                audio_data, _ = sf.read(temp_mp3.name)
-                
-                # Convert to int16
-                audio_data = (audio_data * 32767).astype(np.int16)
-                
-                # Clean up temporary file
-                os.unlink(temp_mp3.name)
-                
-                return audio_data
+            if cache_key is not None:
+                self.tts_cache.put(cache_key, audio_data)
+            return audio_data
                 
         except Exception as e:
-            print(f"Error during speech synthesis: {e}")
+            logger.exception("Error during speech synthesis: %s", e)
             return None
             
-    async def process_audio(self, audio_data: np.ndarray, input_sample_rate: int = None) -> Dict[str, Any]:
+    def _cached_response(self, transcribed_text: str, history: Sequence[Turn] = ()) -> Optional[CachedResponse]:
+        """Return a stored answer to this question, if there is one and it opens a conversation"""
+        if self.response_cache is None or history:
+            return None
+        cached = self.response_cache.get(self.magistrate_info['name'], transcribed_text)
+        if cached is not None:
+            logger.info("Response cache hit", extra=self.metric_labels)
+            logger.debug("Response cache hit for: %s", transcribed_text)
+        return cached
+        
+    def _remember_response(self, transcribed_text: str, response_text: str, audio_data: np.ndarray,
+                           history: Sequence[Turn] = ()):
+        """Store an answer to an opening question so it can skip the LLM and TTS next time"""
+        if self.response_cache is not None and not history:
+            self.response_cache.put(self.magistrate_info['name'], transcribed_text, response_text, audio_data)
+            
+    async def stream_audio(self, audio_data: np.ndarray, input_sample_rate: int = None,
+                           history: Sequence[Turn] = ()) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Process audio like process_audio, but yield results as they become available.
+        
+        Args:
+            audio_data: numpy array containing the audio data
+            input_sample_rate: sample rate of the input audio (Hz)
+            history: Earlier turns of the conversation, oldest first
+            
+        Yields:
+            dict: A 'transcript' event, then one 'sentence' event per synthesized
+                sentence, then a 'done' event with the full text and audio.
+                An 'error' event ends the stream early.
+        """
+        transcribed_text = await self.transcribe_audio(audio_data, input_sample_rate)
+        if not transcribed_text:
+            yield {'type': 'error', 'error': 'Failed to transcribe audio'}
+            return
+            
+        yield {'type': 'transcript', 'text': transcribed_text}
+        
+        cached = self._cached_response(transcribed_text, history)
+        if cached is not None:
+            yield {'type': 'sentence', 'text': cached.response_text, 'audio_data': cached.audio_data}
+            yield {
+                'type': 'done',
+                'transcribed_text': transcribed_text,
+                'response_text': cached.response_text,
+                'audio_data': cached.audio_data
+            }
+            return
+            
+        sentences = []
+        chunks = []
+        try:
+            async for sentence, audio in self.pipeline_sentences(transcribed_text, history):
+                sentences.append(sentence)
+                chunks.append(audio)
+                yield {'type': 'sentence', 'text': sentence, 'audio_data': audio}
+        except Exception as e:
+            logger.exception("Error in streamed response: %s", e)
+            yield {'type': 'error', 'error': 'Failed to generate response'}
+            return
+            
+        if not chunks:
+            yield {'type': 'error', 'error': 'Failed to generate response'}
+            return
+            
+        response_text = " ".join(sentences)
+        audio_response = np.concatenate(chunks)
+        self._remember_response(transcribed_text, response_text, audio_response, history)
+        yield {
+            'type': 'done',
+            'transcribed_text': transcribed_text,
+            'response_text': response_text,
+            'audio_data': audio_response
+        }
+        
+    async def process_audio(self, audio_data: np.ndarray, input_sample_rate: int = None,
+                            history: Sequence[Turn] = ()) -> Dict[str, Any]:
         """
         Process audio through the complete pipeline: STT -> Response Generation -> TTS
         
         Args:
             audio_data: numpy array containing the audio data
             input_sample_rate: sample rate of the input audio (Hz)
+            history: Earlier turns of the conversation, oldest first
             
         Returns:
             dict: Dictionary containing the results and any audio data
         """
         try:
             # Transcribe audio
-            transcribed_text = self.transcribe_audio(audio_data, input_sample_rate)
+            transcribed_text = await self.transcribe_audio(audio_data, input_sample_rate)
             if not transcribed_text:
                 return {'error': 'Failed to transcribe audio'}
                 
-            print(f"Transcribed text: {transcribed_text}")
+            logger.debug("Transcribed text: %s", transcribed_text)
             
+            cached = self._cached_response(transcribed_text, history)
+            if cached is not None:
+                return {
+                    'transcribed_text': transcribed_text,
+                    'response_text': cached.response_text,
+                    'audio_data': cached.audio_data
+                }
+                
+            if self.pipelined:
+                response_text, audio_response = await self.generate_and_synthesize(transcribed_text, history)
+                if response_text is None:
+                    return {'error': 'Failed to generate response'}
+                    
+                self._remember_response(transcribed_text, response_text, audio_response, history)
+                return {
+                    'transcribed_text': transcribed_text,
+                    'response_text': response_text,
+                    'audio_data': audio_response
+                }
+                
             # Generate response
-            response_text = self.generate_response(transcribed_text)
+            response_text = await self.generate_response(transcribed_text, history)
             if not response_text:
                 return {'error': 'Failed to generate response'}
                 
-            print(f"Generated response: {response_text}")
+            logger.debug("Generated response: %s", response_text)
             
             # Synthesize speech
-            audio_response = self.synthesize_speech(response_text)
+            audio_response = await self.synthesize_speech(response_text)
             if audio_response is None:
                 return {'error': 'Failed to synthesize speech'}
                 
+            self._remember_response(transcribed_text, response_text, audio_response, history)
             return {
                 'transcribed_text': transcribed_text,
                 'response_text': response_text,
@@ -215,5 +551,5 @@ class OpenAIVoiceHandler:
             }
             
         except Exception as e:
-            print(f"Error in audio processing pipeline: {e}")
+            logger.exception("Error in audio processing pipeline: %s", e)
             return {'error': str(e)} 
\ No newline at end of file
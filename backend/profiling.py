@@ -0,0 +1,512 @@
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ('cpu', 'memory', 'both')
+# Upper bound on the requests one run samples, each is slowed down while profiled
+MAX_PROFILED_REQUESTS = 100
+# Seconds between stack samples
+DEFAULT_INTERVAL = 0.005
+# A run armed through the shared directory is not picked up by workers started later than this
+RUN_TTL = 3600
+
+# Name of the file that arms every worker sharing the profile directory
+REQUEST_FILE = 'profile_request.json'
+
+# The sampled request the current code is running for, also seen by
+# asyncio.to_thread workers and tasks on the shared event loop
+_current: contextvars.ContextVar[Optional['ProfiledRequest']] = contextvars.ContextVar('profiled_request', default=None)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    # co_qualname is new in Python 3.11; the image runs 3.10
+    return f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class _Scope:
+    """A stage being sampled: samples count when its anchor frame is on the thread's stack"""
+    __slots__ = ('profiled', 'label', 'thread_id', 'anchor', 'show_anchor')
+
+    def __init__(self, profiled: 'ProfiledRequest', label: str, anchor, show_anchor: bool = True):
+        self.profiled = profiled
+        self.label = label
+        self.thread_id = threading.get_ident()
+        self.anchor = anchor
+        self.show_anchor = show_anchor
+
+
+class _MemoryScope:
+    """Peak traced memory while a stage runs, relative to when it started"""
+    __slots__ = ('start', 'peak')
+
+    def __init__(self, start: int):
+        self.start = start
+        self.peak = start
+
+
+class ProfiledRequest:
+    """Stage timings, stack samples and allocation peaks of one sampled request"""
+
+    def __init__(self, profiler: 'Profiler', run: Dict[str, Any], endpoint: str):
+        self.profiler = profiler
+        self.run_state = run
+        self.endpoint = endpoint
+        self.cpu = run['mode'] in ('cpu', 'both')
+        self.memory = run['mode'] in ('memory', 'both')
+        self.started = time.perf_counter()
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self._memory_scope: Optional[_MemoryScope] = None
+        self.finished = False
+        # Views run in a copy of the request's context with this request marked current
+        self.context = contextvars.copy_context()
+        self.context.run(_current.set, self)
+
+    def stage_entry(self, stage: str) -> Dict[str, Any]:
+        entry = self.stages.get(stage)
+        if entry is None:
+            entry = self.stages[stage] = {'count': 0, 'seconds': 0.0, 'samples': 0, 'peak_bytes': None}
+        return entry
+
+    def add_stage(self, stage: str, seconds: float, peak_bytes: Optional[int]):
+        entry = self.stage_entry(stage)
+        entry['count'] += 1
+        entry['seconds'] += seconds
+        if peak_bytes is not None:
+            entry['peak_bytes'] = max(entry['peak_bytes'] or 0, peak_bytes)
+
+    def run(self, function, *args, **kwargs):
+        """Call a view as part of this request, sampling the calling thread"""
+        return self.context.run(self._call, function, args, kwargs)
+
+    def _call(self, function, args, kwargs):
+        scope = self.profiler._add_scope(self, 'request', sys._getframe(0), show_anchor=False)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self.profiler._remove_scope(scope)
+
+    def iterate(self, iterable, status: int = 200) -> 'ProfiledStream':
+        """
+        Consume a streamed response body as part of this request.
+
+        The request is finished once the body is exhausted or closed.
+        """
+        return ProfiledStream(self, iterable, status)
+
+
+class ProfiledStream:
+    """
+    A streamed response body consumed as part of a sampled request.
+
+    A class rather than a generator, since the WSGI server's close() on a
+    generator that never started would skip its finally block and leave
+    the request, and its run, unfinished.
+    """
+
+    def __init__(self, profiled: ProfiledRequest, iterable, status: int):
+        self._profiled = profiled
+        self._iterable = iterable
+        self._iterator = None
+        self._status = status
+
+    def __iter__(self):
+        self._iterator = iter(self._iterable)
+        return self
+
+    def __next__(self):
+        profiled = self._profiled
+        scope = profiled.profiler._add_scope(profiled, 'request', sys._getframe(0), show_anchor=False)
+        try:
+            return profiled.context.run(next, self._iterator)
+        except BaseException:
+            self.close()
+            raise
+        finally:
+            profiled.profiler._remove_scope(scope)
+
+    def close(self):
+        profiled = self._profiled
+        if profiled.finished:
+            return
+        try:
+            close = getattr(self._iterable, 'close', None)
+            if close is not None:
+                profiled.context.run(close)
+        finally:
+            profiled.profiler.finish_request(profiled, self._status)
+
+
+class Profiler:
+    """
+    Samples N voice requests on demand, without a restart.
+
+    CPU profiles come from a sampler thread that reads the stack of every
+    thread working for a sampled request, including the asyncio.to_thread
+    workers and the shared event loop, every interval seconds. Each sample
+    is attributed to the innermost pipeline stage it falls in (the stages
+    timed with METRICS.timer, or 'request' for the view itself), so the
+    collapsed stacks have the stage as their root frame. Coroutines awaiting
+    upstream APIs take no samples; the request thread waiting for them
+    shows up under 'request' as a wait.
+
+    Memory profiles use tracemalloc, started only while a run is armed, and
+    report the peak bytes allocated during each stage and the request as a
+    whole. tracemalloc is process wide, so the peaks of requests running
+    concurrently with a sampled one are included in its numbers.
+
+    When a directory is configured, arming a run reaches every worker
+    sharing it, and each worker writes its report there when done.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        """
+        Args:
+            directory: Directory shared by the workers for run requests and
+                reports, or None to profile only this process
+        """
+        self.directory = Path(directory) if directory else None
+        if self.directory:
+            self.directory.mkdir(parents=True, exist_ok=True)
+        self._run: Optional[Dict[str, Any]] = None
+        self._scopes: List[_Scope] = []
+        self._memory_scopes: List[_MemoryScope] = []
+        self._lock = threading.Lock()
+        self._last_poll = 0.0
+        self._request_mtime: Optional[float] = None
+
+    def arm(self, requests: int = 10, mode: str = 'both', interval: float = DEFAULT_INTERVAL) -> Dict[str, Any]:
+        """
+        Sample the next voice requests.
+
+        Args:
+            requests: Number of requests to sample in each worker
+            mode: 'cpu' for stack samples, 'memory' for allocation peaks, or 'both'
+            interval: Seconds between stack samples
+
+        Returns:
+            dict: The run that was started
+
+        Raises:
+            ValueError: If an argument is out of range
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"mode must be one of {', '.join(PROFILE_MODES)}")
+        if not 1 <= requests <= MAX_PROFILED_REQUESTS:
+            raise ValueError(f"requests must be between 1 and {MAX_PROFILED_REQUESTS}")
+        if not 0.001 <= interval <= 1:
+            raise ValueError("interval must be between 1 ms and 1 s")
+
+        spec = {'id': uuid.uuid4().hex[:12], 'mode': mode, 'requests': requests,
+                'interval': interval, 'created': time.time()}
+        if self.directory:
+            path = self.directory / REQUEST_FILE
+            tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+            tmp_path.write_text(json.dumps(spec))
+            os.replace(tmp_path, path)
+        self._start_run(spec)
+        return spec
+
+    def cancel(self):
+        """Stop sampling new requests; requests being sampled still finish their reports"""
+        if self.directory:
+            try:
+                (self.directory / REQUEST_FILE).unlink()
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            run = self._run
+            if run is not None:
+                run['remaining'] = 0
+        if run is not None:
+            self._maybe_complete(run)
+
+    def _start_run(self, spec: Dict[str, Any]):
+        with self._lock:
+            previous = self._run
+            if previous is not None and previous['id'] == spec['id']:
+                return
+            if previous is not None:
+                # Requests still sampled for the previous run report to it
+                previous['remaining'] = 0
+            run = self._run = {**spec, 'remaining': spec['requests'], 'active': 0, 'reports': [],
+                               'stacks': Counter(), 'finished': None}
+        if previous is not None:
+            self._maybe_complete(previous)
+        logger.info("Profiling the next %d requests (%s)", spec['requests'], spec['mode'],
+                    extra={'profile_id': spec['id']})
+        if spec['mode'] in ('memory', 'both') and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if spec['mode'] in ('cpu', 'both'):
+            threading.Thread(target=self._sample, args=(run,), name="profile-sampler", daemon=True).start()
+
+    def _poll_shared(self):
+        """Pick up a run armed through another worker, checking at most once a second"""
+        now = time.monotonic()
+        if not self.directory or now - self._last_poll < 1:
+            return
+        self._last_poll = now
+        path = self.directory / REQUEST_FILE
+        try:
+            mtime = path.stat().st_mtime
+            if mtime == self._request_mtime:
+                return
+            self._request_mtime = mtime
+            spec = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return  # Not armed, or being replaced
+        if time.time() - spec['created'] < RUN_TTL:
+            self._start_run(spec)
+
+    def begin_request(self, endpoint: str) -> Optional[ProfiledRequest]:
+        """
+        Start sampling a request if a run is armed.
+
+        Returns:
+            ProfiledRequest: The sampled request, or None if it is not sampled;
+                pass it to finish_request() once the response is complete
+        """
+        self._poll_shared()
+        if self._run is None or self._run['remaining'] <= 0:
+            return None
+        with self._lock:
+            run = self._run
+            if run is None or run['remaining'] <= 0:
+                return None
+            run['remaining'] -= 1
+            run['active'] += 1
+        profiled = ProfiledRequest(self, run, endpoint)
+        if profiled.memory:
+            profiled._memory_scope = self._memory_enter()
+        return profiled
+
+    def finish_request(self, profiled: ProfiledRequest, status: int):
+        """Add a sampled request to its run's report; later calls for the same request are ignored"""
+        with self._lock:
+            if profiled.finished:
+                return
+            profiled.finished = True
+        peak = self._memory_exit(profiled._memory_scope) if profiled._memory_scope else None
+        seconds = time.perf_counter() - profiled.started
+        profiled.add_stage('request', seconds, peak)
+        report = {
+            'endpoint': profiled.endpoint,
+            'status': status,
+            'seconds': round(seconds, 6),
+            'samples': profiled.samples,
+            'peak_bytes': peak,
+            'stages': profiled.stages,
+        }
+        run = profiled.run_state
+        with self._lock:
+            run['reports'].append(report)
+            run['stacks'].update(profiled.stacks)
+            run['active'] -= 1
+        self._maybe_complete(run)
+
+    def _maybe_complete(self, run: Dict[str, Any]):
+        """Finish a run once it has no requests left to sample and none in flight"""
+        with self._lock:
+            if run['finished'] or run['remaining'] > 0 or run['active'] > 0:
+                return
+            run['finished'] = time.time()
+            # A newer run, or a request still sampled for an older one, may need tracing
+            stop_tracing = self._run is run and not self._memory_scopes
+        if stop_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        logger.info("Profiled %d requests", len(run['reports']), extra={'profile_id': run['id']})
+        if self.directory:
+            try:
+                path = self.directory / f"profile_{run['id']}_{os.getpid()}.json"
+                path.write_text(json.dumps(self._report(run)))
+            except OSError as e:
+                logger.warning("Error writing profile report: %s", e)
+
+    @contextmanager
+    def stage(self, name: str, frame):
+        """
+        Attribute samples and allocations to a pipeline stage of the current request.
+
+        Args:
+            name: Stage name
+            frame: Frame of the function running the stage; stack samples
+                count for the stage while this frame is on the stack
+        """
+        profiled = _current.get()
+        if profiled is None:
+            yield
+            return
+        scope = self._add_scope(profiled, name, frame) if profiled.cpu else None
+        memory_scope = self._memory_enter() if profiled.memory else None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak = self._memory_exit(memory_scope) if memory_scope else None
+            if scope is not None:
+                self._remove_scope(scope)
+            profiled.add_stage(name, seconds, peak)
+
+    def _add_scope(self, profiled: ProfiledRequest, label: str, anchor, show_anchor: bool = True) -> Optional[_Scope]:
+        if not profiled.cpu:
+            return None
+        scope = _Scope(profiled, label, anchor, show_anchor)
+        with self._lock:
+            self._scopes.append(scope)
+        return scope
+
+    def _remove_scope(self, scope: Optional[_Scope]):
+        if scope is None:
+            return
+        with self._lock:
+            self._scopes.remove(scope)
+
+    def _fold_peak(self) -> int:
+        """Credit the peak since the last reset to every open memory scope and reset it"""
+        current, peak = tracemalloc.get_traced_memory()
+        for scope in self._memory_scopes:
+            scope.peak = max(scope.peak, peak)
+        tracemalloc.reset_peak()
+        return current
+
+    def _memory_enter(self) -> Optional[_MemoryScope]:
+        if not tracemalloc.is_tracing():
+            return None
+        with self._lock:
+            scope = _MemoryScope(self._fold_peak())
+            self._memory_scopes.append(scope)
+        return scope
+
+    def _memory_exit(self, scope: Optional[_MemoryScope]) -> Optional[int]:
+        if scope is None:
+            return None
+        with self._lock:
+            if tracemalloc.is_tracing():
+                self._fold_peak()
+            self._memory_scopes.remove(scope)
+        return scope.peak - scope.start
+
+    def _sample(self, run: Dict[str, Any]):
+        """Sampler thread: attribute each thread's stack to its innermost open stage"""
+        interval = run['interval']
+        while not run['finished']:
+            time.sleep(interval)
+            with self._lock:
+                scopes = list(self._scopes)
+            if not scopes:
+                continue
+            by_thread: Dict[int, Dict[int, _Scope]] = {}
+            for scope in scopes:
+                # Later scopes on the same frame are nested inside earlier ones
+                by_thread.setdefault(scope.thread_id, {})[id(scope.anchor)] = scope
+            frames = sys._current_frames()
+            for thread_id, anchors in by_thread.items():
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    stack.append(frame)
+                    scope = anchors.get(id(frame))
+                    if scope is not None and scope.anchor is frame:
+                        if not scope.show_anchor:
+                            stack.pop()
+                        labels = [scope.label] + [_frame_label(f) for f in reversed(stack)]
+                        profiled = scope.profiled
+                        profiled.samples += 1
+                        profiled.stacks[';'.join(labels)] += 1
+                        profiled.stage_entry(scope.label)['samples'] += 1
+                        break
+                    frame = frame.f_back
+            del frames
+
+    @staticmethod
+    def _report(run: Dict[str, Any]) -> Dict[str, Any]:
+        """A run's results as JSON-serializable data"""
+        return {
+            'id': run['id'],
+            'pid': os.getpid(),
+            'mode': run['mode'],
+            'interval': run['interval'],
+            'requested': run['requests'],
+            'remaining': run['remaining'],
+            'active': run['active'],
+            'finished': run['finished'],
+            'requests': list(run['reports']),
+            'stacks': dict(run['stacks']),
+        }
+
+    def _reports(self, run_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Reports of every worker for a run, with this process's taken live"""
+        with self._lock:
+            local = self._report(self._run) if self._run is not None else None
+        run_id = run_id or (local['id'] if local else None)
+        if run_id is None:
+            return []
+        reports = [local] if local and local['id'] == run_id else []
+        if self.directory:
+            own = f"profile_{run_id}_{os.getpid()}.json"
+            for path in self.directory.glob(f"profile_{run_id}_*.json"):
+                if path.name == own:
+                    continue
+                try:
+                    reports.append(json.loads(path.read_text()))
+                except (OSError, ValueError):
+                    continue
+        return reports
+
+    def status(self, run_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Summarize a run across workers.
+
+        Args:
+            run_id: Run to report on, by default this worker's latest
+
+        Returns:
+            dict: The workers' reports and a per-stage summary with
+                the total seconds, CPU samples (and their estimated CPU
+                seconds) and largest allocation peak of each stage
+        """
+        reports = self._reports(run_id)
+        stages: Dict[str, Dict[str, Any]] = {}
+        for report in reports:
+            for entry in report['requests']:
+                for stage, values in entry['stages'].items():
+                    summary = stages.setdefault(stage, {'count': 0, 'seconds': 0.0, 'samples': 0,
+                                                        'sampled_seconds': 0.0, 'peak_bytes': None})
+                    summary['count'] += values['count']
+                    summary['seconds'] += values['seconds']
+                    summary['samples'] += values['samples']
+                    summary['sampled_seconds'] += values['samples'] * report['interval']
+                    if values['peak_bytes'] is not None:
+                        summary['peak_bytes'] = max(summary['peak_bytes'] or 0, values['peak_bytes'])
+        return {
+            'worker': os.getpid(),
+            'id': reports[0]['id'] if reports else None,
+            'stages': stages,
+            'workers': [{key: value for key, value in report.items() if key != 'stacks'} for report in reports],
+        }
+
+    def collapsed_stacks(self, run_id: Optional[str] = None) -> str:
+        """Stack samples of all workers in the collapsed format flamegraph tools read"""
+        stacks: Counter = Counter()
+        for report in self._reports(run_id):
+            stacks.update(report['stacks'])
+        return ''.join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+
+
+# Shared by every module in the process; PROFILE_DIR (or METRICS_DIR) arms all workers at once
+PROFILER = Profiler(os.getenv('PROFILE_DIR') or os.getenv('METRICS_DIR') or None)
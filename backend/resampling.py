@@ -0,0 +1,206 @@
+from fractions import Fraction
+from functools import lru_cache
+from typing import NamedTuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Zero crossings of the windowed sinc on each side of its centre
+FILTER_ZERO_CROSSINGS = 16
+# Passband edge as a fraction of the output Nyquist frequency
+FILTER_ROLLOFF = 0.94
+FILTER_KAISER_BETA = 8.0
+
+# Below this many outputs per filter phase, gathering windows beats looping over phases
+MIN_OUTPUTS_PER_PHASE = 64
+
+# Rate pairs whose filter banks are built ahead of time (browser capture -> STT/TTS rates)
+COMMON_RATE_PAIRS = [(src, dst) for src in (44100, 48000) for dst in (24000, 16000)]
+
+
+class FilterBank(NamedTuple):
+    """Polyphase decomposition of a low-pass filter for up/down resampling"""
+    up: int
+    down: int
+    taps: np.ndarray  # (up, taps_per_phase), each row time-reversed
+    delay: int        # Filter centre, in upsampled samples
+
+
+def _ratio(src_rate: int, dst_rate: int):
+    ratio = Fraction(dst_rate, src_rate)
+    return ratio.numerator, ratio.denominator
+
+
+@lru_cache(maxsize=32)
+def filter_bank(up: int, down: int) -> FilterBank:
+    """
+    Design the Kaiser-windowed sinc filter for resampling by up/down and split it into phases.
+
+    Args:
+        up: Interpolation factor
+        down: Decimation factor
+
+    Returns:
+        FilterBank: Cached per (up, down)
+    """
+    max_factor = max(up, down)
+    half_length = FILTER_ZERO_CROSSINGS * max_factor
+    cutoff = FILTER_ROLLOFF / (2 * max_factor)
+
+    n = np.arange(2 * half_length + 1) - half_length
+    h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(len(n), FILTER_KAISER_BETA)
+    # Zero-stuffing by `up` divides the signal's gain by `up`, so the
+    # filter's DC gain makes up for it
+    h *= up / h.sum()
+
+    taps_per_phase = -(-len(h) // up)
+    padded = np.zeros(taps_per_phase * up)
+    padded[:len(h)] = h
+    # Row p holds h[p], h[p + up], h[p + 2*up], ... reversed so it lines up
+    # with a window of input samples in increasing time order
+    taps = padded.reshape(taps_per_phase, up).T[:, ::-1]
+    return FilterBank(up, down, np.ascontiguousarray(taps, dtype=np.float32), half_length)
+
+
+def precompute_common_filters():
+    """Build the filter banks for the rate pairs used on every request"""
+    for src_rate, dst_rate in COMMON_RATE_PAIRS:
+        filter_bank(*_ratio(src_rate, dst_rate))
+
+
+def _to_int16(samples: np.ndarray) -> np.ndarray:
+    """Round and saturate to the int16 range instead of wrapping around"""
+    return np.clip(np.rint(samples), -32768, 32767).astype(np.int16)
+
+
+class StreamingResampler:
+    """
+    Rational polyphase resampler for mono audio delivered in chunks.
+
+    Each output sample is the dot product of one filter phase with a window
+    of input samples, so the cost is proportional to the output length and
+    does not depend on how the input length factors, unlike an FFT resampler.
+    Feed chunks with process() and call flush() after the last one; the
+    concatenated outputs match resampling the whole signal at once, up to
+    one int16 step of floating-point rounding.
+    """
+
+    def __init__(self, src_rate: int, dst_rate: int):
+        """
+        Args:
+            src_rate: Input sample rate in Hz
+            dst_rate: Output sample rate in Hz
+        """
+        self.src_rate = src_rate
+        self.dst_rate = dst_rate
+        self.bank = filter_bank(*_ratio(src_rate, dst_rate))
+        self._window = self.bank.taps.shape[1]
+        self.reset()
+
+    def reset(self):
+        """Forget all input seen so far"""
+        # Input samples with absolute indices [_buffer_start, _buffer_start + len(_buffer)),
+        # starting with the zero history that precedes the first sample
+        self._buffer = np.zeros(self._window - 1, dtype=np.float32)
+        self._buffer_start = -(self._window - 1)
+        self._inputs = 0
+        self._outputs = 0
+
+    def _base(self, n):
+        """Index of the newest input sample output n depends on"""
+        return (n * self.bank.down + self.bank.delay) // self.bank.up
+
+    def _expected_outputs(self) -> int:
+        """Output length for all input so far: ceil(inputs * up / down)"""
+        return -(-self._inputs * self.bank.up // self.bank.down)
+
+    def _compute(self, end: int) -> np.ndarray:
+        """Compute outputs [_outputs, end) from the buffered input"""
+        bank = self.bank
+        count = end - self._outputs
+        windows = sliding_window_view(self._buffer, self._window)
+        if count < bank.up * MIN_OUTPUTS_PER_PHASE:
+            # Short chunk with many phases: gather each output's window and phase directly
+            t = np.arange(self._outputs, end, dtype=np.int64) * bank.down + bank.delay
+            rows = t // bank.up - (self._window - 1) - self._buffer_start
+            output = np.einsum('ij,ij->i', windows[rows], bank.taps[t % bank.up])
+        else:
+            output = np.empty(count, dtype=np.float32)
+            # Outputs n and n + up use the same phase and windows `down` inputs
+            # apart, so each phase is one strided matrix-vector product
+            for offset in range(bank.up):
+                t = (self._outputs + offset) * bank.down + bank.delay
+                first_row = t // bank.up - (self._window - 1) - self._buffer_start
+                phase_count = len(range(offset, count, bank.up))
+                rows = windows[first_row:first_row + (phase_count - 1) * bank.down + 1:bank.down]
+                output[offset::bank.up] = np.einsum('ij,j->i', rows, bank.taps[t % bank.up])
+        self._outputs = end
+
+        # Drop input that no future output can reach
+        keep_from = self._base(end) - (self._window - 1) - self._buffer_start
+        if keep_from > 0:
+            self._buffer = self._buffer[keep_from:]
+            self._buffer_start += keep_from
+
+        return _to_int16(output)
+
+    def process(self, chunk: np.ndarray) -> np.ndarray:
+        """
+        Resample the next chunk of input.
+
+        Args:
+            chunk: int16 (or float in int16 scale) mono samples
+
+        Returns:
+            numpy.ndarray: int16 output that is complete so far; outputs that
+                still depend on future input are held back until later calls
+        """
+        if len(chunk):
+            self._buffer = np.concatenate([self._buffer, np.asarray(chunk, dtype=np.float32)])
+            self._inputs += len(chunk)
+
+        last_input = self._buffer_start + len(self._buffer) - 1
+        bank = self.bank
+        # Largest n with _base(n) <= last_input
+        available = (last_input * bank.up + bank.up - 1 - bank.delay) // bank.down + 1
+        end = min(available, self._expected_outputs())
+        if end <= self._outputs:
+            return np.zeros(0, dtype=np.int16)
+        return self._compute(end)
+
+    def flush(self) -> np.ndarray:
+        """
+        Emit the outputs held back for lack of future input, then reset.
+
+        Returns:
+            numpy.ndarray: The final int16 output samples
+        """
+        end = self._expected_outputs()
+        output = np.zeros(0, dtype=np.int16)
+        if end > self._outputs:
+            last_input = self._buffer_start + len(self._buffer) - 1
+            padding = self._base(end - 1) - last_input
+            if padding > 0:
+                self._buffer = np.concatenate([self._buffer, np.zeros(padding, dtype=np.float32)])
+            output = self._compute(end)
+        self.reset()
+        return output
+
+
+def resample(audio_data: np.ndarray, src_rate: int, dst_rate: int) -> np.ndarray:
+    """
+    Resample a complete mono int16 signal.
+
+    Args:
+        audio_data: Input samples
+        src_rate: Input sample rate in Hz
+        dst_rate: Output sample rate in Hz
+
+    Returns:
+        numpy.ndarray: int16 samples at dst_rate, ceil(len * dst / src) long
+    """
+    if src_rate == dst_rate:
+        return audio_data
+    resampler = StreamingResampler(src_rate, dst_rate)
+    head = resampler.process(audio_data)
+    return np.concatenate([head, resampler.flush()])
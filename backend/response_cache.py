@@ -0,0 +1,100 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+NON_WORD = re.compile(r'[\W_]+')
+
+
+def normalize_transcript(text: str) -> str:
+    """
+    Fold a transcript so equivalent questions compare equal.
+
+    Case, accents, punctuation (including ¿ and ¡) and whitespace are folded:
+    "¿Quién sois?" and "quien sois" normalize to the same string.
+    """
+    decomposed = unicodedata.normalize('NFKD', text)
+    without_accents = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return NON_WORD.sub(' ', without_accents.casefold()).strip()
+
+
+class CachedResponse(NamedTuple):
+    """A stored answer to a question"""
+    response_text: str
+    audio_data: np.ndarray
+
+
+class ResponseCache:
+    """
+    Exact-match cache from (magistrate, normalized transcript) to the answer.
+
+    Entries expire after ttl seconds. Each holds the full reply audio (about
+    1 MB for a 20 s answer), so the least recently used entries are dropped
+    once the audio exceeds max_bytes, or once max_entries is reached.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl: float = 86400, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Args:
+            max_entries: Maximum number of stored answers
+            ttl: Seconds an answer stays valid
+            max_bytes: Budget for the stored reply audio
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, CachedResponse]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+    def get(self, magistrate: str, transcript: str) -> Optional[CachedResponse]:
+        """Look up the stored answer to a question, or None"""
+        key = (magistrate, normalize_transcript(transcript))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            expires, response = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                self._size -= response.audio_data.nbytes
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return response
+
+    def put(self, magistrate: str, transcript: str, response_text: str, audio_data: np.ndarray):
+        """Store the answer to a question"""
+        key = (magistrate, normalize_transcript(transcript))
+        if not key[1]:
+            return
+        audio_data = np.ascontiguousarray(audio_data, dtype=np.int16)
+        audio_data.flags.writeable = False
+        if audio_data.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= previous[1].audio_data.nbytes
+            self._entries[key] = (time.monotonic() + self.ttl, CachedResponse(response_text, audio_data))
+            self._size += audio_data.nbytes
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= evicted.audio_data.nbytes
+                self._stats['evictions'] += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit, miss and eviction counters, the number of stored answers and their audio bytes"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._size
+        return stats
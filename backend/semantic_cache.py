@@ -0,0 +1,183 @@
+import threading
+import zlib
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from response_cache import normalize_transcript
+
+# Words that frame a question without changing what is asked, accent-folded as by
+# normalize_transcript: articles, prepositions, conjunctions, forms of ser, estar
+# and haber, and courtesy phrases. Interrogatives (que, quien, cual, donde...) are
+# not stop words, since they decide what an answer is about.
+STOP_WORDS = frozenset('''
+    a al ante bajo con contra de del desde durante e en entre hacia hasta mediante para por segun sin
+    so sobre tras y o u ni pero sino mas tambien muy tan ya aun asi
+    el la lo los las un una uno unos unas este esta esto estos estas ese esa eso esos esas aquel
+    aquella aquello aquellos aquellas se me mi mis nos le les su sus
+    ser es son soy era eran fue fueron sido siendo sea estar estaba estaban estuvo haber ha han he
+    hay habia habian hubo
+    hola dime digame decidme cuentame contadme cuentenos puedes puede podeis podrias podria podriais
+    favor senor senora don dona gracias
+'''.split())
+
+# Ways of addressing the magistrate, folded to one token so "¿Quién sois?" and
+# "¿Quién era usted?" ask the same thing
+ADDRESS_WORDS = frozenset('''
+    tu tus ti te contigo usted ustedes vos vosotros vosotras os vuestro vuestra vuestros vuestras
+    merced eres eras sois erais fuiste fuisteis
+'''.split())
+ADDRESS_TOKEN = 'usted'
+
+
+def content_words(text: str) -> Tuple[str, ...]:
+    """The words of a question that bear on its meaning, in order, with forms of address folded"""
+    words = []
+    for word in normalize_transcript(text).split():
+        if word in ADDRESS_WORDS:
+            word = ADDRESS_TOKEN
+        elif word in STOP_WORDS:
+            continue
+        words.append(word)
+    return tuple(words)
+
+
+class SemanticMatch(NamedTuple):
+    """A stored question similar to the one being asked"""
+    score: float
+    question: str
+    answer: str
+
+
+class _MagistrateIndex:
+    """Fixed-capacity ring of question vectors and answers for one magistrate"""
+
+    def __init__(self, capacity: int, dim: int):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.questions: List[Optional[str]] = [None] * capacity
+        self.answers: List[Optional[str]] = [None] * capacity
+        self.count = 0
+        self.next_slot = 0
+
+
+class SemanticCache:
+    """
+    Near-duplicate question cache that runs entirely in process.
+
+    Questions are embedded by hashing their content-word n-grams (see
+    content_words) into a fixed size vector (the "hashing trick"), so no
+    embedding API is involved. A lookup is one matrix-vector product over the
+    magistrate's stored questions followed by a top-k selection.
+
+    Similarity alone is not enough to reuse an answer: questions that differ
+    in one content word ("...de Panamá?" and "...de Perú?") can still score
+    high. A match must also have the same set of content words, so only
+    rewordings that differ in stop words, word order or form of address hit.
+    """
+
+    def __init__(self, dim: int = 2048, capacity: int = 512, threshold: float = 0.85,
+                 ngram_sizes=(1, 2), top_k: int = 3):
+        """
+        Args:
+            dim: Length of the hashed vectors
+            capacity: Questions kept per magistrate; the oldest are overwritten
+            threshold: Minimum cosine similarity for a cached answer to be used
+            ngram_sizes: Content-word n-gram lengths to hash
+            top_k: Number of nearest questions considered per lookup
+        """
+        self.dim = dim
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ngram_sizes = tuple(ngram_sizes)
+        self.top_k = top_k
+        self._indexes: Dict[str, _MagistrateIndex] = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'insertions': 0}
+
+    def vectorize(self, text: str) -> np.ndarray:
+        """
+        Embed text as an L2-normalized vector of hashed content-word n-grams.
+
+        Args:
+            text: Question to embed
+
+        Returns:
+            numpy.ndarray: float32 vector of length dim
+        """
+        words = content_words(text)
+        hashes = np.fromiter(
+            (zlib.crc32(' '.join(words[i:i + n]).encode('utf-8'))
+             for n in self.ngram_sizes
+             for i in range(len(words) - n + 1)),
+            dtype=np.uint32
+        )
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if len(hashes) == 0:
+            return vector
+        # The top bit picks a sign so colliding n-grams tend to cancel out
+        signs = np.where(hashes >> 31, -1.0, 1.0).astype(np.float32)
+        np.add.at(vector, hashes % self.dim, signs)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def search(self, magistrate: str, text: str, k: Optional[int] = None) -> List[SemanticMatch]:
+        """
+        Find the stored questions most similar to text.
+
+        Args:
+            magistrate: Magistrate the question was asked to
+            text: Question to look up
+            k: Number of matches to return, defaults to top_k
+
+        Returns:
+            list: Matches ordered by decreasing similarity
+        """
+        k = k or self.top_k
+        query = self.vectorize(text)
+        with self._lock:
+            index = self._indexes.get(magistrate)
+            if index is None or index.count == 0:
+                return []
+            scores = index.vectors[:index.count] @ query
+            k = min(k, index.count)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [SemanticMatch(float(scores[i]), index.questions[i], index.answers[i]) for i in top]
+
+    def lookup(self, magistrate: str, text: str) -> Optional[SemanticMatch]:
+        """Return the closest stored answer that clears the similarity threshold and asks about the same content words"""
+        words = frozenset(content_words(text))
+        matches = self.search(magistrate, text)
+        with self._lock:
+            for match in matches:
+                if match.score < self.threshold:
+                    break
+                if frozenset(content_words(match.question)) == words:
+                    self._stats['hits'] += 1
+                    return match
+            self._stats['misses'] += 1
+            return None
+
+    def add(self, magistrate: str, question: str, answer: str):
+        """Store the answer to a question"""
+        vector = self.vectorize(question)
+        if not vector.any():
+            return
+        with self._lock:
+            index = self._indexes.get(magistrate)
+            if index is None:
+                index = self._indexes[magistrate] = _MagistrateIndex(self.capacity, self.dim)
+            slot = index.next_slot
+            index.vectors[slot] = vector
+            index.questions[slot] = question
+            index.answers[slot] = answer
+            index.next_slot = (slot + 1) % self.capacity
+            index.count = min(index.count + 1, self.capacity)
+            self._stats['insertions'] += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit and miss counters and the number of stored questions"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = sum(index.count for index in self._indexes.values())
+        return stats
@@ -0,0 +1,276 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Client-chosen ids: long enough not to be guessed, short enough to bound memory
+VALID_SESSION_ID = re.compile(r'^[A-Za-z0-9_-]{16,128}$')
+
+# Sweep the shared directory for expired sessions after this many turns
+DISK_SWEEP_EVERY = 64
+
+# Rough tokens per character for Spanish text, to budget history without a tokenizer
+CHARS_PER_TOKEN = 3.5
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate the number of model tokens in a piece of text"""
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+class Turn(NamedTuple):
+    """One question and the magistrate's answer"""
+    question: str
+    answer: str
+
+
+class Session:
+    """The conversation one client is having with one magistrate"""
+    __slots__ = ('turns', 'tokens', 'size', 'last_used')
+
+    def __init__(self):
+        self.turns: Tuple[Turn, ...] = ()
+        self.tokens = 0
+        self.size = 0
+        self.last_used = time.monotonic()
+
+
+def _turn_cost(turn: Turn) -> Tuple[int, int]:
+    """(estimated tokens, stored bytes) of a turn"""
+    return (estimate_tokens(turn.question) + estimate_tokens(turn.answer),
+            len(turn.question.encode('utf-8')) + len(turn.answer.encode('utf-8')))
+
+
+class SessionStore:
+    """
+    Conversation history keyed by (session id, magistrate).
+
+    History is kept in memory, or, when a directory is given, in one JSON
+    file per session in a directory shared by the gunicorn workers, so a
+    follow-up question finds its history whichever worker answers it.
+    Sessions expire ttl seconds after their last turn, and the least recently
+    used sessions are dropped once the stored text exceeds max_bytes.
+
+    History is capped at max_history_tokens. When a new turn pushes a session
+    over the cap, the oldest turns are dropped in one chunk, down to
+    trim_to of the cap, rather than one turn per request. The system prompt
+    plus history is then an unchanged prefix for the next several turns, which
+    is what the API's automatic prompt caching needs to reuse it.
+    """
+
+    def __init__(self, ttl: float = 1800, max_bytes: int = 16 * 1024 * 1024,
+                 max_history_tokens: int = 2000, trim_to: float = 0.5, directory: Optional[Path] = None):
+        """
+        Args:
+            ttl: Seconds of inactivity after which a session is forgotten
+            max_bytes: Budget for the text of all sessions
+            max_history_tokens: Estimated tokens of history sent with a turn
+            trim_to: Fraction of max_history_tokens kept when history is trimmed
+            directory: Directory shared by the workers, or None to keep
+                history in this process's memory
+        """
+        self.directory = Path(directory) if directory else None
+        if self.directory:
+            self.directory.mkdir(parents=True, exist_ok=True)
+        self._appends = 0
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_history_tokens = max_history_tokens
+        self.trim_to = trim_to
+        self._sessions: "OrderedDict[Tuple[str, str], Session]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {'turns': 0, 'trims': 0, 'expirations': 0, 'evictions': 0}
+
+    @staticmethod
+    def is_valid_id(session_id: Optional[str]) -> bool:
+        """Check that a client-supplied session id is usable"""
+        return bool(session_id and VALID_SESSION_ID.match(session_id))
+
+    def history(self, session_id: str, magistrate: str) -> Tuple[Turn, ...]:
+        """
+        Return the turns so far, oldest first.
+
+        Args:
+            session_id: Client session id
+            magistrate: Magistrate id the conversation is with
+
+        Returns:
+            tuple: The session's turns, empty for a new or expired session
+        """
+        if self.directory:
+            session = self._read(session_id, magistrate)
+            return session.turns if session is not None else ()
+        with self._lock:
+            self._expire()
+            session = self._sessions.get((session_id, magistrate))
+            return session.turns if session is not None else ()
+
+    def append(self, session_id: str, magistrate: str, question: str, answer: str):
+        """
+        Record a completed turn.
+
+        Args:
+            session_id: Client session id
+            magistrate: Magistrate id the conversation is with
+            question: The transcribed question
+            answer: The magistrate's answer
+        """
+        turn = Turn(question, answer)
+        tokens, size = _turn_cost(turn)
+        if self.directory:
+            self._append_disk(session_id, magistrate, turn, tokens, size)
+            return
+        key = (session_id, magistrate)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = self._sessions[key] = Session()
+            self._sessions.move_to_end(key)
+
+            session.turns += (turn,)
+            session.tokens += tokens
+            session.size += size
+            session.last_used = time.monotonic()
+            self._size += size
+            self._stats['turns'] += 1
+
+            if session.tokens > self.max_history_tokens:
+                before = session.size
+                self._trim(session)
+                self._size -= before - session.size
+            self._expire()
+            self._evict()
+
+    def _trim(self, session: Session):
+        """Drop the oldest turns until the session fits in trim_to of the token cap"""
+        target = self.max_history_tokens * self.trim_to
+        turns = list(session.turns)
+        while turns and session.tokens > target:
+            tokens, size = _turn_cost(turns.pop(0))
+            session.tokens -= tokens
+            session.size -= size
+        session.turns = tuple(turns)
+        self._stats['trims'] += 1
+
+    def _path(self, session_id: str, magistrate: str) -> Path:
+        key = hashlib.sha256(f"{session_id}\0{magistrate}".encode('utf-8')).hexdigest()
+        return self.directory / f"{key}.json"
+
+    def _read(self, session_id: str, magistrate: str) -> Optional[Session]:
+        """Load a session from the shared directory, or None if it is missing or expired"""
+        path = self._path(session_id, magistrate)
+        try:
+            if path.stat().st_mtime < time.time() - self.ttl:
+                return None
+            turns = json.loads(path.read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Error reading session %s: %s", path.name, e)
+            return None
+        session = Session()
+        session.turns = tuple(Turn(question, answer) for question, answer in turns)
+        for turn in session.turns:
+            tokens, size = _turn_cost(turn)
+            session.tokens += tokens
+            session.size += size
+        return session
+
+    def _append_disk(self, session_id: str, magistrate: str, turn: Turn, tokens: int, size: int):
+        # A client waits for each answer before asking again, so turns of one
+        # session do not race; if they did, the last writer would win
+        session = self._read(session_id, magistrate) or Session()
+        session.turns += (turn,)
+        session.tokens += tokens
+        session.size += size
+        with self._lock:
+            self._stats['turns'] += 1
+            if session.tokens > self.max_history_tokens:
+                self._trim(session)
+            self._appends += 1
+            sweep = self._appends % DISK_SWEEP_EVERY == 0
+
+        # Other workers may read the file at any time, so publish it atomically
+        path = self._path(session_id, magistrate)
+        tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        tmp_path.write_text(json.dumps([list(turn) for turn in session.turns], ensure_ascii=False), encoding='utf-8')
+        os.replace(tmp_path, path)
+        if sweep:
+            self._sweep_disk()
+
+    def _scan_disk(self) -> List[Tuple[float, int, str]]:
+        """(mtime, size, name) of every stored session, oldest first"""
+        files = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.json') or entry.name.startswith('.'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.name))
+        files.sort()
+        return files
+
+    def _sweep_disk(self):
+        """Delete expired sessions, then the least recently used until the directory fits max_bytes"""
+        files = self._scan_disk()
+        deadline = time.time() - self.ttl
+        total = sum(size for _, size, _ in files)
+        for mtime, size, name in files:
+            expired = mtime < deadline
+            if not expired and total <= self.max_bytes:
+                break
+            try:
+                os.unlink(self.directory / name)
+            except FileNotFoundError:
+                pass
+            total -= size
+            with self._lock:
+                self._stats['expirations' if expired else 'evictions'] += 1
+
+    def _expire(self):
+        """Forget sessions idle for longer than ttl (oldest are first in the dict)"""
+        deadline = time.monotonic() - self.ttl
+        while self._sessions:
+            key, session = next(iter(self._sessions.items()))
+            if session.last_used >= deadline:
+                break
+            del self._sessions[key]
+            self._size -= session.size
+            self._stats['expirations'] += 1
+
+    def _evict(self):
+        """Drop least recently used sessions until the store fits in max_bytes"""
+        while self._size > self.max_bytes and len(self._sessions) > 1:
+            _, session = self._sessions.popitem(last=False)
+            self._size -= session.size
+            self._stats['evictions'] += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Counters and current size, for monitoring"""
+        if self.directory:
+            files = self._scan_disk()
+            with self._lock:
+                return {**self._stats, 'sessions': len(files), 'bytes': sum(size for _, size, _ in files)}
+        with self._lock:
+            return {**self._stats, 'sessions': len(self._sessions), 'bytes': self._size}
+
+
+def history_messages(turns) -> List[Dict[str, str]]:
+    """Chat messages replaying earlier turns, oldest first"""
+    messages = []
+    for turn in turns:
+        messages.append({"role": "user", "content": turn.question})
+        messages.append({"role": "assistant", "content": turn.answer})
+    return messages
@@ -0,0 +1,98 @@
+import io
+import logging
+from typing import NamedTuple
+
+import numpy as np
+
+from audio_io import encode_wav
+from resampling import resample
+
+try:
+    import soundfile as sf
+except (ImportError, OSError):  # Optional, without it uploads are sent as WAV
+    sf = None
+
+logger = logging.getLogger(__name__)
+
+# Rate the transcription models work at internally, anything above it is wasted upload
+STT_SAMPLE_RATE = 16000
+
+# Upload format -> (filename, mimetype, soundfile format, soundfile subtype)
+UPLOAD_FORMATS = {
+    'wav': ('speech.wav', 'audio/wav', None, None),
+    'flac': ('speech.flac', 'audio/flac', 'FLAC', 'PCM_16'),
+    'opus': ('speech.ogg', 'audio/ogg', 'OGG', 'OPUS'),
+}
+
+
+class SttUpload(NamedTuple):
+    """An encoded question ready to pass as the `file` of a transcription request"""
+    filename: str
+    data: bytes
+    mimetype: str
+    sample_rate: int
+    format: str
+
+    def as_file(self):
+        """The (filename, bytes, mimetype) tuple the OpenAI client uploads"""
+        return (self.filename, self.data, self.mimetype)
+
+
+def to_mono(audio_data: np.ndarray) -> np.ndarray:
+    """Average the channels of (samples, channels) int16 audio; mono input is returned as is"""
+    if audio_data.ndim == 1:
+        return audio_data
+    if audio_data.shape[1] == 1:
+        return audio_data[:, 0]
+    return np.rint(audio_data.mean(axis=1)).astype(np.int16)
+
+
+def downsample_for_stt(audio_data: np.ndarray, sample_rate: int, target_rate: int = STT_SAMPLE_RATE):
+    """
+    Downmix to mono and resample down to the transcription rate.
+
+    Returns:
+        tuple: (mono int16 samples, sample rate); audio at or below
+            target_rate is not resampled
+    """
+    audio_data = to_mono(audio_data)
+    if sample_rate > target_rate:
+        return resample(audio_data, sample_rate, target_rate), target_rate
+    return audio_data, sample_rate
+
+
+def encode_upload(audio_data: np.ndarray, sample_rate: int, upload_format: str = 'flac',
+                  target_rate: int = STT_SAMPLE_RATE) -> SttUpload:
+    """
+    Downmix, downsample and compress a recorded question for transcription.
+
+    Args:
+        audio_data: int16 samples, mono or shaped (samples, channels)
+        sample_rate: Sample rate of audio_data in Hz
+        upload_format: 'wav', 'flac' (lossless) or 'opus'; falls back to WAV
+            if soundfile or the codec is unavailable
+        target_rate: Sample rate to upload at; audio is never upsampled to reach it
+
+    Returns:
+        SttUpload: The encoded upload
+    """
+    audio_data, sample_rate = downsample_for_stt(audio_data, sample_rate, target_rate)
+
+    if upload_format not in UPLOAD_FORMATS:
+        logger.warning("Unknown STT upload format '%s', using WAV", upload_format)
+        upload_format = 'wav'
+
+    filename, mimetype, sf_format, subtype = UPLOAD_FORMATS[upload_format]
+    if sf_format is not None:
+        if sf is None:
+            logger.debug("soundfile is not available, sending WAV instead of %s", upload_format)
+        else:
+            try:
+                buffer = io.BytesIO()
+                sf.write(buffer, audio_data, sample_rate, format=sf_format, subtype=subtype)
+                return SttUpload(filename, buffer.getvalue(), mimetype, sample_rate, upload_format)
+            except Exception as e:
+                logger.warning("Error encoding %s upload, sending WAV instead: %s", upload_format, e)
+
+    filename, mimetype, _, _ = UPLOAD_FORMATS['wav']
+    return SttUpload(filename, encode_wav(audio_data, sample_rate), mimetype, sample_rate, 'wav')
@@ -0,0 +1,46 @@
+"""Regression cases for SemanticCache: rewordings hit, questions about something else miss."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from semantic_cache import SemanticCache, content_words  # noqa: E402
+
+ANSWER = "Fui oidor de la Real Audiencia."
+
+
+@pytest.mark.parametrize('stored, asked', [
+    ("¿Cuál fue tu papel en la conquista de Panamá?", "¿Cuál fue tu papel en la conquista de Perú?"),
+    ("¿Por qué fundaste la Real Audiencia de Quito?", "¿Por qué dejaste la Real Audiencia de Quito?"),
+    ("¿Quién sois?", "¿Quién fue el rey?"),
+    ("¿Dónde naciste?", "¿Dónde moriste?"),
+])
+def test_different_question_misses(stored, asked):
+    cache = SemanticCache()
+    cache.add('Gaspar de Espinosa', stored, ANSWER)
+    assert cache.lookup('Gaspar de Espinosa', asked) is None
+
+
+@pytest.mark.parametrize('stored, asked', [
+    ("¿Quién sois?", "¿Quién era usted?"),
+    ("¿Quién sois?", "quien sois"),
+    ("¿Cuál fue vuestro papel en la conquista de Panamá?", "Dime, ¿cuál era tu papel en la conquista de Panamá?"),
+])
+def test_rewording_hits(stored, asked):
+    cache = SemanticCache()
+    cache.add('Gaspar de Espinosa', stored, ANSWER)
+    match = cache.lookup('Gaspar de Espinosa', asked)
+    assert match is not None and match.answer == ANSWER
+
+
+def test_other_magistrate_misses():
+    cache = SemanticCache()
+    cache.add('Gaspar de Espinosa', "¿Quién sois?", ANSWER)
+    assert cache.lookup('Vasco de Quiroga', "¿Quién sois?") is None
+
+
+def test_content_words_fold_address_and_drop_stop_words():
+    assert content_words("¿Quién era usted?") == content_words("¿Quién sois?") == ('quien', 'usted')
+    assert content_words("Hola, ¿y de la Audiencia?") == ('audiencia',)
@@ -0,0 +1,183 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+WHITESPACE = re.compile(r'\s+')
+
+# Prune the disk tier after this many writes
+DISK_PRUNE_EVERY = 64
+# Temp files younger than this may still be being written by another worker
+TEMP_FILE_GRACE_SECONDS = 60
+
+
+def normalize_tts_text(text: str) -> str:
+    """Normalize text so trivially different strings share a cache entry"""
+    return WHITESPACE.sub(' ', unicodedata.normalize('NFC', text)).strip()
+
+
+class TTSCache:
+    """
+    Cache of synthesized speech keyed by (model, voice, speed, normalized text).
+
+    Entries are int16 PCM arrays. The memory tier is an LRU bounded in bytes.
+    The optional disk tier stores raw PCM files in a shared directory, so
+    every gunicorn worker on the host benefits from a clip any of them has
+    synthesized.
+    """
+
+    def __init__(self, memory_bytes: int = 64 * 1024 * 1024, directory: Optional[Path] = None,
+                 disk_bytes: int = 512 * 1024 * 1024):
+        """
+        Args:
+            memory_bytes: Budget for the in-memory tier
+            directory: Directory for the disk tier, or None to disable it
+            disk_bytes: Budget for the disk tier
+        """
+        self.memory_bytes = memory_bytes
+        self.directory = Path(directory) if directory else None
+        if self.directory:
+            self.directory.mkdir(parents=True, exist_ok=True)
+        self.disk_bytes = disk_bytes
+
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._memory_size = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'disk_evictions': 0}
+
+    @staticmethod
+    def key(model: str, voice: str, speed: float, text: str) -> str:
+        """Build the cache key for a synthesis request"""
+        raw = f"{model}\0{voice}\0{speed:g}\0{normalize_tts_text(text)}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """
+        Look up synthesized audio.
+
+        Returns:
+            numpy.ndarray: Read-only int16 PCM, or None on a miss
+        """
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return audio
+
+        audio = self._read_disk(key)
+        with self._lock:
+            if audio is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['disk_hits'] += 1
+        self._remember(key, audio)
+        return audio
+
+    def put(self, key: str, audio: np.ndarray):
+        """Store synthesized audio in both tiers"""
+        audio = np.ascontiguousarray(audio, dtype=np.int16)
+        audio.flags.writeable = False
+        self._remember(key, audio)
+        if self.directory:
+            try:
+                self._write_disk(key, audio)
+            except OSError as e:
+                logger.warning("Error writing TTS cache entry: %s", e)
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit, miss and eviction counters plus current memory usage"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['hits'] = stats['memory_hits'] + stats['disk_hits']
+            stats['entries'] = len(self._memory)
+            stats['memory_bytes'] = self._memory_size
+        return stats
+
+    def _remember(self, key: str, audio: np.ndarray):
+        if audio.nbytes > self.memory_bytes:
+            return
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_size -= previous.nbytes
+            self._memory[key] = audio
+            self._memory_size += audio.nbytes
+            while self._memory_size > self.memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_size -= evicted.nbytes
+                self._stats['evictions'] += 1
+
+    def _disk_path(self, key: str) -> Path:
+        return self.directory / f"{key}.pcm"
+
+    def _read_disk(self, key: str) -> Optional[np.ndarray]:
+        if not self.directory:
+            return None
+        try:
+            audio = np.fromfile(self._disk_path(key), dtype='<i2')
+        except (FileNotFoundError, OSError):
+            return None
+        audio.flags.writeable = False
+        return audio
+
+    def _write_disk(self, key: str, audio: np.ndarray):
+        path = self._disk_path(key)
+        # Other workers may read the file at any time, so publish it atomically
+        tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        audio.astype('<i2', copy=False).tofile(tmp_path)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % DISK_PRUNE_EVERY == 0
+        if prune:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """
+        Delete the least recently written files until the disk tier fits its budget.
+
+        Temp files of in-flight writes are left alone; only ones older than
+        TEMP_FILE_GRACE_SECONDS, orphaned by a writer that died, are removed.
+        """
+        files = []
+        stale = time.time() - TEMP_FILE_GRACE_SECONDS
+        for entry in os.scandir(self.directory):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if entry.name.startswith('.') or entry.name.endswith('.tmp'):
+                if stat.st_mtime < stale:
+                    try:
+                        os.unlink(entry.path)
+                    except FileNotFoundError:
+                        pass
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.name))
+
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        for _, size, name in files:
+            if total <= self.disk_bytes:
+                break
+            try:
+                os.unlink(self.directory / name)
+            except FileNotFoundError:
+                pass
+            total -= size
+            with self._lock:
+                self._stats['disk_evictions'] += 1
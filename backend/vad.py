@@ -0,0 +1,94 @@
+from typing import NamedTuple
+
+import numpy as np
+
+# Analysis frame length
+FRAME_MS = 20
+# Silence kept around the detected speech so word onsets and tails are not clipped
+PADDING_MS = 200
+# Gaps shorter than this between speech frames count as speech (pauses between words)
+HANGOVER_MS = 300
+# Less speech than this and the turn is treated as empty
+MIN_SPEECH_MS = 250
+
+# A frame is speech when it is SPEECH_MARGIN_DB above the clip's noise floor,
+# with the threshold kept between these absolute levels (dB relative to full scale)
+SPEECH_MARGIN_DB = 12.0
+MIN_THRESHOLD_DBFS = -50.0
+MAX_THRESHOLD_DBFS = -35.0
+# Percentile of frame energies taken as the noise floor
+NOISE_PERCENTILE = 10
+
+
+class VadResult(NamedTuple):
+    """Outcome of voice activity detection on one utterance"""
+    audio: np.ndarray     # Trimmed (and possibly truncated) samples, a view of the input
+    has_speech: bool
+    speech_ratio: float   # Fraction of the input's frames that are speech
+    start: int            # Sample offsets of the kept audio in the input
+    end: int
+    truncated: bool       # Speech ran past the maximum utterance length
+    threshold_dbfs: float
+
+
+def frame_energies_dbfs(audio_data: np.ndarray, frame_length: int) -> np.ndarray:
+    """
+    RMS level of each frame in dB relative to int16 full scale.
+
+    Args:
+        audio_data: Mono int16 samples
+        frame_length: Samples per frame; a trailing partial frame is ignored
+
+    Returns:
+        numpy.ndarray: One level per complete frame
+    """
+    frames = audio_data[:len(audio_data) // frame_length * frame_length].reshape(-1, frame_length)
+    floats = frames.astype(np.float32)
+    power = np.einsum('ij,ij->i', floats, floats) / (frame_length * 32768.0 ** 2)
+    return 10 * np.log10(np.maximum(power, 1e-10))
+
+
+def detect_speech(audio_data: np.ndarray, sample_rate: int, max_seconds: float = 30.0) -> VadResult:
+    """
+    Find the speech in an utterance and trim the silence around it.
+
+    Args:
+        audio_data: Mono int16 samples
+        sample_rate: Sample rate in Hz
+        max_seconds: Longest utterance kept, counted from the start of speech
+
+    Returns:
+        VadResult: The trimmed audio and speech statistics
+    """
+    frame_length = max(1, sample_rate * FRAME_MS // 1000)
+    levels = frame_energies_dbfs(audio_data, frame_length)
+    if len(levels) == 0:
+        return VadResult(audio_data[:0], False, 0.0, 0, 0, False, MAX_THRESHOLD_DBFS)
+
+    noise_floor = float(np.percentile(levels, NOISE_PERCENTILE))
+    threshold = min(max(noise_floor + SPEECH_MARGIN_DB, MIN_THRESHOLD_DBFS), MAX_THRESHOLD_DBFS)
+    voiced = levels > threshold
+
+    # Bridge short pauses: a frame is speech if voiced frames lie within the hangover on both sides
+    hangover = max(1, HANGOVER_MS // FRAME_MS)
+    kernel = np.ones(hangover, dtype=np.int32)
+    before = np.convolve(voiced, kernel)[:len(voiced)] > 0
+    after = np.convolve(voiced[::-1], kernel)[:len(voiced)][::-1] > 0
+    speech = voiced | (before & after)
+
+    speech_frames = int(np.count_nonzero(speech))
+    speech_ratio = speech_frames / len(speech)
+    if int(np.count_nonzero(voiced)) * FRAME_MS < MIN_SPEECH_MS:
+        return VadResult(audio_data[:0], False, speech_ratio, 0, 0, False, threshold)
+
+    indices = np.flatnonzero(speech)
+    padding = PADDING_MS * sample_rate // 1000
+    start = max(0, int(indices[0]) * frame_length - padding)
+    end = min(len(audio_data), (int(indices[-1]) + 1) * frame_length + padding)
+
+    max_samples = int(max_seconds * sample_rate)
+    truncated = end - start > max_samples
+    if truncated:
+        end = start + max_samples
+
+    return VadResult(audio_data[start:end], True, speech_ratio, start, end, truncated, threshold)
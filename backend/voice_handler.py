@@ -1,4 +1,5 @@
 import asyncio
+import logging
 import numpy as np
 import sounddevice as sd
 import os
@@ -14,8 +15,11 @@ from agents.voice import (
     TTSModelSettings,
 )
 from magistrado_agentes import MagistrateVoiceAgent
+from audio_io import normalize_quiet
 from openai import OpenAI
 
+logger = logging.getLogger(__name__)
+
 # Initialize OpenAI client for direct transcription debugging
 client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
 
@@ -49,7 +53,7 @@ class VoiceMessageHandler:
                 "voice_language": "es"
             }
             
-        print(f"Creating voice handler for {magistrate_info['name']}")
+        logger.info("Creating voice handler for %s", magistrate_info['name'])
         self.voice_agent = MagistrateVoiceAgent(magistrate_info)
         
     async def process_voice_message(self, audio_data: np.ndarray) -> bytes:
@@ -78,47 +82,42 @@ class VoiceMessageHandler:
                             wf.writeframes(audio_data.tobytes())
                     
                     # Direct transcription for debugging
-                    print(f"DEBUG: Direct transcription of input audio")
+                    logger.debug("Direct transcription of input audio")
                     with open(wav_path, 'rb') as audio_file:
                         transcription = client.audio.transcriptions.create(
                             file=audio_file,
                             model="whisper-1",
                             language="es"
                         )
-                        print(f"DEBUG: Direct input transcription: '{transcription.text}'")
+                        logger.debug("Direct input transcription: '%s'", transcription.text)
                     
                     # Clean up
                     os.unlink(wav_path)
                 except Exception as e:
-                    print(f"DEBUG: Error during direct transcription: {e}")
+                    logger.debug("Error during direct transcription: %s", e)
             
             # Process the audio using the voice agent
-            print(f"Processing audio of length {len(audio_data) if audio_data is not None else 'None'}")
+            logger.debug("Processing audio of length %s", len(audio_data) if audio_data is not None else None)
             result = await self.voice_agent.process_audio(audio_data.tobytes())
             
             # Check for errors in the result
             if 'error' in result:
-                print(f"Error in voice processing: {result['error']}")
+                logger.warning("Error in voice processing: %s", result['error'])
                 return None
             
             # Get the audio data from the result
             if result['audio_data'] is not None:
-                # Validate audio quality
-                if np.abs(result['audio_data']).max() < 500:
-                    print("WARNING: Response audio has very low amplitude")
-                    # Normalize if very quiet but not silent
-                    if np.abs(result['audio_data']).max() > 0:
-                        scale_factor = min(32767 / np.abs(result['audio_data']).max() * 0.8, 5)
-                        result['audio_data'] = (result['audio_data'].astype(np.float32) * scale_factor).astype(np.int16)
-                        print(f"Audio normalized - new max amplitude: {np.abs(result['audio_data']).max()}")
-                
-                return result['audio_data'].tobytes()
+                # Normalize if very quiet but not silent
+                response_audio, gain = normalize_quiet(result['audio_data'], max_gain=5)
+                if gain != 1.0:
+                    logger.info("Response audio has very low amplitude, normalized with gain %.1f", gain)
+                return response_audio.tobytes()
             
-            print("No audio data in result")
+            logger.warning("No audio data in result")
             return None
             
         except Exception as e:
-            print(f"Error in voice message processing: {e}")
+            logger.exception("Error in voice message processing: %s", e)
             return None
 
     @staticmethod
@@ -137,4 +136,4 @@ class VoiceMessageHandler:
             try:
                 player.write(audio_data)
             except Exception as e:
-                print(f"Error playing audio: {e}") 
\ No newline at end of file
+                logger.warning("Error playing audio: %s", e) 
\ No newline at end of file
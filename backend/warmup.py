@@ -0,0 +1,91 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    """
+    Runs one-off startup work in the background and tracks readiness.
+
+    Each gunicorn worker runs its own warmup after it has been forked. A
+    failed step is retried up to `retries` more times with exponential
+    backoff. The worker reports ready once every step has finished and
+    every required step has succeeded; a failed optional step (e.g. image
+    variants) is recorded but does not keep the worker out of rotation.
+    Required steps that still fail are tried again every recheck_interval
+    seconds, so the worker joins once, say, the upstream API is reachable.
+    """
+
+    def __init__(self, retries: int = 3, retry_delay: float = 1.0, recheck_interval: float = 60.0):
+        """
+        Args:
+            retries: Extra attempts for a failed step
+            retry_delay: Seconds before the first retry, doubled for each next one
+            recheck_interval: Seconds between later rounds of retries of
+                failed required steps
+        """
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.recheck_interval = recheck_interval
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        self.clips: Dict[str, Any] = {}
+        self._ready = threading.Event()
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def start(self, steps: List[Tuple[str, Callable[[], Any], bool]]):
+        """
+        Run the given steps in order on a background thread.
+
+        Args:
+            steps: (name, callable, required) triples
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._ready.clear()
+            self.steps = {name: {'status': 'pending', 'required': required} for name, _, required in steps}
+
+        def run_step(name, step, required) -> bool:
+            started = time.perf_counter()
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    time.sleep(self.retry_delay * 2 ** (attempt - 1))
+                try:
+                    step()
+                    self.steps[name] = {'status': 'done', 'required': required}
+                    break
+                except Exception as e:
+                    logger.warning("Warmup step '%s' failed (attempt %d of %d): %s",
+                                   name, attempt + 1, self.retries + 1, e)
+                    self.steps[name] = {'status': 'failed', 'required': required, 'error': str(e)}
+            self.steps[name]['attempts'] = attempt + 1
+            self.steps[name]['seconds'] = round(time.perf_counter() - started, 3)
+            return self.steps[name]['status'] == 'done'
+
+        def run():
+            failed = [(name, step, required) for name, step, required in steps
+                      if not run_step(name, step, required) and required]
+            while failed:
+                logger.error("Warmup failed, not ready: %s", ', '.join(name for name, _, _ in failed))
+                time.sleep(self.recheck_interval)
+                failed = [entry for entry in failed if not run_step(*entry)]
+            self._ready.set()
+            logger.info("Warmup complete")
+
+        threading.Thread(target=run, name="warmup", daemon=True).start()
+
+    def status(self) -> Dict[str, Any]:
+        """Return readiness and per-step results"""
+        steps = dict(self.steps)
+        return {'ready': self.ready, 'pending': any(step['status'] == 'pending' for step in steps.values()),
+                'steps': steps}
@@ -16,6 +16,10 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({ magistrateName, talkingPo
   const mediaRecorderRef = useRef<MediaRecorder | null>(null);
   const messagesEndRef = useRef<HTMLDivElement>(null);
   const audioContextRef = useRef<AudioContext | null>(null);
+  // Conversation id issued by the server, so follow-up questions keep their context
+  const sessionIdRef = useRef<string | null>(null);
+  // AudioContext time at which the next streamed reply frame starts playing
+  const nextPlayTimeRef = useRef(0);
 
   // Auto-scroll to the bottom of the messages
   useEffect(() => {
@@ -163,19 +167,53 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({ magistrateName, talkingPo
     }
   };
 
+  // Compressed reply formats this browser can play, best first; the server
+  // uses the first one it can encode and falls back to WAV
+  const playableAudioFormats = (): string => {
+    const probe = document.createElement('audio');
+    const candidates: [string, string][] = [
+      ['webm', 'audio/webm; codecs="opus"'],
+      ['opus', 'audio/ogg; codecs="opus"'],
+      ['mp3', 'audio/mpeg'],
+    ];
+    return candidates
+      .filter(([, type]) => probe.canPlayType(type) !== '')
+      .map(([format]) => format)
+      .concat('wav')
+      .join(',');
+  };
+
   const MAX_RETRIES = 3;
   const RETRY_DELAY = 1000; // 1 second
+  // A busy server (429) says when to come back; give up after this many tries
+  const MAX_BUSY_RETRIES = 5;
+  const MAX_BUSY_DELAY = 30000;
 
-  const sendAudioWithRetry = async (formData: FormData, retryCount = 0): Promise<any> => {
+  // Seconds to wait from a 429's retryAfter field or Retry-After header
+  const retryAfterSeconds = async (response: Response): Promise<number> => {
+    try {
+      const body = await response.json();
+      if (typeof body.retryAfter === 'number') {
+        return body.retryAfter;
+      }
+    } catch {
+      // Not JSON, fall back to the header
+    }
+    const header = Number(response.headers.get('Retry-After'));
+    return Number.isFinite(header) && header > 0 ? header : 1;
+  };
+
+  // Opens the reply's event stream; only failures before the stream starts are retried
+  const sendAudioWithRetry = async (formData: FormData, retryCount = 0, busyCount = 0): Promise<Response> => {
     try {
         const controller = new AbortController();
         const timeoutId = setTimeout(() => controller.abort(), 60000); // Increase timeout to 60s
 
-        const response = await fetch(`${API_URL}/api/voice-chat`, {
+        const response = await fetch(`${API_URL}/api/voice-chat/stream`, {
             method: 'POST',
             body: formData,
             headers: {
-                'Accept': 'application/json',
+                'Accept': 'text/event-stream',
             },
             mode: 'cors',
             signal: controller.signal
@@ -184,19 +222,100 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({ magistrateName, talkingPo
         clearTimeout(timeoutId);
 
         if (!response.ok) {
-            throw new Error(`HTTP error! status: ${response.status}`);
+            const error: any = new Error(`HTTP error! status: ${response.status}`);
+            error.status = response.status;
+            if (response.status === 429) {
+                error.retryAfter = await retryAfterSeconds(response);
+            }
+            throw error;
         }
-        return await response.json();
+        return response;
 
     } catch (error: any) {
-        if (retryCount < MAX_RETRIES) {
+        if (error.status === 429 && busyCount < MAX_BUSY_RETRIES) {
+            // Spread the retries of a classroom burst so they do not all return at once
+            const delay = Math.min(error.retryAfter * 1000 * (1 + Math.random() * 0.5), MAX_BUSY_DELAY);
+            console.log(`Server busy, retrying in ${Math.round(delay)} ms`);
+            await new Promise(resolve => setTimeout(resolve, delay));
+            return sendAudioWithRetry(formData, retryCount, busyCount + 1);
+        }
+        // Other 4xx (e.g. 422 when no speech was detected) will not succeed on retry
+        const clientError = error.status >= 400 && error.status < 500;
+        if (!clientError && retryCount < MAX_RETRIES) {
             await new Promise(resolve => setTimeout(resolve, RETRY_DELAY * (retryCount + 1))); // Exponential backoff
-            return sendAudioWithRetry(formData, retryCount + 1);
+            return sendAudioWithRetry(formData, retryCount + 1, busyCount);
         }
         throw error;
     }
   };
 
+  // Play a base64 16-bit little-endian PCM frame right after the previous one
+  const playPcmFrame = async (base64Audio: string, sampleRate: number) => {
+    let audioContext = audioContextRef.current;
+    if (!audioContext || audioContext.state === 'closed') {
+      audioContext = new (window.AudioContext || (window as any).webkitAudioContext)();
+      audioContextRef.current = audioContext;
+    }
+    if (audioContext.state === 'suspended') {
+      await audioContext.resume();
+    }
+
+    const bytes = Uint8Array.from(atob(base64Audio), c => c.charCodeAt(0));
+    const samples = new Int16Array(bytes.buffer, 0, bytes.length >> 1);
+    const audioBuffer = audioContext.createBuffer(1, samples.length, sampleRate);
+    const channel = audioBuffer.getChannelData(0);
+    for (let i = 0; i < samples.length; i++) {
+      channel[i] = samples[i] / 0x8000;
+    }
+
+    const source = audioContext.createBufferSource();
+    source.buffer = audioBuffer;
+    source.connect(audioContext.destination);
+    const startAt = Math.max(audioContext.currentTime, nextPlayTimeRef.current);
+    source.start(startAt);
+    nextPlayTimeRef.current = startAt + audioBuffer.duration;
+  };
+
+  // Call onEvent with the name and parsed JSON data of each server-sent event
+  const readEventStream = async (response: Response, onEvent: (event: string, data: any) => Promise<void> | void) => {
+    if (!response.body) {
+      throw new Error('The response has no body to stream');
+    }
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    try {
+      for (;;) {
+        const { done, value } = await reader.read();
+        buffer += decoder.decode(value, { stream: !done });
+        let boundary: number;
+        while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+          const block = buffer.slice(0, boundary);
+          buffer = buffer.slice(boundary + 2);
+          let event = 'message';
+          const dataLines: string[] = [];
+          for (const line of block.split('\n')) {
+            if (line.startsWith('event:')) {
+              event = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+              dataLines.push(line.slice(5).trimStart());
+            }
+          }
+          if (dataLines.length) {
+            await onEvent(event, JSON.parse(dataLines.join('\n')));
+          }
+        }
+        if (done) {
+          return;
+        }
+      }
+    } catch (error) {
+      // Stop downloading a reply that will not be shown
+      reader.cancel().catch(() => undefined);
+      throw error;
+    }
+  };
+
   const toggleRecording = async () => {
     if (isRecording) {
       mediaRecorderRef.current?.stop();
@@ -272,48 +391,65 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({ magistrateName, talkingPo
             const formData = new FormData();
             formData.append('audio', audioBlob, 'recording.wav');
             formData.append('magistrate', magistrateName);
+            formData.append('format', playableAudioFormats());
+            if (sessionIdRef.current) {
+              formData.append('sessionId', sessionIdRef.current);
+            }
             
-            // Add these debug logs before the fetch call
-            console.log('Request URL:', `${API_URL}/api/voice-chat`);
+            console.log('Request URL:', `${API_URL}/api/voice-chat/stream`);
             console.log('FormData contents:', {
               audio: `Blob size: ${audioBlob.size}, type: ${audioBlob.type}`,
               magistrate: magistrateName
             });
             
-            const data = await sendAudioWithRetry(formData);
-            
-            if (data.error) {
-              console.warn(`Server warning: ${data.error}`);
-            }
-            
-            // Update the user message with the transcription if available
-            if (data.transcription) {
-              const updatedMessages = messages.map(msg => 
-                msg.id === userMessage.id 
-                  ? { ...msg, text: data.transcription } 
-                  : msg
-              );
-              setMessages(updatedMessages);
-            }
+            const response = await sendAudioWithRetry(formData);
             
-            // Add the magistrate's response
-            const magistrateMessage: Message = {
-              id: (Date.now() + 1).toString(),
-              text: data.text || "Respuesta del magistrado", // Use server text if available
-              sender: 'magistrate',
-              audioUrl: data.audioUrl,
+            // The reply is shown and played sentence by sentence as it is synthesized
+            const magistrateMessageId = (Date.now() + 1).toString();
+            let replyText = '';
+            const showReply = (text: string, audioUrl?: string) => {
+              setMessages(prev => {
+                const reply: Message = { id: magistrateMessageId, text, sender: 'magistrate', audioUrl };
+                return prev.some(msg => msg.id === magistrateMessageId)
+                  ? prev.map(msg => msg.id === magistrateMessageId ? reply : msg)
+                  : [...prev, reply];
+              });
             };
             
-            setMessages(prev => {
-              // Find and update the user message
-              const updatedPrev = prev.map(msg => 
-                msg.id === userMessage.id && data.transcription
-                  ? { ...msg, text: data.transcription }
-                  : msg
-              );
-              // Add the magistrate message
-              return [...updatedPrev, magistrateMessage];
+            let finished = false;
+            nextPlayTimeRef.current = 0;
+            // A failed turn arrives as an error event, since the status (200) was sent before it failed
+            await readEventStream(response, async (event, data) => {
+              if (event === 'transcript') {
+                if (data.sessionId) {
+                  sessionIdRef.current = data.sessionId;
+                }
+                if (data.text) {
+                  setMessages(prev => prev.map(msg =>
+                    msg.id === userMessage.id ? { ...msg, text: data.text } : msg
+                  ));
+                }
+              } else if (event === 'audio') {
+                if (data.text) {
+                  replyText = replyText ? `${replyText} ${data.text}` : data.text;
+                  showReply(replyText);
+                }
+                try {
+                  await playPcmFrame(data.audio, data.sampleRate);
+                } catch (error) {
+                  console.warn('Error playing streamed audio:', error);
+                }
+              } else if (event === 'done') {
+                finished = true;
+                // Keep the complete recording so the reply can be played again
+                showReply(data.responseText || replyText || "Respuesta del magistrado", data.audioUrl);
+              } else if (event === 'error') {
+                throw new Error(`Server error: ${data.error}`);
+              }
             });
+            if (!finished) {
+              throw new Error('The reply stream ended before it was complete');
+            }
             
           } catch (error) {
             console.error('Error processing voice message:', error);